@@ -0,0 +1,221 @@
+from flask import Blueprint, abort, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+USER_FIELDS = ("id", "name")
+MOVIE_FIELDS = ("id", "name", "year", "rating", "director")
+# years a movie can be released in
+MIN_YEAR, MAX_YEAR = 1870, 2100
+
+
+def _selected_fields(allowed_fields):
+    """
+    Read the field selection ?fields=id,name of the request
+    :param allowed_fields: tuple of the fields of the resource
+    :return: tuple of the selected fields, all of them when ?fields is missing
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return allowed_fields
+    selected = tuple(field.strip() for field in fields.split(',') if field.strip())
+    unknown = [field for field in selected if field not in allowed_fields]
+    if unknown:
+        abort(400, f"Unknown fields {', '.join(unknown)}, choose among {', '.join(allowed_fields)}")
+    return selected
+
+
+def _user_json(user, fields):
+    return {field: user[field] for field in fields}
+
+
+def _movie_json(movie, fields):
+    return {field: getattr(movie, field) for field in fields}
+
+
+def _json_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, "Expected a json object body")
+    return body
+
+
+def _movie_changes(body):
+    """
+    Read and check the fields of a movie update
+    :param body: json object of the request, e.g. {"year": 1995, "rating": 8.3}
+    :return: dict of the changed fields among name, year, rating and director
+    """
+    changes = {field: body[field] for field in MOVIE_FIELDS[1:] if field in body}
+    if 'name' in changes:
+        if not isinstance(changes['name'], str) or not changes['name'].strip():
+            abort(400, "name must be a non empty string")
+        changes['name'] = changes['name'].strip()
+    # bool is an int to python, not to the client
+    year, rating = changes.get('year'), changes.get('rating')
+    if year is not None and (isinstance(year, bool) or not isinstance(year, int) or not MIN_YEAR <= year <= MAX_YEAR):
+        abort(400, f"year must be null or an integer between {MIN_YEAR} and {MAX_YEAR}")
+    if rating is not None and (isinstance(rating, bool) or not isinstance(rating, (int, float))
+                               or not 0 <= rating <= 10):
+        abort(400, "rating must be null or a number between 0 and 10")
+    if changes.get('director') is not None and not isinstance(changes['director'], str):
+        abort(400, "director must be null or a string")
+    return changes
+
+
+def _int_list(body, key, max_batch_size):
+    values = body.get(key, [])
+    if not isinstance(values, list) or not all(isinstance(value, int) for value in values):
+        abort(400, f"{key} must be a list of integers")
+    if len(values) > max_batch_size:
+        abort(413, f"At most {max_batch_size} items per request")
+    return values
+
+
+def create_blueprint(data_manager, uncached_data_manager=None, page_size=50, max_page_size=500, max_batch_size=1000):
+    """
+    JSON api of the users, movies and favorites, mounted under /api/v1
+    :param data_manager: the DataManagerInterface of the app
+    :param uncached_data_manager: the DataManagerInterface behind the cache of data_manager, if any,
+    read by the writes that copy a row
+    :param page_size: INTEGER default number of items of a page
+    :param max_page_size: INTEGER maximum number of items of a page
+    :param max_batch_size: INTEGER maximum number of items of a batch request
+    :return: the flask Blueprint
+    """
+    api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+    if uncached_data_manager is None:
+        uncached_data_manager = data_manager
+
+    def page_args():
+        after_id = request.args.get('after', type=int)
+        before_id = request.args.get('before', type=int)
+        size = request.args.get('per_page', page_size, type=int)
+        return after_id, before_id, min(max(size, 1), max_page_size)
+
+    def existing_user(user_id):
+        user = data_manager.get_user_by_id(user_id)
+        if not user:
+            abort(404, f"User {user_id} not found")
+        return user
+
+    # the 404 handler of the app is specific to its code, it would win over a handler of all HTTPExceptions
+    @api.errorhandler(404)
+    @api.errorhandler(HTTPException)
+    def json_error(err):
+        return jsonify({"error": err.description, "status": err.code}), err.code
+
+    @api.get('/users')
+    def list_users():
+        fields = _selected_fields(USER_FIELDS)
+        users, next_cursor, prev_cursor = data_manager.get_users_page(*page_args())
+        return jsonify({"users": [_user_json(user, fields) for user in users],
+                        "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+
+    @api.post('/users')
+    def add_user():
+        name = _json_body().get('name')
+        if not isinstance(name, str) or not name.strip():
+            abort(400, "name must be a non empty string")
+        user_id = data_manager.add_user(name.strip())
+        if not user_id:
+            abort(409, f"The user name {name} is already taken")
+        return jsonify({"id": user_id, "name": name.strip()}), 201
+
+    @api.get('/users/<int:user_id>')
+    def get_user(user_id):
+        return jsonify(_user_json(existing_user(user_id), _selected_fields(USER_FIELDS)))
+
+    @api.delete('/users/<int:user_id>')
+    def delete_user(user_id):
+        if not data_manager.delete_user(user_id):
+            abort(404, f"User {user_id} not found")
+        return '', 204
+
+    @api.get('/users/<int:user_id>/favorites')
+    def list_favorites(user_id):
+        fields = _selected_fields(MOVIE_FIELDS)
+        with data_manager.unit_of_work():
+            existing_user(user_id)
+            movies, next_cursor, prev_cursor = data_manager.get_user_movies_page(user_id, *page_args())
+        return jsonify({"movies": [_movie_json(movie, fields) for movie in movies],
+                        "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+
+    @api.post('/users/<int:user_id>/favorites')
+    def add_favorites(user_id):
+        """
+        Add movies to the favorites of a user in one transaction.
+        Body: {"movie_ids": [1, 2], "movies": [{"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"}]},
+        the movies are added to the catalog first when they aren't in it yet
+        """
+        body = _json_body()
+        movie_ids = _int_list(body, 'movie_ids', max_batch_size)
+        new_movies = body.get('movies', [])
+        if not isinstance(new_movies, list) or not all(isinstance(movie, dict) and 'name' in movie
+                                                       for movie in new_movies):
+            abort(400, "movies must be a list of objects with a name")
+        new_movies = [_movie_changes(movie) for movie in new_movies]
+        if len(movie_ids) + len(new_movies) > max_batch_size:
+            abort(413, f"At most {max_batch_size} items per request")
+        added_ids, skipped_ids = [], []
+        with data_manager.unit_of_work(write=True):
+            existing_user(user_id)
+            for movie_id in movie_ids:
+                (added_ids if data_manager.add_movie_to_user_favorite(user_id, movie_id) else skipped_ids).append(movie_id)
+            for movie in new_movies:
+                movie_id = data_manager.add_movie_and_link_to_user(user_id, {movie['name']: {
+                    "year": movie.get('year'), "rating": movie.get('rating'), "director": movie.get('director')}})
+                if movie_id is None:
+                    abort(400, f"Can not add the movie {movie['name']}")
+                added_ids.append(movie_id)
+        return jsonify({"added": added_ids, "skipped": skipped_ids})
+
+    @api.delete('/users/<int:user_id>/favorites')
+    def delete_favorites(user_id):
+        """
+        Remove movies from the favorites of a user in one transaction. Body: {"movie_ids": [1, 2]},
+        the ids that were not in the favorites are returned as skipped
+        """
+        movie_ids = _int_list(_json_body(), 'movie_ids', max_batch_size)
+        deleted_ids, skipped_ids = [], []
+        with data_manager.unit_of_work(write=True):
+            existing_user(user_id)
+            for movie_id in movie_ids:
+                deleted = data_manager.delete_user_favorite_movie(user_id, movie_id)
+                (deleted_ids if deleted else skipped_ids).append(movie_id)
+        return jsonify({"deleted": deleted_ids, "skipped": skipped_ids})
+
+    @api.delete('/users/<int:user_id>/favorites/<int:movie_id>')
+    def delete_favorite(user_id, movie_id):
+        existing_user(user_id)
+        data_manager.delete_user_favorite_movie(user_id, movie_id)
+        return '', 204
+
+    @api.get('/movies')
+    def search_movies():
+        fields = _selected_fields(MOVIE_FIELDS)
+        page = max(request.args.get('page', 1, type=int), 1)
+        size = min(max(request.args.get('per_page', page_size, type=int), 1), max_page_size)
+        movies, next_page = data_manager.search_movies(request.args.get('q', ''), page, size)
+        return jsonify({"movies": [_movie_json(movie, fields) for movie in movies], "next_page": next_page})
+
+    @api.get('/movies/<int:movie_id>')
+    def get_movie(movie_id):
+        movie = data_manager.get_movie_by_id(movie_id)
+        if movie is None:
+            abort(404, f"Movie {movie_id} not found")
+        return jsonify(_movie_json(movie, _selected_fields(MOVIE_FIELDS)))
+
+    @api.patch('/movies/<int:movie_id>')
+    def update_movie(movie_id):
+        changes = _movie_changes(_json_body())
+        with data_manager.unit_of_work(write=True):
+            # the unchanged columns are written back as they are in the transaction, not as cached
+            movie = uncached_data_manager.get_movie_by_id(movie_id)
+            if movie is None:
+                abort(404, f"Movie {movie_id} not found")
+            updated = movie._replace(**changes)
+            if not data_manager.update_movie({updated.name: {"year": updated.year, "rating": updated.rating,
+                                                             "director": updated.director, "id": movie_id}}):
+                abort(409, "Can not update the movie: the name and director are taken")
+        return jsonify(_movie_json(data_manager.get_movie_by_id(movie_id), MOVIE_FIELDS))
+
+    return api
@@ -1,36 +1,424 @@
-from flask import Flask, render_template, request, url_for
+from flask import (Flask, Response, abort, current_app, jsonify, make_response, render_template, request,
+                   stream_with_context, url_for)
+from flask.cli import AppGroup
 from flask_cors import CORS
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
+import click
+import hashlib
+import logging
+import threading
+import weakref
 from werkzeug.utils import redirect
 from dotenv import load_dotenv
 import os
-import requests
-
-load_dotenv()
-OMDB_API_KEY = os.getenv('OMDB_API_KEY')
+import time
 
+from api import v1 as api_v1
+from datamanager.bulk_export import EXPORT_FORMATS, EXPORT_MIMETYPES, format_records
+from datamanager.bulk_import import IMPORT_KINDS, import_records, read_records
+from datamanager.cached_data_manager import CachedDataManager
+from datamanager.engine_profile import get_engine_profile
+from datamanager.records import parse_rating, parse_year
+from datamanager.sql_data_manager import SQLDataManager
 from datamanager.sqlite_data_manager import SQLiteDataManager
+from instrumentation import hooks as instrumentation_hooks
+from instrumentation.logging_config import configure_logging
+from instrumentation.metrics import REGISTRY, Registry
+from omdb.cache import OMDBCache
+from omdb.client import OMDBClient
+from omdb.enrichment_worker import EnrichmentWorker
+from utils.fragment_cache import FragmentCache
+
+logger = logging.getLogger(__name__)
+
+
+def load_config():
+    """
+    Read the settings of the app from the environment and the .env file, see the README for each of them
+    :return: dict of settings, by name
+    """
+    load_dotenv()
+    return {
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
+        'LOG_FORMAT': os.getenv('LOG_FORMAT', 'text'),
+        'OMDB_API_KEY': os.getenv('OMDB_API_KEY'),
+        'OMDB_BASE_URL': os.getenv('OMDB_BASE_URL', 'https://www.omdbapi.com/'),
+        'OMDB_CACHE_SIZE': int(os.getenv('OMDB_CACHE_SIZE', 1024)),
+        'OMDB_CACHE_TTL': int(os.getenv('OMDB_CACHE_TTL', 7 * 24 * 60 * 60)),
+        'OMDB_CACHE_NEGATIVE_TTL': int(os.getenv('OMDB_CACHE_NEGATIVE_TTL', 60 * 60)),
+        'OMDB_TIMEOUT': float(os.getenv('OMDB_TIMEOUT', 2.5)),
+        'OMDB_POOL_SIZE': int(os.getenv('OMDB_POOL_SIZE', 10)),
+        'OMDB_MAX_RETRIES': int(os.getenv('OMDB_MAX_RETRIES', 2)),
+        'OMDB_BACKOFF_FACTOR': float(os.getenv('OMDB_BACKOFF_FACTOR', 0.3)),
+        'PAGE_SIZE': int(os.getenv('PAGE_SIZE', 50)),
+        'MAX_PAGE_SIZE': int(os.getenv('MAX_PAGE_SIZE', 500)),
+        'API_MAX_BATCH_SIZE': int(os.getenv('API_MAX_BATCH_SIZE', 1000)),
+        'DATA_CACHE_SIZE': int(os.getenv('DATA_CACHE_SIZE', 1024)),
+        'DATA_CACHE_TTL': int(os.getenv('DATA_CACHE_TTL', 30)),
+        'OMDB_ASYNC': os.getenv('OMDB_ASYNC', 'false').lower() in ('1', 'true', 'yes'),
+        'OMDB_ASYNC_WORKERS': int(os.getenv('OMDB_ASYNC_WORKERS', 4)),
+        'OMDB_ASYNC_QUEUE_SIZE': int(os.getenv('OMDB_ASYNC_QUEUE_SIZE', 100)),
+        'DATABASE_URL': os.getenv('DATABASE_URL'),
+        'DATABASE_POOL_SIZE': int(os.getenv('DATABASE_POOL_SIZE', 10)),
+        'DATABASE_MAX_OVERFLOW': int(os.getenv('DATABASE_MAX_OVERFLOW', 20)),
+        'DATABASE_POOL_RECYCLE': int(os.getenv('DATABASE_POOL_RECYCLE', 1800)),
+        'DATABASE_REPLICA_URLS': [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url],
+        'SQLITE_DATABASE': os.getenv('SQLITE_DATABASE', './datamanager/movie_sql_db.sqlite'),
+        'SQLITE_READ_REPLICAS': [path for path in os.getenv('SQLITE_READ_REPLICAS', '').split(',') if path],
+        'SQLITE_READ_ONLY_POOL': os.getenv('SQLITE_READ_ONLY_POOL', 'false').lower() in ('1', 'true', 'yes'),
+        'READ_YOUR_WRITES_SECONDS': float(os.getenv('READ_YOUR_WRITES_SECONDS', 2)),
+        'STATIC_MAX_AGE': int(os.getenv('STATIC_MAX_AGE', 60 * 60)),
+        'RECOMMENDATION_NEIGHBORS': int(os.getenv('RECOMMENDATION_NEIGHBORS', 20)),
+        'RECOMMENDATIONS_SHOWN': int(os.getenv('RECOMMENDATIONS_SHOWN', 10)),
+        'STATS_LEADERBOARD_SIZE': int(os.getenv('STATS_LEADERBOARD_SIZE', 10)),
+        'FRAGMENT_CACHE_MB': float(os.getenv('FRAGMENT_CACHE_MB', 32)),
+        'TEMPLATE_CACHE_DIR': os.getenv('TEMPLATE_CACHE_DIR'),
+        'SQLITE_PROFILE': os.getenv('SQLITE_PROFILE', 'wal'),
+        'SQLITE_POOL_SIZE': os.getenv('SQLITE_POOL_SIZE'),
+        'SQLITE_BUSY_TIMEOUT_MS': os.getenv('SQLITE_BUSY_TIMEOUT_MS'),
+    }
+
+
+class Services:
+    """
+    The data manager, the OMDB client and cache and the enrichment worker of an app.
+    Each of them is built on its first use: making the app opens no database and no connection,
+    so a server can import it once and fork its workers cheaply.
+    A forked worker disposes of the connection pools inherited from its parent and opens its own.
+    """
+
+    def __init__(self, config):
+        """
+        :param config: dict of settings as returned by load_config
+        """
+        self.config = config
+        self.sqlite_profile = get_engine_profile(
+            config['SQLITE_PROFILE'],
+            pool_size=int(config['SQLITE_POOL_SIZE']) if config['SQLITE_POOL_SIZE'] else None,
+            busy_timeout_ms=int(config['SQLITE_BUSY_TIMEOUT_MS']) if config['SQLITE_BUSY_TIMEOUT_MS'] else None,
+        )
+        # rendered favorite lists, keyed by the favorites version of the user they were rendered from
+        self.fragment_cache = FragmentCache(max_bytes=int(config['FRAGMENT_CACHE_MB'] * 1024 * 1024))
+        self._components = {}
+        # reentrant: building the enrichment worker builds the data manager and the OMDB client
+        self._lock = threading.RLock()
+        _all_services.add(self)
+
+    def _get(self, name, build):
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    component = self._components[name] = build()
+        return component
+
+    def is_built(self, name):
+        return name in self._components
+
+    @property
+    def data_manager(self):
+        return self._get('data_manager', self._build_data_manager)
+
+    @property
+    def uncached_data_manager(self):
+        """
+        The data manager without its read-through cache, for the reads that are cached by version elsewhere
+        """
+        data_manager = self.data_manager
+        return data_manager.wrapped if isinstance(data_manager, CachedDataManager) else data_manager
+
+    @property
+    def omdb_cache(self):
+        return self._get('omdb_cache', lambda: OMDBCache(
+            self.config['SQLITE_DATABASE'], max_size=self.config['OMDB_CACHE_SIZE'],
+            ttl=self.config['OMDB_CACHE_TTL'], negative_ttl=self.config['OMDB_CACHE_NEGATIVE_TTL']))
+
+    @property
+    def omdb_client(self):
+        return self._get('omdb_client', lambda: OMDBClient(
+            self.config['OMDB_API_KEY'], cache=self.omdb_cache, base_url=self.config['OMDB_BASE_URL'],
+            timeout=self.config['OMDB_TIMEOUT'], pool_size=self.config['OMDB_POOL_SIZE'],
+            max_retries=self.config['OMDB_MAX_RETRIES'], backoff_factor=self.config['OMDB_BACKOFF_FACTOR']))
+
+    @property
+    def enrichment_worker(self):
+        return self._get('enrichment_worker', lambda: EnrichmentWorker(
+            self.omdb_client, self.data_manager, max_workers=self.config['OMDB_ASYNC_WORKERS'],
+            max_queue_size=self.config['OMDB_ASYNC_QUEUE_SIZE']))
+
+    def _build_data_manager(self):
+        config = self.config
+        # DATABASE_URL selects a server database (PostgreSQL, MySQL...), the sqlite file SQLITE_DATABASE otherwise.
+        # The OMDB cache always stays in the local sqlite file
+        if config['DATABASE_URL'] and not config['DATABASE_URL'].startswith('sqlite'):
+            data_manager = SQLDataManager(config['DATABASE_URL'], pool_size=config['DATABASE_POOL_SIZE'],
+                                          max_overflow=config['DATABASE_MAX_OVERFLOW'],
+                                          pool_recycle=config['DATABASE_POOL_RECYCLE'],
+                                          replica_urls=config['DATABASE_REPLICA_URLS'],
+                                          sticky_seconds=config['READ_YOUR_WRITES_SECONDS'],
+                                          recommendation_neighbors=config['RECOMMENDATION_NEIGHBORS'])
+        else:
+            data_manager = SQLiteDataManager(config['SQLITE_DATABASE'], profile=self.sqlite_profile,
+                                             replica_files=config['SQLITE_READ_REPLICAS'],
+                                             read_only_pool=config['SQLITE_READ_ONLY_POOL'],
+                                             sticky_seconds=config['READ_YOUR_WRITES_SECONDS'],
+                                             recommendation_neighbors=config['RECOMMENDATION_NEIGHBORS'])
+        for engine in [data_manager.engine] + data_manager.replica_router.replicas:
+            instrumentation_hooks.instrument_engine(engine)
+        # a DATA_CACHE_TTL of 0 turns the read-through cache off
+        if config['DATA_CACHE_TTL'] > 0:
+            data_manager = CachedDataManager(data_manager, max_size=config['DATA_CACHE_SIZE'],
+                                             ttl=config['DATA_CACHE_TTL'])
+        return data_manager
+
+    def _engines(self):
+        engines = []
+        if self.is_built('data_manager'):
+            data_manager = self._components['data_manager']
+            engines += [data_manager.engine] + data_manager.replica_router.replicas
+        if self.is_built('omdb_cache'):
+            engines.append(self._components['omdb_cache'].engine)
+        return engines
+
+    def after_fork(self):
+        # the pooled connections, the OMDB sessions and the worker threads belong to the parent process:
+        # leave its connections open for it, the child opens its own on first use
+        self._lock = threading.RLock()
+        for engine in self._engines():
+            engine.dispose(close=False)
+        self._components.pop('omdb_client', None)
+        self._components.pop('enrichment_worker', None)
+
+    def close(self):
+        """
+        Close the connections of the components built so far
+        """
+        for engine in self._engines():
+            engine.dispose()
+
+
+_all_services = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for services in list(_all_services):
+        services.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _services():
+    return current_app.extensions['moviweb']
+
+
+# the components of the app serving the current request or cli command
+data_manager = LocalProxy(lambda: _services().data_manager)
+uncached_data_manager = LocalProxy(lambda: _services().uncached_data_manager)
+omdb_cache = LocalProxy(lambda: _services().omdb_cache)
+omdb_client = LocalProxy(lambda: _services().omdb_client)
+enrichment_worker = LocalProxy(lambda: _services().enrichment_worker)
+fragment_cache = LocalProxy(lambda: _services().fragment_cache)
+
+# the views and cli commands of the app, create_app registers them on every app it makes
+_views = []
+cli = AppGroup('moviweb')
 
-app = Flask(__name__)
-CORS(app)
-data_manager = SQLiteDataManager('./datamanager/movie_sql_db.sqlite')
 
+def route(rule, **options):
+    def register(view):
+        _views.append((rule, options, view))
+        return view
+    return register
+
+
+def create_app(config=None):
+    """
+    Make the MovieWeb App, its data manager and OMDB client are built on first use
+    :param config: dict of settings overriding the ones of load_config, e.g. {"SQLITE_DATABASE": "test.sqlite"}
+    :return: the Flask app
+    """
+    config = dict(load_config(), **(config or {}))
+    configure_logging(config['LOG_LEVEL'], config['LOG_FORMAT'])
+    app = Flask(__name__)
+    app.config.update(config)
+    # Cache-Control max-age of the static files (style.css), they are revalidated with their ETag afterwards
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = config['STATIC_MAX_AGE']
+    # compiled templates are kept on disk, a new worker loads them instead of compiling every template again
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(config['TEMPLATE_CACHE_DIR'])
+    CORS(app)
+    instrumentation_hooks.init_app(app)
+    services = Services(config)
+    app.extensions['moviweb'] = services
+    for rule, options, view in _views:
+        app.add_url_rule(rule, view.__name__, view, **options)
+    app.before_request(restore_read_your_writes)
+    app.after_request(remember_read_your_writes)
+    app.register_error_handler(404, page_not_found)
+    for command in cli.commands.values():
+        app.cli.add_command(command)
+    app.register_blueprint(api_v1.create_blueprint(data_manager, uncached_data_manager, page_size=config['PAGE_SIZE'],
+                                                   max_page_size=config['MAX_PAGE_SIZE'],
+                                                   max_batch_size=config['API_MAX_BATCH_SIZE']))
+    # the request, database and OMDB metrics are the process' ones, the cache metrics are the app's own
+    app.extensions['moviweb_metrics'] = create_component_metrics(services)
+    return app
+
+
+def create_component_metrics(services):
+    """
+    Metrics of the caches and of the enrichment worker of an app,
+    read from the components built so far at every render: the metrics don't build the others
+    :param services: the Services of the app
+    :return: an instrumentation.metrics.Registry
+    """
+    registry = Registry()
+    cache_hits = registry.counter(
+        "moviweb_data_cache_hits_total", "Lookups answered by the read-through data cache", ("cache",))
+    cache_misses = registry.counter(
+        "moviweb_data_cache_misses_total", "Lookups not answered by the read-through data cache", ("cache",))
+    cache_size = registry.gauge("moviweb_data_cache_size", "Entries of the read-through data cache", ("cache",))
+    fragment_events = registry.counter(
+        "moviweb_fragment_cache_events_total", "Hits, misses and evictions of the rendered fragment cache", ("event",))
+    fragment_size = registry.gauge("moviweb_fragment_cache_size", "Entries and bytes of the rendered fragment cache",
+                                   ("unit",))
+    enrichment_jobs = registry.gauge("moviweb_enrichment_jobs", "OMDB enrichment jobs per state", ("state",))
+
+    def collect():
+        if services.is_built('data_manager') and isinstance(services.data_manager, CachedDataManager):
+            for cache_name, stats in services.data_manager.cache_stats().items():
+                cache_hits.set_total(stats['hits'], cache=cache_name)
+                cache_misses.set_total(stats['misses'], cache=cache_name)
+                cache_size.set(stats['size'], cache=cache_name)
+        stats = services.fragment_cache.stats()
+        for event_name in ('hits', 'misses', 'evictions'):
+            fragment_events.set_total(stats[event_name], event=event_name)
+        fragment_size.set(stats['size'], unit='entries')
+        fragment_size.set(stats['bytes'], unit='bytes')
+        if services.is_built('enrichment_worker'):
+            for state, value in services.enrichment_worker.status()["jobs"].items():
+                enrichment_jobs.set(value, state=state)
+
+    registry.add_collector(collect)
+    return registry
+
+
+def restore_read_your_writes():
+    # a client that just wrote keeps reading from the primary, whatever thread serves its next request
+    replica_router = data_manager.replica_router
+    if replica_router.replicas:
+        replica_router.pin_primary(request.cookies.get('primary_until', 0, type=float))
+
+
+def remember_read_your_writes(response):
+    if not _services().is_built('data_manager'):
+        return response
+    replica_router = data_manager.replica_router
+    primary_until = replica_router.primary_until()
+    if replica_router.replicas and primary_until > time.time():
+        response.set_cookie('primary_until', str(primary_until),
+                            max_age=int(current_app.config['READ_YOUR_WRITES_SECONDS']) + 1,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+def get_page_args(args=None, config=None):
+    """
+    Read the keyset pagination arguments ?after=<id>, ?before=<id> and ?per_page=<n> of the request
+    :param args: query arguments to read, defaults to the ones of the current Flask request
+    :param config: settings with the PAGE_SIZE and MAX_PAGE_SIZE, defaults to the ones of the current Flask app
+    :return: tuple (after_id, before_id, page_size)
+    """
+    args = request.args if args is None else args
+    config = current_app.config if config is None else config
+    after_id = args.get('after', type=int)
+    before_id = args.get('before', type=int)
+    page_size = args.get('per_page', config['PAGE_SIZE'], type=int)
+    return after_id, before_id, min(max(page_size, 1), config['MAX_PAGE_SIZE'])
+
+
+def page_etag(scope, number, full_path):
+    """
+    :param scope: name of the data shown by the page, e.g. "users" or "user-3"
+    :param number: version number of that data
+    :param full_path: path and query string of the page, the query string selects the page so it is part of the tag
+    :return: STRING entity tag of the page
+    """
+    return hashlib.sha1(f"{scope}:{number}:{full_path}".encode()).hexdigest()
+
+
+def conditional_page(scope, version):
+    """
+    HTTP validators of a page whose content only changes with the version of the data it shows
+    :param scope: name of the data shown by the page, e.g. "users" or "user-3"
+    :param version: tuple (version, changed_at) as returned by the version methods of the data manager
+    :return: a Response without body carrying the ETag, Last-Modified and Cache-Control of the page,
+    its status is 304 when the copy of the client is still current
+    """
+    number, changed_at = version
+    response = Response()
+    response.set_etag(page_etag(scope, number, request.full_path))
+    if changed_at:
+        response.last_modified = changed_at
+    # browsers keep the page but revalidate it on every view
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def with_validators(body, validators):
+    """
+    :param body: the rendered page
+    :param validators: Response returned by conditional_page
+    :return: the page response carrying the validators
+    """
+    response = make_response(body)
+    for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+        if header in validators.headers:
+            response.headers[header] = validators.headers[header]
+    return response
+
+
+def user_page_version(favorites_version, recommendations_version):
+    """
+    The user page shows the user's favorites and recommendations drawn from the favorites of every user.
+    It changes with the user's favorites and with a full build of the recommendations only: the favorites of
+    the other users move the recommendations a little at a time, they show the next time the page changes
+    :param favorites_version: tuple (version, changed_at) of the user's favorites, None if the user doesn't exist
+    :param recommendations_version: tuple (version, changed_at) of the last full build of the recommendations
+    :return: tuple (version, changed_at) of the page, None if the user doesn't exist
+    """
+    if not favorites_version:
+        return None
+    changed_at = max(favorites_version[1] or 0, recommendations_version[1] or 0) or None
+    return f"{favorites_version[0]}.{recommendations_version[0]}", changed_at
 
-@app.route('/')
+
+@route('/')
 def home():
     return render_template('index.html')
 
 
-@app.route('/users')
+@route('/users')
 def list_users():
     """
     This route will present a list of all users registered in our MovieWeb App.
     :return:
     """
-    users = data_manager.get_all_users()
-    return render_template('users.html', users=users)
+    # answer a repeated view from the version of the users table, before any query or rendering
+    validators = conditional_page('users', data_manager.get_users_version())
+    if validators.status_code == 304:
+        return validators
+    after_id, before_id, page_size = get_page_args()
+    users, next_cursor, prev_cursor = data_manager.get_users_page(after_id, before_id, page_size)
+    return with_validators(render_template('users.html', users=users, next_cursor=next_cursor,
+                                           prev_cursor=prev_cursor, per_page=page_size), validators)
 
 
-@app.route('/users/<int:user_id>')
+@route('/users/<int:user_id>')
 def get_user_movies(user_id):
     """
     This route will exhibit a specific user’s list of favorite movies.
@@ -39,12 +427,38 @@ def get_user_movies(user_id):
     :param user_id:
     :return:
     """
-    movies = data_manager.get_user_movies(user_id)
-    user = data_manager.get_user_by_id(user_id)
-    return render_template('user_movies.html', user=user, movies=movies)
+    # answer a repeated view from the versions of the user's favorites and of the recommendations,
+    # before any query or rendering
+    favorites_version = data_manager.get_user_favorites_version(user_id)
+    page_version = user_page_version(favorites_version, data_manager.get_recommendations_version())
+    validators = conditional_page(f'user-{user_id}', page_version) if page_version else None
+    if validators is not None and validators.status_code == 304:
+        return validators
+    after_id, before_id, page_size = get_page_args()
+    with data_manager.unit_of_work():
+        user = data_manager.get_user_by_id(user_id)
+
+        def render_movie_list():
+            # the fragment is kept under favorites_version: read the list from the database itself, never older
+            # than the version, rather than from a data cache that may predate it
+            movies, next_cursor, prev_cursor = uncached_data_manager.get_user_movies_page(user_id, after_id, before_id,
+                                                                                          page_size)
+            return render_template('user_movie_list.html', user=user, movies=movies, next_cursor=next_cursor,
+                                   prev_cursor=prev_cursor, per_page=page_size)
+
+        # the list is only queried and rendered again once the user's favorites changed
+        if favorites_version:
+            movie_list = fragment_cache.get_or_render((user_id, favorites_version[0], after_id, before_id, page_size),
+                                                      render_movie_list)
+        else:
+            movie_list = render_movie_list()
+        recommended_movies = data_manager.get_user_recommendations(user_id, current_app.config['RECOMMENDATIONS_SHOWN'])
+    body = render_template('user_movies.html', user=user, movie_list=Markup(movie_list),
+                           recommended_movies=recommended_movies)
+    return with_validators(body, validators) if validators is not None else body
 
 
-@app.route('/add_user', methods=['GET', 'POST'])
+@route('/add_user', methods=['GET', 'POST'])
 def add_user():
     """
     This route will present a form that enables the addition
@@ -55,7 +469,7 @@ def add_user():
         return render_template('add_user.html')
     if request.method == 'POST':
         new_user_name = request.form['username']
-        print("new_user_name: ", new_user_name)
+        logger.debug("Adding user", extra={"user_name": new_user_name})
         try:
             data_manager.add_user(new_user_name)
             return redirect(url_for('list_users'))
@@ -64,7 +478,7 @@ def add_user():
             return render_template('error_msg.html', error_msg=error_msg)
 
 
-@app.route('/users/<user_id>/add_movie', methods=['GET', 'POST'])
+@route('/users/<user_id>/add_movie', methods=['GET', 'POST'])
 def add_movie_to_user(user_id):
     """
     This route will display a form to add a new movie to a user’s list of favorite movies.
@@ -73,7 +487,7 @@ def add_movie_to_user(user_id):
     """
     if request.method == 'GET':
         user = data_manager.get_user_by_id(user_id)
-        return render_template("add_movie_to_user.html", user=user, existing_movie={})
+        return render_template("add_movie_to_user.html", user=user, existing_movie=None)
 
     if request.method == 'POST':
         user = data_manager.get_user_by_id(user_id)
@@ -83,67 +497,67 @@ def add_movie_to_user(user_id):
         rating = None
         # fetching movie details from OMDB database
 
+        # in async mode a title that isn't in the OMDB cache yet is accepted right away with pending details,
+        # the enrichment worker fills them in from OMDB in the background
+        if movie_name and current_app.config['OMDB_ASYNC'] and omdb_cache.get(movie_name) is None and not enrichment_worker.is_full():
+            pending_movie = {movie_name: {"year": None, "rating": None, "director": None}}
+            pending_movie_id = data_manager.add_movie_and_link_to_user(user_id, pending_movie)
+            if pending_movie_id is not None:
+                if enrichment_worker.submit(user_id, pending_movie_id, movie_name) is not None:
+                    return redirect(url_for('get_user_movies', user_id=user_id))
+                # the queue filled up meanwhile, drop the pending movie and look it up synchronously
+                enrichment_worker.drop_pending_movie(user_id, pending_movie_id)
+
         if movie_name:
-            url_get_movie_by_title_omdb = f"https://www.omdbapi.com/?apikey={OMDB_API_KEY}&t={movie_name}"
             try:
-                response = requests.get(url_get_movie_by_title_omdb, timeout=2.50)
+                response_json = omdb_client.get_movie_by_title(movie_name)
             except Exception as err:
                 error_msg = "Something went wrong when trying to connect to omdb database: " + str(err)
                 return render_template("error_msg.html", error_msg=error_msg),400
+            if "Director" not in response_json:
+                return render_template("error_msg.html", error_msg="Movie not found in OMDB database"), 404
             else:
-                response_json = response.json()
-                if "Director" not in response_json:
-                    return render_template("error_msg.html", error_msg="Movie not found in OMDB database"), 404
-                else:
-                    director_omdb = response_json['Director'].lower()
-                # if the input director matches the director from OMDB, get year and rating details
-                # from OMDB to complete the movie info
-
-                if director_omdb:
-                    year = response.json()['Year']
-                    rating = response.json()['imdbRating']
-                    print(movie_name, director_omdb, year, rating)
-                else:
-                    return render_template("error_msg.html",
-                                           error_msg="can not find the movie title from the given director in OMDB database"),404
+                director_omdb = response_json['Director'].lower()
+            # if the input director matches the director from OMDB, get year and rating details
+            # from OMDB to complete the movie info
+
+            if director_omdb:
+                year = parse_year(response_json.get('Year'))
+                rating = parse_rating(response_json.get('imdbRating'))
+                logger.debug("Movie found in OMDB", extra={"movie_name": movie_name, "director": director_omdb,
+                                                           "year": year, "rating": rating})
+            else:
+                return render_template("error_msg.html",
+                                       error_msg="can not find the movie title from the given director in OMDB database"),404
 
         # get the POST response from add_movie_to_user when
         # there is an existing title in the sqlite database with the same director
         # but with conflicting information (unmatched year or rating)
         use_existing_movie = request.form.get('use_existing_movie')
         existing_movie_id = request.form.get('movie_id')
-        if movie_name and year and rating and director_omdb:
+        if movie_name and director_omdb:
             input_movie = {
                 f"{movie_name}": {
-                    "year": f"{year}",
-                    "rating": f"{rating}",
-                    "director": f"{director_omdb}"
+                    "year": year,
+                    "rating": rating,
+                    "director": director_omdb
                 }
             }
-            # Check if the movie already existed in the sqlite database
-            is_movie, movie_info_dict = data_manager.is_movie_exist(input_movie)
-            print("movie_info_dict:", movie_info_dict)
-            print("is_movie:", is_movie)
-            # check if the movie exists in the database
-            if is_movie:
-                return render_template("add_movie_to_user.html", user=user, existing_movie=movie_info_dict),200
-            # if the movie doesn't exist and movie_info_dict is empty
-            elif not is_movie and not movie_info_dict:
-                # add the new movie into the database
-                data_manager.add_movie(input_movie)
-                # find the movie_id of the newly added movie from the database
-                movies = data_manager.get_all_movies()
-                input_movie_id = 0
-                # extract the movie information from the database
-                print("movies:", movies, type(movies))
-                for movie, details in movies.items():
-                    # if the user input movie_name and director match the movie's name and director from the database
-                    if movie_name == movie and director_omdb == details['director']:
-                        input_movie_id = details['id']
-                # check if input_movie_id receives a meaningful value from the extraction instead of the init value 0
-                if input_movie_id != 0:
-                    # add the movie_id to the user_favorite table in database
-                    data_manager.add_movie_to_user_favorite(user_id=user_id, movie_id=input_movie_id)
+            # the lookup and the insert share one transaction, no other writer can slip in between
+            with data_manager.unit_of_work(write=True):
+                # Check if the movie already existed in the sqlite database
+                is_movie, existing_movie = data_manager.is_movie_exist(input_movie)
+                logger.debug("Movie lookup in the database",
+                             extra={"is_movie": is_movie, "existing_movie_id": getattr(existing_movie, "id", None)})
+                # if the movie doesn't exist or exists with the same information,
+                # add the new movie into the database (or resolve the existing one)
+                # and link it to the user's favorites in one go
+                if is_movie is not None and existing_movie is None:
+                    data_manager.add_movie_and_link_to_user(user_id, input_movie)
+            # check if the movie exists in the database with conflicting information
+            if is_movie and existing_movie is not None:
+                return render_template("add_movie_to_user.html", user=user, existing_movie=existing_movie),200
+            elif is_movie is not None:
                 return redirect(url_for('get_user_movies', user_id=user_id))
         if use_existing_movie is not None:
             if use_existing_movie == "true":
@@ -155,7 +569,58 @@ def add_movie_to_user(user_id):
             return render_template("error_msg.html",
                             error_msg="Something when wrong while choosing whether or not to take the existing movie in the sqlite database to add to user's favorite list"),404
 
-@app.route('/users/<user_id>/update_movie/<movie_id>', methods=['GET', 'POST'])
+@route('/search')
+def search_movies():
+    """
+    This route searches the movies already in our catalog by name and director.
+    With ?user_id=<id> every result can be added to that user's favorites without going through OMDB.
+    :return:
+    """
+    query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('per_page', current_app.config['PAGE_SIZE'], type=int), 1),
+                    current_app.config['MAX_PAGE_SIZE'])
+    user_id = request.args.get('user_id', type=int)
+    with data_manager.unit_of_work():
+        user = data_manager.get_user_by_id(user_id) if user_id is not None else None
+        movies, next_page = data_manager.search_movies(query, page, page_size)
+    return render_template('search.html', query=query, movies=movies, user=user, page=page,
+                           next_page=next_page, per_page=page_size)
+
+
+@route('/stats')
+def stats():
+    """
+    This route shows the most favorited movies, the users with the most favorites and the favorites
+    by rating and by decade, read from the counters kept up to date with the favorites.
+    :return:
+    """
+    limit = min(max(request.args.get('limit', current_app.config['STATS_LEADERBOARD_SIZE'], type=int), 1),
+                current_app.config['MAX_PAGE_SIZE'])
+    return render_template('stats.html', stats=data_manager.get_stats(limit), limit=limit)
+
+
+@route('/metrics')
+def metrics():
+    """
+    This route exposes the request, database and OMDB timings in the Prometheus text format.
+    """
+    return Response(REGISTRY.render() + current_app.extensions['moviweb_metrics'].render(),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@route('/enrichment/status')
+def enrichment_status():
+    """
+    This route reports the state of the background OMDB enrichment worker as json.
+    """
+    # the worker only exists in async mode, reporting on it mustn't build it
+    if not current_app.config['OMDB_ASYNC']:
+        return jsonify({"enabled": False})
+    return jsonify(dict(enrichment_worker.status(), enabled=True))
+
+
+@route('/users/<user_id>/update_movie/<movie_id>', methods=['GET', 'POST'])
 def update_movie(user_id, movie_id):
     """
     This route will display a form allowing for
@@ -164,8 +629,9 @@ def update_movie(user_id, movie_id):
     :return:
     """
     if request.method == "GET":
-        movie = data_manager.get_movie_by_id(movie_id)
-        user = data_manager.get_user_by_id(user_id)
+        with data_manager.unit_of_work():
+            movie = data_manager.get_movie_by_id(movie_id)
+            user = data_manager.get_user_by_id(user_id)
         return render_template("update_movie.html", movie=movie, user=user)
 
     if request.method == "POST":
@@ -189,7 +655,7 @@ def update_movie(user_id, movie_id):
             return render_template('error_msg.html',
                                    error_msg="Can not update movie because the required data was not complete")
 
-@app.route('/users/<int:user_id>/delete_movie/<int:movie_id>')
+@route('/users/<int:user_id>/delete_movie/<int:movie_id>')
 def delete_movie(user_id, movie_id):
     """
     Upon visiting this route,
@@ -203,9 +669,135 @@ def delete_movie(user_id, movie_id):
     data_manager.delete_user_favorite_movie(user_id, movie_id)
     return redirect(url_for('get_user_movies', user_id=user_id))
 
-@app.errorhandler(404)
+@cli.command('wal-checkpoint')
+@click.option('--mode', default='PASSIVE', type=click.Choice(['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE']))
+def wal_checkpoint(mode):
+    """
+    Copy the sqlite write-ahead log back into the database file.
+    """
+    if not hasattr(data_manager, 'checkpoint'):
+        raise click.ClickException("wal-checkpoint only applies to the sqlite database")
+    busy, log_frames, checkpointed_frames = data_manager.checkpoint(mode)
+    click.echo(f"busy: {busy}, log frames: {log_frames}, checkpointed frames: {checkpointed_frames}")
+
+
+@cli.command('build-recommendations')
+def build_recommendations():
+    """
+    Count the neighbours of every movie again over all the favorites.
+    """
+    started_at = time.perf_counter()
+    pairs = data_manager.rebuild_recommendations()
+    click.echo(f"Stored {pairs} movie neighbours in {time.perf_counter() - started_at:.2f}s")
+
+
+@cli.command('rebuild-stats')
+def rebuild_stats():
+    """
+    Count the favorites per movie, per user, per rating and per decade again from scratch.
+    """
+    started_at = time.perf_counter()
+    counted = data_manager.rebuild_stats()
+    click.echo(f"Counted the favorites of {counted['movies']} movies and {counted['users']} users "
+               f"in {counted['buckets']} histogram buckets in {time.perf_counter() - started_at:.2f}s")
+
+
+@cli.command('gc-movies')
+@click.option('--batch-size', default=500, show_default=True, help='Movies deleted per transaction.')
+@click.option('--pause', default=0.05, show_default=True, help='Seconds between two transactions.')
+def gc_movies(batch_size, pause):
+    """
+    Delete the movies that are in no user's favorites anymore.
+    """
+    started_at = time.perf_counter()
+    deleted = data_manager.delete_orphan_movies(batch_size, pause)
+    click.echo(f"Deleted {deleted} movies in no user's favorites in {time.perf_counter() - started_at:.2f}s")
+
+
+@cli.command('import-data')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format, guessed from the file extension by default.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per transaction.')
+@click.option('--enrich', is_flag=True, help='Fill missing year, rating and director of movies from OMDB.')
+@click.option('--omdb-rate', default=5.0, show_default=True, help='Maximum OMDB requests per second.')
+@click.option('--omdb-workers', default=4, show_default=True, help='Maximum concurrent OMDB requests.')
+def import_data(kind, path, file_format, chunk_size, enrich, omdb_rate, omdb_workers):
+    """
+    Bulk import users, movies or favorites from a CSV or JSON lines file.
+    """
+    def report(stats):
+        click.echo(f"{stats['rows']} rows, {stats['added']} added, {stats['skipped']} skipped, "
+                   f"{stats['invalid']} invalid, {stats['rows_per_sec']:.0f} rows/sec")
+
+    # the OMDB lookups run in threads of their own, outside of the app context the proxies need
+    services = _services()
+    stats = import_records(services.data_manager, kind, read_records(path, file_format), chunk_size=chunk_size,
+                           omdb_client=services.omdb_client if enrich else None, omdb_rate=omdb_rate,
+                           omdb_workers=omdb_workers, progress=report)
+    click.echo(f"Imported {stats['added']} {kind} in {stats['seconds']:.2f}s "
+               f"({stats['rows_per_sec']:.0f} rows/sec, {stats['enriched']} enriched from OMDB)")
+    # bulk imported favorites don't update the neighbours one by one, count them all again
+    if kind == 'favorites' and stats['added']:
+        click.echo(f"Stored {data_manager.rebuild_recommendations()} movie neighbours")
+
+
+def export_response(records, file_format, file_name):
+    """
+    Stream movie records as a downloadable file, rows are read and serialized while the response is sent
+    :return: a streamed flask Response
+    """
+    if file_format not in EXPORT_FORMATS:
+        abort(404)
+    return Response(stream_with_context(format_records(records, file_format)),
+                    mimetype=EXPORT_MIMETYPES[file_format],
+                    headers={"Content-Disposition": f"attachment; filename={file_name}.{file_format}"})
+
+
+@route('/movies/export.<file_format>')
+def export_movies(file_format):
+    """
+    This route streams the whole movie catalog as csv, jsonl or ndjson.
+    :param file_format: csv, jsonl or ndjson
+    """
+    return export_response(data_manager.stream_all_movies(), file_format, "movies")
+
+
+@route('/users/<int:user_id>/export.<file_format>')
+def export_user_movies(user_id, file_format):
+    """
+    This route streams a user's list of favorite movies as csv, jsonl or ndjson.
+    :param user_id: INTEGER
+    :param file_format: csv, jsonl or ndjson
+    """
+    if not data_manager.get_user_by_id(user_id):
+        abort(404)
+    return export_response(data_manager.stream_user_movies(user_id), file_format, f"user_{user_id}_movies")
+
+
+@cli.command('export-data')
+@click.argument('kind', type=click.Choice(['movies', 'favorites']))
+@click.option('--user-id', type=int, help='User whose favorites are exported (required for favorites).')
+@click.option('--format', 'file_format', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Output file, stdout by default.')
+def export_data(kind, user_id, file_format, output):
+    """
+    Stream the movie catalog or a user's favorites to a CSV or JSON lines file.
+    """
+    if kind == 'favorites':
+        if user_id is None:
+            raise click.UsageError("--user-id is required to export favorites")
+        records = data_manager.stream_user_movies(user_id)
+    else:
+        records = data_manager.stream_all_movies()
+    for chunk in format_records(records, file_format):
+        output.write(chunk)
+
+
 def page_not_found(e):
     return render_template('404.html'), 404
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,68 @@
+import random
+
+from benchmarks.stats import measure
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+
+def run_data_manager_benchmarks(db_path, sizes, iterations=200, seed=7):
+    """
+    Micro-benchmark every SQLiteDataManager method against a seeded database.
+    Write benchmarks modify the database, run them on a copy of the seeded file.
+    :param db_path: path of a database seeded by benchmarks.seed.seed_database
+    :param sizes: dict returned by seed_database with the number of users and movies
+    :param iterations: INTEGER timed runs of the cheap methods, full table methods run fewer times
+    :return: list of result dicts as returned by benchmarks.stats.measure
+    """
+    rng = random.Random(seed)
+    data_manager = SQLiteDataManager(db_path)
+    users, movies = sizes["users"], sizes["movies"]
+    full_scan_iterations = max(iterations // 50, 3)
+    random_user = lambda: rng.randint(1, users)
+    random_movie = lambda: rng.randint(1, movies)
+    added_movie_ids = []
+
+    def existing_movie():
+        movie = data_manager.get_movie_by_id(random_movie())
+        return {movie.name: {"year": movie.year, "rating": movie.rating, "director": movie.director}}
+
+    def add_movie_and_link(number):
+        movie_id = data_manager.add_movie_and_link_to_user(
+            random_user(), {f"bench movie {number}": {"year": 2001, "rating": 7.5, "director": "bench"}})
+        added_movie_ids.append(movie_id)
+
+    benchmarks = [
+        ("get_user_by_id", lambda n: data_manager.get_user_by_id(random_user()), iterations),
+        ("get_movie_by_id", lambda n: data_manager.get_movie_by_id(random_movie()), iterations),
+        ("get_users_page", lambda n: data_manager.get_users_page(after_id=random_user(), page_size=50), iterations),
+        ("get_user_movies", lambda n: data_manager.get_user_movies(random_user()), iterations),
+        ("get_user_movies_page", lambda n: data_manager.get_user_movies_page(random_user(), page_size=50), iterations),
+        ("is_movie_exist", lambda n: data_manager.is_movie_exist(existing_movie()), iterations),
+        ("search_movies", lambda n: data_manager.search_movies(rng.choice(("dark night", "sta", "king 1", "dream"))),
+         iterations),
+        ("stream_user_movies", lambda n: list(data_manager.stream_user_movies(random_user())), iterations),
+        ("get_all_users", lambda n: data_manager.get_all_users(), full_scan_iterations),
+        ("get_all_movies", lambda n: data_manager.get_all_movies(), full_scan_iterations),
+        ("stream_all_movies", lambda n: sum(1 for _ in data_manager.stream_all_movies()), full_scan_iterations),
+        ("add_user", lambda n: data_manager.add_user(f"bench user {n}"), iterations),
+        ("add_movie", lambda n: data_manager.add_movie(
+            {f"bench added movie {n}": {"year": 2001, "rating": 7.5, "director": "bench"}}), iterations),
+        ("add_movie_to_user_favorite", lambda n: data_manager.add_movie_to_user_favorite(
+            random_user(), random_movie()), iterations),
+        ("add_movie_and_link_to_user", add_movie_and_link, iterations),
+        ("update_movie", lambda n: data_manager.update_movie(
+            {f"bench updated movie {n}": {"year": 2002, "rating": 8.0, "director": "bench", "id": random_movie()}}),
+         iterations),
+        ("add_users_bulk", lambda n: data_manager.add_users_bulk(
+            [f"bench bulk user {n} {i}" for i in range(100)]), max(iterations // 10, 3)),
+        ("add_movies_bulk", lambda n: data_manager.add_movies_bulk(
+            [{"name": f"bench bulk movie {n} {i}", "year": 2001, "rating": 7.0, "director": "bench"}
+             for i in range(100)]), max(iterations // 10, 3)),
+        ("delete_user_favorite_movie", lambda n: data_manager.delete_user_favorite_movie(
+            random_user(), random_movie()), iterations),
+        ("delete_movie", lambda n: data_manager.delete_movie(
+            added_movie_ids.pop() if added_movie_ids else random_movie()), iterations),
+        ("delete_user", lambda n: data_manager.delete_user(random_user()), iterations),
+    ]
+    results = [measure(f"data_manager.{name}", operation, count) for name, operation, count in benchmarks]
+    data_manager.engine.dispose()
+    return results
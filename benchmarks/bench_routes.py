@@ -0,0 +1,63 @@
+import random
+
+from app import create_app
+from benchmarks.stats import measure
+
+
+def run_route_benchmarks(db_path, sizes, omdb_base_url, iterations=200, data_cache=True, seed=11):
+    """
+    Drive the Flask routes through the test client against a seeded database and a stub OMDB server
+    :param db_path: path of a database seeded by benchmarks.seed.seed_database, it is modified
+    :param sizes: dict returned by seed_database with the number of users and movies
+    :param omdb_base_url: base url of a benchmarks.stub_omdb.StubOMDBServer
+    :param iterations: INTEGER timed requests per route
+    :param data_cache: False turns the read-through data cache off
+    :return: list of result dicts as returned by benchmarks.stats.measure
+    """
+    flask_app = create_app({
+        "SQLITE_DATABASE": db_path,
+        "OMDB_BASE_URL": omdb_base_url,
+        "OMDB_API_KEY": "benchmark",
+        "DATA_CACHE_TTL": 30 if data_cache else 0,
+        "LOG_LEVEL": "OFF",
+    })
+    client = flask_app.test_client()
+    rng = random.Random(seed)
+    users, movies = sizes["users"], sizes["movies"]
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code < 400, (url, response.status_code)
+
+    def post(url, data):
+        response = client.post(url, data=data)
+        assert response.status_code < 400, (url, response.status_code)
+
+    etags = {}
+
+    def get_revalidated(url):
+        # a repeated view of an unchanged page, answered with a 304
+        if url not in etags:
+            etags[url] = client.get(url).headers.get("ETag", "")
+        response = client.get(url, headers={"If-None-Match": etags[url]})
+        assert response.status_code == 304, (url, response.status_code)
+
+    benchmarks = [
+        ("GET /", lambda n: get("/")),
+        ("GET /users", lambda n: get("/users")),
+        ("GET /users?after", lambda n: get(f"/users?after={rng.randint(1, users)}")),
+        ("GET /users/<id>", lambda n: get(f"/users/{rng.randint(1, users)}")),
+        ("GET /users/<id> revalidated", lambda n: get_revalidated(f"/users/{rng.randint(1, 10)}")),
+        ("GET /users/<id>/update_movie/<id>", lambda n: get(
+            f"/users/{rng.randint(1, users)}/update_movie/{rng.randint(1, movies)}")),
+        ("GET /search", lambda n: get(f"/search?q={rng.choice(('dark', 'star night', 'king'))}")),
+        ("POST /add_user", lambda n: post("/add_user", {"username": f"route bench user {n}"})),
+        ("POST /users/<id>/add_movie", lambda n: post(
+            f"/users/{rng.randint(1, users)}/add_movie", {"movie_name": f"route bench movie {n % 50}"})),
+        ("GET /users/<id>/delete_movie/<id>", lambda n: get(
+            f"/users/{rng.randint(1, users)}/delete_movie/{rng.randint(1, movies)}")),
+        ("GET /metrics", lambda n: get("/metrics")),
+    ]
+    results = [measure(f"route.{name}", operation, iterations) for name, operation in benchmarks]
+    flask_app.extensions["moviweb"].close()
+    return results
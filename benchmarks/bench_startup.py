@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.stats import summarize
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in a fresh interpreter: the import of the app, create_app and the first request of a cold worker
+_COLD_START = """
+import json, sys, time
+started_at = time.perf_counter()
+import app
+imported_at = time.perf_counter()
+flask_app = app.create_app(json.loads(sys.argv[1]))
+created_at = time.perf_counter()
+status = flask_app.test_client().get("/users").status_code
+served_at = time.perf_counter()
+print(json.dumps({"status": status, "import": imported_at - started_at, "create_app": created_at - imported_at,
+                  "first_request": served_at - created_at}))
+"""
+
+
+def _cold_start(config):
+    completed = subprocess.run([sys.executable, "-c", _COLD_START, json.dumps(config)], cwd=REPOSITORY_DIR,
+                               capture_output=True, text=True, check=True)
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert timings.pop("status") == 200, completed.stdout
+    return timings
+
+
+def _forked_first_request(flask_app):
+    # seconds from the fork of a preloaded app to the end of the first request of the child
+    read_end, write_end = os.pipe()
+    started_at = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_end)
+            flask_app.test_client().get("/users")
+            os.write(write_end, str(time.perf_counter() - started_at).encode())
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        elapsed = float(pipe.read())
+    os.waitpid(pid, 0)
+    return elapsed
+
+
+def run_startup_benchmarks(db_path, omdb_base_url, iterations=10):
+    """
+    Time the startup of a worker: a cold start in a new interpreter, phase by phase,
+    and the first request of a worker forked from a preloaded app (posix only)
+    :param db_path: path of a database seeded by benchmarks.seed.seed_database
+    :param omdb_base_url: base url of a benchmarks.stub_omdb.StubOMDBServer
+    :param iterations: INTEGER number of started workers per benchmark
+    :return: list of result dicts as returned by benchmarks.stats.summarize
+    """
+    config = {"SQLITE_DATABASE": db_path, "OMDB_BASE_URL": omdb_base_url, "OMDB_API_KEY": "benchmark",
+              "LOG_LEVEL": "OFF"}
+    phases = {}
+    for _ in range(iterations):
+        for phase, seconds in _cold_start(config).items():
+            phases.setdefault(phase, []).append(seconds)
+    results = [summarize(f"startup.cold.{phase}", latencies) for phase, latencies in phases.items()]
+
+    if hasattr(os, "fork"):
+        from app import create_app
+
+        # the way a preloading server starts its workers: the app is made once, the children build what they use
+        flask_app = create_app(config)
+        results.append(summarize("startup.forked.first_request",
+                                 [_forked_first_request(flask_app) for _ in range(iterations)]))
+        flask_app.extensions["moviweb"].close()
+    return results
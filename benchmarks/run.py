@@ -0,0 +1,89 @@
+"""
+Benchmark suite of the data manager, the Flask routes and the startup of a worker.
+
+    python -m benchmarks.run --scales 1k,100k --iterations 200 --output bench.json
+
+Seeded databases are cached in --db-dir and copied before every run, since the write benchmarks modify them.
+The results are written as json, one entry per benchmark, so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+from benchmarks.bench_data_manager import run_data_manager_benchmarks
+from benchmarks.bench_routes import run_route_benchmarks
+from benchmarks.bench_startup import run_startup_benchmarks
+from benchmarks.seed import parse_scale, seed_database
+from benchmarks.stub_omdb import StubOMDBServer
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _fresh_copy(seeded_path, work_dir, name):
+    copy_path = os.path.join(work_dir, name)
+    shutil.copyfile(seeded_path, copy_path)
+    return copy_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data manager and the routes of MovieWeb App")
+    parser.add_argument("--scales", default="1k", help="comma separated scales, e.g. 1k,100k,1m")
+    parser.add_argument("--iterations", type=int, default=200, help="timed runs per benchmark")
+    parser.add_argument("--suites", default="data_manager,routes,startup",
+                        help="comma separated data_manager, routes and startup")
+    parser.add_argument("--startup-iterations", type=int, default=10, help="started workers per startup benchmark")
+    parser.add_argument("--no-data-cache", action="store_true", help="benchmark the routes without the data cache")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "moviweb_bench"),
+                        help="directory of the cached seeded databases")
+    parser.add_argument("--output", default="-", help="json output file, stdout by default")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    suites = set(args.suites.split(","))
+    report = {
+        "commit": _git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as work_dir, StubOMDBServer() as omdb_stub:
+        for scale in args.scales.split(","):
+            movies_count = parse_scale(scale)
+            seeded_path = os.path.join(args.db_dir, f"seed_{movies_count}.sqlite")
+            sizes = seed_database(seeded_path, movies_count)
+            run = {"scale": scale, "sizes": sizes, "results": []}
+            if "data_manager" in suites:
+                run["results"] += run_data_manager_benchmarks(
+                    _fresh_copy(seeded_path, work_dir, f"dm_{movies_count}.sqlite"), sizes, args.iterations)
+            if "routes" in suites:
+                run["results"] += run_route_benchmarks(
+                    _fresh_copy(seeded_path, work_dir, f"routes_{movies_count}.sqlite"), sizes,
+                    omdb_stub.base_url, args.iterations, data_cache=not args.no_data_cache)
+            if "startup" in suites:
+                run["results"] += run_startup_benchmarks(
+                    _fresh_copy(seeded_path, work_dir, f"startup_{movies_count}.sqlite"), omdb_stub.base_url,
+                    args.startup_iterations)
+            report["runs"].append(run)
+
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output)
+
+
+if __name__ == "__main__":
+    main()
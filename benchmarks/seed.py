@@ -0,0 +1,61 @@
+import os
+import random
+import time
+
+from sqlalchemy import text
+
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+_WORDS = ("dark", "night", "star", "love", "war", "city", "river", "ghost", "king", "dream",
+          "storm", "blood", "sun", "last", "lost", "iron", "secret", "winter", "fire", "road")
+
+
+def parse_scale(scale):
+    """
+    :param scale: "1k", "100k", "1m" or a plain number of movies
+    :return: INTEGER number of movies and favorites
+    """
+    return SCALES.get(str(scale).lower()) or int(scale)
+
+
+def seed_database(path, movies_count, chunk_size=10_000, seed=42):
+    """
+    Create a sqlite database with synthetic users, movies and favorites.
+    There are movies_count movies and favorites, and one user per 10 movies.
+    :param path: path of the database file, an existing database is reused as is
+    :param movies_count: INTEGER number of movies and favorites
+    :return: dict {"users": n, "movies": n, "favorites": n, "seconds": s}
+    """
+    users_count = max(movies_count // 10, 10)
+    if os.path.exists(path):
+        return {"users": users_count, "movies": movies_count, "favorites": movies_count, "seconds": 0.0}
+    rng = random.Random(seed)
+    started_at = time.perf_counter()
+    data_manager = SQLiteDataManager(path)
+    with data_manager.engine.begin() as connection:
+        for first in range(0, users_count, chunk_size):
+            connection.execute(text("INSERT INTO users (id, name) VALUES (:id, :name)"),
+                               [{"id": user_id, "name": f"user {user_id}"}
+                                for user_id in range(first + 1, min(first + chunk_size, users_count) + 1)])
+        for first in range(0, movies_count, chunk_size):
+            connection.execute(
+                text("INSERT INTO movies (id, name, year, rating, director) "
+                     "VALUES (:id, :name, :year, :rating, :director)"),
+                [{"id": movie_id,
+                  "name": f"the {rng.choice(_WORDS)} {rng.choice(_WORDS)} {movie_id}",
+                  "year": rng.randint(1920, 2025),
+                  "rating": round(rng.uniform(1, 10), 1),
+                  "director": f"director {rng.randint(1, max(movies_count // 20, 1))}"}
+                 for movie_id in range(first + 1, min(first + chunk_size, movies_count) + 1)])
+        pairs = set()
+        while len(pairs) < movies_count:
+            pairs.add((rng.randint(1, users_count), rng.randint(1, movies_count)))
+        pairs = sorted(pairs)
+        for first in range(0, len(pairs), chunk_size):
+            connection.execute(text("INSERT INTO user_favorites (user_id, movie_id) VALUES (:user_id, :movie_id)"),
+                               [{"user_id": user_id, "movie_id": movie_id}
+                                for user_id, movie_id in pairs[first:first + chunk_size]])
+    data_manager.engine.dispose()
+    return {"users": users_count, "movies": movies_count, "favorites": movies_count,
+            "seconds": time.perf_counter() - started_at}
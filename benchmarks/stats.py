@@ -0,0 +1,52 @@
+import math
+import time
+
+
+def percentile(sorted_values, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(name, operation, iterations, warmup=3):
+    """
+    Run an operation repeatedly and summarize its latency
+    :param name: name of the benchmark
+    :param operation: callable taking the iteration number
+    :param iterations: INTEGER number of timed runs
+    :param warmup: INTEGER number of untimed runs first
+    :return: dict {"name", "iterations", "throughput_per_sec", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}
+    """
+    for number in range(warmup):
+        operation(number)
+    latencies = []
+    started_at = time.perf_counter()
+    for number in range(iterations):
+        operation_started_at = time.perf_counter()
+        operation(warmup + number)
+        latencies.append(time.perf_counter() - operation_started_at)
+    return summarize(name, latencies, time.perf_counter() - started_at)
+
+
+def summarize(name, latencies, total=None):
+    """
+    :param name: name of the benchmark
+    :param latencies: list of durations in seconds of the timed runs
+    :param total: seconds all the runs took, defaults to the sum of the latencies
+    :return: dict {"name", "iterations", "throughput_per_sec", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}
+    """
+    latencies = sorted(latencies)
+    total = sum(latencies) if total is None else total
+    iterations = len(latencies)
+    return {
+        "name": name,
+        "iterations": iterations,
+        "throughput_per_sec": round(iterations / total, 2) if total else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4),
+    }
@@ -0,0 +1,44 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _StubOMDBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, Nagle would delay the body by the delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        title = parse_qs(urlparse(self.path).query).get("t", [""])[0]
+        if title.lower().startswith("unknown"):
+            body = {"Response": "False", "Error": "Movie not found!"}
+        else:
+            body = {"Title": title, "Year": "2001", "imdbRating": "7.5",
+                    "Director": f"stub director {len(title) % 7}", "Response": "True"}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOMDBServer:
+    """
+    Local HTTP server answering like the OMDB api, titles starting with "unknown" are not found.
+    Use it as a context manager, base_url is the url to give the app as OMDB_BASE_URL.
+    """
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOMDBHandler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}/"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,44 @@
+import csv
+import io
+import json
+from itertools import islice
+
+EXPORT_FIELDS = ("id", "name", "year", "rating", "director")
+EXPORT_FORMATS = ("csv", "jsonl", "ndjson")
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/jsonl",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def format_records(records, file_format, batch_size=500):
+    """
+    Serialize movie records lazily, so an export never holds more than one batch in memory
+    :param records: iterable of Movie as returned by the stream_* methods of the data manager
+    :param file_format: "csv", "jsonl" or "ndjson" (jsonl and ndjson are the same line format)
+    :param batch_size: INTEGER number of records serialized into one yielded string
+    :return: generator of strings
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {file_format}, choose one of {', '.join(EXPORT_FORMATS)}")
+    records = iter(records)
+    if file_format == "csv":
+        buffer = io.StringIO()
+        # the fields of Movie are the export columns, in the same order
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        while True:
+            batch = list(islice(records, batch_size))
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if len(batch) < batch_size:
+                return
+    while True:
+        batch = list(islice(records, batch_size))
+        if batch:
+            yield "".join(json.dumps(record._asdict()) + "\n" for record in batch)
+        if len(batch) < batch_size:
+            return
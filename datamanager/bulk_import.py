@@ -0,0 +1,154 @@
+import csv
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from datamanager.records import parse_rating, parse_year
+from utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+IMPORT_KINDS = ("users", "movies", "favorites")
+
+
+def read_records(path, file_format=None):
+    """
+    Stream the records of a CSV or JSON lines file one dict at a time
+    :param path: path of the input file
+    :param file_format: "csv" or "jsonl", guessed from the file extension when None
+    :return: generator of dicts
+    """
+    if file_format is None:
+        file_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+    with open(path, newline="", encoding="utf-8") as input_file:
+        if file_format == "csv":
+            yield from csv.DictReader(input_file)
+        else:
+            for line in input_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunked(records, chunk_size):
+    """
+    :param records: iterable of records
+    :param chunk_size: INTEGER number of records per chunk
+    :return: generator of lists of at most chunk_size records
+    """
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _movie_from_record(record):
+    name = _text(record.get("name") or record.get("movie"))
+    if name is None:
+        return None
+    return {
+        "name": name,
+        "year": parse_year(record.get("year")),
+        "rating": parse_rating(record.get("rating")),
+        "director": _text(record.get("director")),
+    }
+
+
+def _favorite_from_record(record):
+    user = _text(record.get("user"))
+    name = _text(record.get("name") or record.get("movie"))
+    if user is None or name is None:
+        return None
+    return {"user": user, "name": name, "director": _text(record.get("director"))}
+
+
+def enrich_movies(movies, omdb_client, rate_limiter, max_workers=4):
+    """
+    Fill the missing year, rating and director of movies from OMDB, concurrently but rate limited
+    :param movies: list of movie dicts as built by import_records, updated in place
+    :param omdb_client: an omdb.client.OMDBClient
+    :param rate_limiter: utils.rate_limiter.RateLimiter shared by all chunks of the import
+    :param max_workers: INTEGER maximum number of concurrent OMDB requests
+    :return: INTEGER number of enriched movies
+    """
+    incomplete = [movie for movie in movies
+                  if movie["year"] is None or movie["rating"] is None or movie["director"] is None]
+
+    def fetch(movie):
+        rate_limiter.acquire()
+        try:
+            response_json = omdb_client.get_movie_by_title(movie["name"])
+        except Exception as err:
+            logger.warning("Can not enrich %s from OMDB: %s", movie['name'], err)
+            return False
+        if "Director" not in response_json:
+            return False
+        director_omdb = response_json["Director"].lower()
+        # only trust OMDB for a movie of the same director
+        if movie["director"] is not None and movie["director"].lower() != director_omdb:
+            return False
+        movie["director"] = movie["director"] or director_omdb
+        movie["year"] = movie["year"] if movie["year"] is not None else parse_year(response_json.get("Year"))
+        movie["rating"] = movie["rating"] if movie["rating"] is not None \
+            else parse_rating(response_json.get("imdbRating"))
+        return True
+
+    if not incomplete:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(fetch, incomplete))
+
+
+def import_records(data_manager, kind, records, chunk_size=1000, omdb_client=None,
+                   omdb_rate=5, omdb_workers=4, progress=None):
+    """
+    Import users, movies or favorites in chunks, every chunk is inserted in one transaction
+    :param data_manager: a DataManagerInterface
+    :param kind: "users", "movies" or "favorites"
+    :param records: iterable of dicts, users need "name", movies "name", "director", "year", "rating"
+    and favorites "user", "name", "director"
+    :param chunk_size: INTEGER number of records per transaction
+    :param omdb_client: optional omdb.client.OMDBClient used to fill incomplete movies
+    :param omdb_rate: maximum OMDB requests per second while enriching
+    :param omdb_workers: INTEGER maximum concurrent OMDB requests while enriching
+    :param progress: optional callable receiving the statistics dict after every chunk
+    :return: dict of statistics {"rows", "added", "skipped", "invalid", "enriched", "seconds", "rows_per_sec"}
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Unknown import kind {kind}, choose one of {', '.join(IMPORT_KINDS)}")
+    rate_limiter = RateLimiter(omdb_rate) if omdb_client is not None else None
+    stats = {"rows": 0, "added": 0, "skipped": 0, "invalid": 0, "enriched": 0, "seconds": 0.0, "rows_per_sec": 0.0}
+    started_at = time.perf_counter()
+    for chunk in chunked(records, chunk_size):
+        stats["rows"] += len(chunk)
+        if kind == "users":
+            names = [_text(record.get("name")) for record in chunk]
+            valid = [name for name in names if name is not None]
+            added = data_manager.add_users_bulk(valid)
+        elif kind == "movies":
+            valid = [movie for movie in map(_movie_from_record, chunk) if movie is not None]
+            if rate_limiter is not None:
+                stats["enriched"] += enrich_movies(valid, omdb_client, rate_limiter, omdb_workers)
+            added = data_manager.add_movies_bulk(valid)
+        else:
+            valid = [favorite for favorite in map(_favorite_from_record, chunk) if favorite is not None]
+            added, unresolved = data_manager.add_favorites_bulk(valid)
+            stats["invalid"] += unresolved
+        stats["invalid"] += len(chunk) - len(valid)
+        stats["added"] += added
+        stats["skipped"] = stats["rows"] - stats["added"] - stats["invalid"]
+        stats["seconds"] = time.perf_counter() - started_at
+        stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        if progress is not None:
+            progress(stats)
+    return stats
@@ -0,0 +1,270 @@
+import threading
+from contextlib import contextmanager
+
+from datamanager.interface_data_mngt import DataManagerInterface
+from utils.lru_ttl_cache import LRUTTLCache
+
+
+def _as_id(value):
+    # routes pass ids as strings or integers, both must hit the same cache entry
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class CachedDataManager(DataManagerInterface):
+    """
+    Read-through cache in front of another DataManagerInterface.
+    User, movie and favorite list lookups are kept in per entity LRU caches with a time-to-live,
+    the write methods invalidate exactly the entries they make stale.
+    A favorite list, and a page of users, is kept with the favorites version of its user (the users version)
+    it was read at and is only served while the version in the database is the same: the writes of other
+    processes, and of the other threads in between a read and its store, never leave a stale list behind.
+    The reads made in a write unit of work see its uncommitted changes, they go to the wrapped data manager
+    without filling or reading the caches. Every other attribute is delegated to the wrapped data manager.
+    """
+
+    def __init__(self, data_manager, max_size=1024, ttl=30):
+        """
+        :param data_manager: the DataManagerInterface to cache
+        :param max_size: INTEGER maximum number of entries of each cache
+        :param ttl: time-to-live in seconds of a cached entry
+        """
+        self._data_manager = data_manager
+        self._users = LRUTTLCache(max_size=max_size, ttl=ttl)
+        self._users_pages = LRUTTLCache(max_size=max_size, ttl=ttl)
+        self._movies = LRUTTLCache(max_size=max_size, ttl=ttl)
+        # user_id -> (favorites version, {call arguments: result}) of get_user_movies and get_user_movies_page
+        self._user_movies = LRUTTLCache(max_size=max_size, ttl=ttl)
+        # depth of the write units of work of the current thread
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._data_manager, name)
+
+    @property
+    def wrapped(self):
+        """
+        :return: the data manager behind the cache
+        """
+        return self._data_manager
+
+    def cache_stats(self):
+        """
+        :return: dict of the hit/miss counters and size of every cache, e.g.
+        {"users": {"hits": 10, "misses": 2, "size": 2}, ...}
+        """
+        return {
+            "users": self._users.stats(),
+            "users_pages": self._users_pages.stats(),
+            "movies": self._movies.stats(),
+            "user_movies": self._user_movies.stats(),
+        }
+
+    @contextmanager
+    def unit_of_work(self, write=False):
+        # a rolled back unit of work leaves at most some needlessly invalidated entries:
+        # the rows it read are not cached, they may be its own uncommitted changes
+        if not write:
+            with self._data_manager.unit_of_work() as connection:
+                yield connection
+            return
+        depth = getattr(self._local, "writes", 0)
+        self._local.writes = depth + 1
+        try:
+            with self._data_manager.unit_of_work(write=True) as connection:
+                yield connection
+        finally:
+            self._local.writes = depth
+
+    def _in_write(self):
+        return getattr(self._local, "writes", 0) > 0
+
+    def _invalidate_user_movies(self, user_id):
+        self._user_movies.delete(_as_id(user_id))
+
+    def _cached_user_movies(self, user_id, call_key, load):
+        user_id = _as_id(user_id)
+        # read before the list: a write committed in between bumps the version past the one the list is kept with.
+        # Changing a movie bumps the version of every user holding it, the version is all there is to check
+        version = self._data_manager.get_user_favorites_version(user_id)
+        if version is None or self._in_write():
+            # unknown user, nothing to keep, or a version that may be rolled back
+            return load()
+        user_entry = self._user_movies.get(user_id)
+        if user_entry is not None and user_entry[0] == version and call_key in user_entry[1]:
+            return user_entry[1][call_key]
+        result = load()
+        if user_entry is None or user_entry[0] != version:
+            user_entry = (version, {})
+            self._user_movies.set(user_id, user_entry)
+        user_entry[1][call_key] = result
+        return result
+
+    def get_all_users(self):
+        return self._data_manager.get_all_users()
+
+    def get_users_page(self, after_id=None, before_id=None, page_size=50):
+        # kept with the users version like the favorite lists, the users added by other processes show at once
+        if self._in_write():
+            return self._data_manager.get_users_page(after_id, before_id, page_size)
+        version = self._data_manager.get_users_version()
+        call_key = (after_id, before_id, page_size)
+        entry = self._users_pages.get(call_key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        result = self._data_manager.get_users_page(after_id, before_id, page_size)
+        self._users_pages.set(call_key, (version, result))
+        return result
+
+    def get_user_movies(self, user_id):
+        return self._cached_user_movies(user_id, "all", lambda: self._data_manager.get_user_movies(user_id))
+
+    def get_user_movies_page(self, user_id, after_id=None, before_id=None, page_size=50):
+        return self._cached_user_movies(
+            user_id, (after_id, before_id, page_size),
+            lambda: self._data_manager.get_user_movies_page(user_id, after_id, before_id, page_size))
+
+    def get_all_movies(self):
+        return self._data_manager.get_all_movies()
+
+    def stream_all_movies(self, batch_size=1000):
+        return self._data_manager.stream_all_movies(batch_size)
+
+    def stream_user_movies(self, user_id, batch_size=1000):
+        return self._data_manager.stream_user_movies(user_id, batch_size)
+
+    def search_movies(self, query, page=1, page_size=20):
+        return self._data_manager.search_movies(query, page, page_size)
+
+    def is_movie_exist(self, movie):
+        return self._data_manager.is_movie_exist(movie)
+
+    def get_user_by_id(self, user_id):
+        if self._in_write():
+            return self._data_manager.get_user_by_id(user_id)
+        user = self._users.get(_as_id(user_id))
+        if user is None:
+            user = self._data_manager.get_user_by_id(user_id)
+            # "" means the user was not found, it is not cached
+            if user:
+                self._users.set(_as_id(user_id), user)
+        return user
+
+    def get_movie_by_id(self, movie_id):
+        if self._in_write():
+            return self._data_manager.get_movie_by_id(movie_id)
+        movie = self._movies.get(_as_id(movie_id))
+        if movie is None:
+            movie = self._data_manager.get_movie_by_id(movie_id)
+            if movie:
+                self._movies.set(_as_id(movie_id), movie)
+        return movie
+
+    def get_users_version(self):
+        # the versions decide whether the cached pages are still current, they are never cached
+        return self._data_manager.get_users_version()
+
+    def get_user_favorites_version(self, user_id):
+        return self._data_manager.get_user_favorites_version(user_id)
+
+    def get_user_recommendations(self, user_id, limit=10):
+        # the recommendations change with the favorites of the other users, they are never cached
+        return self._data_manager.get_user_recommendations(user_id, limit)
+
+    def get_recommendations_version(self):
+        return self._data_manager.get_recommendations_version()
+
+    def rebuild_recommendations(self):
+        return self._data_manager.rebuild_recommendations()
+
+    def get_stats(self, limit=10):
+        return self._data_manager.get_stats(limit)
+
+    def rebuild_stats(self):
+        return self._data_manager.rebuild_stats()
+
+    def add_user(self, user):
+        result = self._data_manager.add_user(user)
+        self._users_pages.clear()
+        return result
+
+    def add_movie(self, movie):
+        return self._data_manager.add_movie(movie)
+
+    def add_movie_to_user_favorite(self, user_id, movie_id):
+        result = self._data_manager.add_movie_to_user_favorite(user_id, movie_id)
+        self._invalidate_user_movies(user_id)
+        return result
+
+    def add_movie_and_link_to_user(self, user_id, movie):
+        result = self._data_manager.add_movie_and_link_to_user(user_id, movie)
+        self._invalidate_user_movies(user_id)
+        return result
+
+    def add_users_bulk(self, user_names):
+        result = self._data_manager.add_users_bulk(user_names)
+        self._users_pages.clear()
+        return result
+
+    def add_movies_bulk(self, movies):
+        return self._data_manager.add_movies_bulk(movies)
+
+    def add_favorites_bulk(self, favorites):
+        result = self._data_manager.add_favorites_bulk(favorites)
+        # the affected user ids are only known to the database, drop every cached favorite list
+        self._user_movies.clear()
+        return result
+
+    def update_movie(self, movie):
+        result = self._data_manager.update_movie(movie)
+        try:
+            movie_id = movie[list(movie.keys())[0]]['id']
+        except Exception:
+            return result
+        self._movies.delete(_as_id(movie_id))
+        return result
+
+    def delete_user(self, user_id):
+        result = self._data_manager.delete_user(user_id)
+        self._users.delete(_as_id(user_id))
+        self._invalidate_user_movies(user_id)
+        self._users_pages.clear()
+        return result
+
+    def delete_movie(self, movie_id):
+        result = self._data_manager.delete_movie(movie_id)
+        self._movies.delete(_as_id(movie_id))
+        return result
+
+    def delete_user_favorite_movie(self, user_id, movie_id):
+        result = self._data_manager.delete_user_favorite_movie(user_id, movie_id)
+        self._invalidate_user_movies(user_id)
+        return result
+
+    def delete_users(self, user_ids):
+        result = self._data_manager.delete_users(user_ids)
+        for user_id in user_ids:
+            self._users.delete(_as_id(user_id))
+            self._invalidate_user_movies(user_id)
+        self._users_pages.clear()
+        return result
+
+    def delete_movies(self, movie_ids):
+        result = self._data_manager.delete_movies(movie_ids)
+        for movie_id in movie_ids:
+            self._movies.delete(_as_id(movie_id))
+        return result
+
+    def delete_orphan_movie(self, movie_id):
+        result = self._data_manager.delete_orphan_movie(movie_id)
+        self._movies.delete(_as_id(movie_id))
+        return result
+
+    def delete_orphan_movies(self, batch_size=500, pause=0.0):
+        result = self._data_manager.delete_orphan_movies(batch_size, pause)
+        # the deleted movies were in no favorite list, only the movie lookups can be stale
+        if result:
+            self._movies.clear()
+        return result
@@ -0,0 +1,107 @@
+from sqlalchemy import create_engine, event
+
+# Engine profiles of the sqlite database.
+# "pragmas" are applied to every new DBAPI connection, "pool_size" and "max_overflow"
+# size the connection pool shared by the threads of one worker process.
+ENGINE_PROFILES = {
+    # sqlite defaults, one writer at a time with a rollback journal
+    "default": {
+        "pragmas": {},
+        "busy_timeout_ms": 5000,
+        "pool_size": 5,
+        "max_overflow": 10,
+    },
+    # write-ahead log: readers never block the writer and the writer never blocks readers
+    "wal": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -16000,
+            "mmap_size": 64 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "wal_autocheckpoint": 1000,
+        },
+        "busy_timeout_ms": 10000,
+        "pool_size": 8,
+        "max_overflow": 16,
+    },
+    # wal with bigger caches and pool for many reader threads per worker
+    "high_concurrency": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -64000,
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "wal_autocheckpoint": 4000,
+        },
+        "busy_timeout_ms": 30000,
+        "pool_size": 16,
+        "max_overflow": 32,
+    },
+}
+
+
+def get_engine_profile(name="wal", **overrides):
+    """
+    :param name: name of one of the ENGINE_PROFILES
+    :param overrides: profile keys to override, e.g. pool_size=4 or busy_timeout_ms=2000,
+    None values are ignored
+    :return: a copy of the profile dict
+    RAISE ValueError for an unknown profile name
+    """
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown sqlite engine profile {name}, choose one of {', '.join(ENGINE_PROFILES)}")
+    profile = dict(ENGINE_PROFILES[name])
+    profile["pragmas"] = dict(profile["pragmas"])
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    return profile
+
+
+def create_sqlite_engine(url, profile):
+    """
+    Create a sqlalchemy engine of a sqlite database tuned by an engine profile
+    :param url: sqlalchemy URL of the sqlite database
+    :param profile: dict returned by get_engine_profile
+    :return: the sqlalchemy engine
+    """
+    engine = create_engine(
+        url,
+        pool_size=profile["pool_size"],
+        max_overflow=profile["max_overflow"],
+        connect_args={"timeout": profile["busy_timeout_ms"] / 1000},
+    )
+    apply_engine_profile(engine, profile)
+    return engine
+
+
+def apply_engine_profile(engine, profile):
+    """
+    Apply the pragmas of an engine profile to every new connection of a sqlite engine
+    and begin its transactions in the "begin" event
+    :param engine: sqlalchemy engine of a sqlite database, the sync_engine of an async one
+    :param profile: dict returned by get_engine_profile
+    """
+    # sqlite only enforces the foreign keys of the schema, and cascades the deletes, when asked on every connection
+    pragmas = [f"PRAGMA busy_timeout = {int(profile['busy_timeout_ms'])}", "PRAGMA foreign_keys = ON"]
+    pragmas += [f"PRAGMA {name} = {value}" for name, value in profile["pragmas"].items()]
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+        # pysqlite only begins a transaction before a write, so reads and savepoints run outside of it.
+        # Turn its own transaction handling off and begin the transactions in the "begin" event instead
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_transaction(connection):
+        # the "sqlite_begin" execution option chooses DEFERRED (default), IMMEDIATE or EXCLUSIVE,
+        # None leaves every statement in its own implicit transaction (single reads)
+        mode = connection.get_execution_options().get("sqlite_begin", "DEFERRED")
+        if mode is not None:
+            connection.exec_driver_sql(f"BEGIN {mode}")
@@ -1,27 +1,143 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 class DataManagerInterface(ABC):
+    """
+    Storage of the users, movies and favorites of the app.
+    The movie read methods return datamanager.records.Movie named tuples.
+    """
+
+    @contextmanager
+    def unit_of_work(self, write=False):
+        """
+        Run the calls of the with block on one connection and in one transaction.
+        Data managers without transactions run every call on its own.
+        :param write: True when the block writes, the transaction then takes the write lock up front
+        """
+        yield None
 
     @abstractmethod
     def get_all_users(self):
         pass
 
+    @abstractmethod
+    def get_users_page(self, after_id=None, before_id=None, page_size=50):
+        pass
+
     @abstractmethod
     def get_user_movies(self, user_id):
+        """
+        :return: LIST of datamanager.records.Movie of the user's favorites ordered by movie id
+        """
+        pass
+
+    @abstractmethod
+    def get_user_movies_page(self, user_id, after_id=None, before_id=None, page_size=50):
+        """
+        :return: tuple (movies, next_cursor, prev_cursor), movies a LIST of Movie
+        """
         pass
 
     @abstractmethod
     def get_all_movies(self):
+        """
+        :return: LIST of Movie ordered by id
+        """
+        pass
+
+    @abstractmethod
+    def stream_all_movies(self, batch_size=1000):
+        """
+        :return: generator of Movie ordered by id
+        """
+        pass
+
+    @abstractmethod
+    def stream_user_movies(self, user_id, batch_size=1000):
+        """
+        :return: generator of Movie of the user's favorites ordered by movie id
+        """
+        pass
+
+    @abstractmethod
+    def search_movies(self, query, page=1, page_size=20):
+        """
+        :return: tuple (movies, next_page), movies a LIST of Movie
+        """
         pass
 
     @abstractmethod
     def is_movie_exist(self, movie):
+        """
+        :return: tuple (exists, conflicting_movie), conflicting_movie the existing Movie
+        when its year or rating differ, None otherwise
+        """
         pass
 
     @abstractmethod
     def get_user_by_id(self, user_id):
         pass
 
+    @abstractmethod
+    def get_movie_by_id(self, movie_id):
+        """
+        :return: the Movie of movie_id, None if not found
+        """
+        pass
+
+    @abstractmethod
+    def get_users_version(self):
+        """
+        :return: tuple (version, changed_at) of the users table, bumped by every write of a user,
+        changed_at an epoch timestamp in seconds or None
+        """
+        pass
+
+    @abstractmethod
+    def get_user_favorites_version(self, user_id):
+        """
+        :return: tuple (version, changed_at) of the favorite list of the user, bumped by every write
+        of the list or of one of its movies, None if the user doesn't exist
+        """
+        pass
+
+    @abstractmethod
+    def get_user_recommendations(self, user_id, limit=10):
+        """
+        :return: list of at most limit Movie records liked by the users who liked the user's favorites,
+        best recommendation first
+        """
+        pass
+
+    @abstractmethod
+    def get_recommendations_version(self):
+        """
+        :return: tuple (version, changed_at) of the recommendations, bumped by every full rebuild of them
+        """
+        pass
+
+    @abstractmethod
+    def rebuild_recommendations(self):
+        """
+        :return: INTEGER number of (movie, neighbour) pairs stored by a full rebuild of the recommendations
+        """
+        pass
+
+    @abstractmethod
+    def get_stats(self, limit=10):
+        """
+        :return: dict with the leaderboards "top_movies" and "top_users" of at most limit entries
+        and the histograms "rating" and "decade" of the favorites, see datamanager.stats.get_stats
+        """
+        pass
+
+    @abstractmethod
+    def rebuild_stats(self):
+        """
+        :return: dict with the number of movies, users and histogram buckets counted by a full recount of the stats
+        """
+        pass
+
     @abstractmethod
     def add_user(self, user):
         pass
@@ -34,6 +150,22 @@ class DataManagerInterface(ABC):
     def add_movie_to_user_favorite(self, user_id, movie_id):
         pass
 
+    @abstractmethod
+    def add_movie_and_link_to_user(self, user_id, movie):
+        pass
+
+    @abstractmethod
+    def add_users_bulk(self, user_names):
+        pass
+
+    @abstractmethod
+    def add_movies_bulk(self, movies):
+        pass
+
+    @abstractmethod
+    def add_favorites_bulk(self, favorites):
+        pass
+
     @abstractmethod
     def update_movie(self, movie):
         pass
@@ -50,3 +182,40 @@ class DataManagerInterface(ABC):
     def delete_user_favorite_movie(self, user_id, movie_id):
         pass
 
+    @abstractmethod
+    def delete_users(self, user_ids):
+        """
+        Delete many users and their favorites in one transaction
+        :param user_ids: list of INTEGER
+        :return: INTEGER number of deleted users
+        """
+        pass
+
+    @abstractmethod
+    def delete_movies(self, movie_ids):
+        """
+        Delete many movies in one transaction, they are removed from every favorite list holding them
+        :param movie_ids: list of INTEGER
+        :return: INTEGER number of deleted movies
+        """
+        pass
+
+    @abstractmethod
+    def delete_orphan_movie(self, movie_id):
+        """
+        Delete a movie only when it is in no user's favorites
+        :param movie_id: INTEGER
+        :return: True if the movie was deleted, False if it is missing or a favorite holds it
+        """
+        pass
+
+    @abstractmethod
+    def delete_orphan_movies(self, batch_size=500, pause=0.0):
+        """
+        Delete the movies in no user's favorites, in transactions of batch_size movies
+        :param batch_size: INTEGER movies deleted per transaction
+        :param pause: seconds slept between two transactions
+        :return: INTEGER number of deleted movies
+        """
+        pass
+
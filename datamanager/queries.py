@@ -0,0 +1,148 @@
+import re
+
+from sqlalchemy import and_, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from datamanager.records import movie_from_row, parse_rating, parse_year
+from datamanager.tables import movie_director_key, movies, user_favorites
+
+# Queries and parameters shared by SQLiteDataManager and SQLDataManager, in sqlalchemy Core expressions.
+# The two data managers differ in how they open their transactions, search the movies and keep the versions
+# and the stats up to date (the triggers of the sqlite schema, Python code otherwise), the rest is built here.
+
+MOVIE_COLUMNS = (movies.c.id, movies.c.name, movies.c.year, movies.c.rating, movies.c.director)
+# the expressions of the ux_movies_name_director index, the conflict target of a movie insert
+MOVIE_KEY = (movies.c.name, movie_director_key)
+
+
+# the dialects insert_ignore has a statement for
+SUPPORTED_DIALECTS = ("postgresql", "mysql", "mariadb", "sqlite")
+
+
+def insert_ignore(dialect_name, table, conflict_columns):
+    """
+    :param dialect_name: name of the sqlalchemy dialect of the connection, e.g. "sqlite" or "postgresql"
+    :param table: sqlalchemy Table
+    :param conflict_columns: column names or the expressions of a unique index of the table
+    :return: an INSERT statement of table skipping the rows that violate the unique conflict_columns
+    """
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=conflict_columns)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=conflict_columns)
+    if dialect_name in ("mysql", "mariadb"):
+        return insert(table).prefix_with("IGNORE")
+    raise NotImplementedError(f"No insert-or-ignore statement for the {dialect_name} dialect")
+
+
+def movie_params(movie, with_id=False):
+    """
+    :param movie: dict of the write methods, {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay", "id":2}}
+    :param with_id: True reads the id of the movie too
+    :return: dict of the name, year, rating and director (and id) of the movie
+    RAISE an exception when one of them is missing
+    """
+    movie_title_key = list(movie.keys())[0]
+    params = {
+        "name": movie_title_key,
+        "year": movie[movie_title_key]['year'],
+        "rating": movie[movie_title_key]['rating'],
+        "director": movie[movie_title_key]['director'],
+    }
+    if with_id:
+        params["id"] = int(movie[movie_title_key]['id'])
+    return params
+
+
+def unique_movies(movies_list):
+    """
+    Deduplicate a batch of movie dicts on (name, director), the first occurrence wins
+    :param movies_list: list of dicts with a "name" and a "director"
+    :return: list of dicts, in the order of the batch
+    """
+    return list({(movie["name"], movie["director"] or ""): movie for movie in reversed(movies_list)}.values())[::-1]
+
+
+def same_movie(name, director):
+    """
+    :return: condition on the movies of this name and director, an unknown director matches the empty one
+    like in the ux_movies_name_director index
+    """
+    return and_(movies.c.name == name, movie_director_key == (director or ""))
+
+
+def existing_movie(connection, params):
+    """
+    Look a movie up by name and director, see DataManagerInterface.is_movie_exist
+    :param connection: sqlalchemy connection
+    :param params: dict returned by movie_params
+    :return: tuple (exists, conflicting_movie)
+        (True, None) if the movie exists with the same year and rating
+        (True, Movie) if a movie of the same name and director exists with another year or rating
+        (False, None) if no
+    """
+    row = connection.execute(select(*MOVIE_COLUMNS).where(same_movie(params["name"], params["director"]))
+                             .limit(1)).fetchone()
+    if row is None:
+        return False, None
+    found_movie = movie_from_row(row)
+    year, rating = parse_year(params["year"]), parse_rating(params["rating"])
+    # compare the year and the rating as numbers, a rating only has one decimal
+    if found_movie.year == year and (found_movie.rating is None) == (rating is None) and \
+            (rating is None or round(found_movie.rating, 1) == round(rating, 1)):
+        return True, None
+    return True, found_movie
+
+
+def user_movies_query(user_id):
+    """
+    :return: select statement of the movies of the user's favorites, without ORDER BY
+    """
+    return select(*MOVIE_COLUMNS).join(user_favorites, user_favorites.c.movie_id == movies.c.id) \
+        .where(user_favorites.c.user_id == user_id)
+
+
+def orphan_movies():
+    """
+    :return: condition on the movies that are in no user's favorites
+    """
+    return ~select(user_favorites.c.movie_id).where(user_favorites.c.movie_id == movies.c.id).exists()
+
+
+def search_words(query):
+    """
+    :param query: search string typed by the user
+    :return: list of the words of the query, they are never read as query syntax
+    """
+    return re.findall(r"\w+", query or "")
+
+
+def fetch_keyset_page(connection, query, key_column, after_id=None, before_id=None, page_size=50):
+    """
+    Run a keyset paginated query, the page cost doesn't depend on how deep the page is
+    :param connection: sqlalchemy connection
+    :param query: select statement without ORDER BY and LIMIT
+    :param key_column: indexed, unique column the pages are ordered by
+    :param after_id: return the rows with a key greater than after_id
+    :param before_id: return the rows with a key smaller than before_id
+    :param page_size: INTEGER maximum number of rows of the page
+    :return: tuple (rows, next_cursor, prev_cursor), a cursor is None when there is no such page
+    """
+    query = query.add_columns(key_column.label("cursor_id"))
+    if before_id is not None:
+        query = query.where(key_column < before_id).order_by(key_column.desc())
+    else:
+        if after_id is not None:
+            query = query.where(key_column > after_id)
+        query = query.order_by(key_column.asc())
+    rows = connection.execute(query.limit(page_size + 1)).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before_id is not None:
+        rows.reverse()
+        next_cursor = rows[-1].cursor_id if rows else None
+        prev_cursor = rows[0].cursor_id if has_more else None
+    else:
+        next_cursor = rows[-1].cursor_id if has_more else None
+        prev_cursor = rows[0].cursor_id if after_id is not None and rows else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,210 @@
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import and_, bindparam, delete, func, insert, select, update
+
+from datamanager.records import movie_from_row
+from datamanager.tables import data_versions, movie_neighbors, movies, user_favorites
+
+# the batch build counts the co-occurrences with a sparse matrix product when numpy and scipy are installed
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+# "Users who liked this also liked": two movies are neighbours when users have both as favorites,
+# the score of the pair is the number of those users. Every movie keeps its top neighbours in the
+# movie_neighbors table, a batch job builds the whole table and every favorite added or removed
+# updates the pairs it changes in its own transaction. The recommendations of a user are the
+# neighbours of the user's favorites, read from the table without scanning user_favorites.
+
+DEFAULT_NEIGHBORS = 20
+INSERT_CHUNK_SIZE = 5000
+REFRESH_CHUNK_SIZE = 500
+
+
+def _by_score(item):
+    # highest score first, the lowest id breaks the ties
+    return -item[1], item[0]
+
+
+def top_k_neighbors(favorites, k=DEFAULT_NEIGHBORS):
+    """
+    :param favorites: list of (user_id, movie_id) pairs
+    :param k: INTEGER number of neighbours kept per movie
+    :return: list of (movie_id, neighbor_id, score) tuples, at most k per movie
+    """
+    if not favorites:
+        return []
+    if np is None:
+        return _top_k_neighbors_python(favorites, k)
+    user_ids, movie_ids = np.asarray(favorites, dtype=np.int64).T
+    _, user_index = np.unique(user_ids, return_inverse=True)
+    movie_keys, movie_index = np.unique(movie_ids, return_inverse=True)
+    interactions = sparse.csr_matrix((np.ones(len(movie_index), dtype=np.int32), (user_index, movie_index)),
+                                     shape=(user_index.max() + 1, len(movie_keys)))
+    co_occurrences = (interactions.T @ interactions).tocoo()
+    # a movie isn't its own neighbour
+    pairs = co_occurrences.row != co_occurrences.col
+    row, col, score = co_occurrences.row[pairs], co_occurrences.col[pairs], co_occurrences.data[pairs]
+    # sort every row by score and keep its first k entries
+    order = np.lexsort((col, -score, row))
+    row, col, score = row[order], col[order], score[order]
+    rank = np.arange(len(row)) - np.searchsorted(row, row)
+    top = rank < k
+    return list(zip(movie_keys[row[top]].tolist(), movie_keys[col[top]].tolist(), score[top].tolist()))
+
+
+def _top_k_neighbors_python(favorites, k):
+    movies_by_user = defaultdict(list)
+    for user_id, movie_id in favorites:
+        movies_by_user[user_id].append(movie_id)
+    co_occurrences = defaultdict(Counter)
+    for movie_ids in movies_by_user.values():
+        for movie_id in movie_ids:
+            co_occurrences[movie_id].update(other for other in movie_ids if other != movie_id)
+    return [(movie_id, neighbor_id, score)
+            for movie_id in sorted(co_occurrences)
+            for neighbor_id, score in sorted(co_occurrences[movie_id].items(), key=_by_score)[:k]]
+
+
+def _bump_version(connection):
+    # only a full rebuild bumps the one version of all the recommendations: bumped by the incremental updates,
+    # the row would be written by every favorite change and every user page would change with any of them
+    connection.execute(update(data_versions).where(data_versions.c.scope == "recommendations").values(
+        version=data_versions.c.version + 1, changed_at=int(time.time())))
+
+
+def rebuild_neighbors(connection, k=DEFAULT_NEIGHBORS):
+    """
+    Replace the whole movie_neighbors table by the top k neighbours counted over all the favorites
+    :param connection: sqlalchemy connection in a transaction
+    :param k: INTEGER number of neighbours kept per movie
+    :return: INTEGER number of stored pairs
+    """
+    favorites = connection.execute(select(user_favorites.c.user_id, user_favorites.c.movie_id)).all()
+    neighbors = top_k_neighbors(favorites, k)
+    connection.execute(delete(movie_neighbors))
+    for start in range(0, len(neighbors), INSERT_CHUNK_SIZE):
+        connection.execute(insert(movie_neighbors), [
+            {"movie_id": movie_id, "neighbor_id": neighbor_id, "score": score}
+            for movie_id, neighbor_id, score in neighbors[start:start + INSERT_CHUNK_SIZE]])
+    _bump_version(connection)
+    return len(neighbors)
+
+
+def update_neighbors(connection, user_id, movie_id, k=DEFAULT_NEIGHBORS):
+    """
+    Update the neighbours after user_id added movie_id to the favorites or removed it,
+    only the pairs of movie_id with the other favorites of the user changed
+    :param connection: sqlalchemy connection in the transaction of the change
+    :param user_id: INTEGER
+    :param movie_id: INTEGER
+    :param k: INTEGER number of neighbours kept per movie
+    """
+    fans = select(user_favorites.c.user_id).where(user_favorites.c.movie_id == movie_id)
+    scores = {row.movie_id: row.score for row in connection.execute(
+        select(user_favorites.c.movie_id, func.count().label("score"))
+        .where(user_favorites.c.user_id.in_(fans), user_favorites.c.movie_id != movie_id)
+        .group_by(user_favorites.c.movie_id))}
+
+    # the scores of movie_id with every other movie are known, its row is replaced
+    connection.execute(delete(movie_neighbors).where(movie_neighbors.c.movie_id == movie_id))
+    top = sorted(scores.items(), key=_by_score)[:k]
+    if top:
+        connection.execute(insert(movie_neighbors), [
+            {"movie_id": movie_id, "neighbor_id": neighbor_id, "score": score} for neighbor_id, score in top])
+
+    # in the rows of the other favorites of the user, only the pair with movie_id changed
+    others = select(user_favorites.c.movie_id).where(user_favorites.c.user_id == user_id,
+                                                     user_favorites.c.movie_id != movie_id)
+    rows = {other_id: {} for other_id, in connection.execute(others)}
+    for row in connection.execute(select(movie_neighbors).where(movie_neighbors.c.movie_id.in_(others))):
+        rows[row.movie_id][row.neighbor_id] = row.score
+    updated, removed, added, refreshed = [], [], [], []
+    for other_id, neighbors in rows.items():
+        score = scores.get(other_id, 0)
+        pair = {"row_id": other_id, "pair_id": movie_id, "score": score}
+        if movie_id in neighbors and score < neighbors[movie_id] and len(neighbors) >= k:
+            # a full row losing a pair, or keeping it with a lower score, may now leave out a better
+            # neighbour than the pair: only counting the row again finds it
+            refreshed.append(other_id)
+        elif movie_id in neighbors and score:
+            updated.append(pair)
+        elif movie_id in neighbors:
+            removed.append({"row_id": other_id, "pair_id": movie_id})
+        elif score and len(neighbors) < k:
+            added.append(pair)
+        elif score and neighbors:
+            weakest = max(neighbors.items(), key=_by_score)
+            if _by_score((movie_id, score)) < _by_score(weakest):
+                removed.append({"row_id": other_id, "pair_id": weakest[0]})
+                added.append(pair)
+    pair_condition = (movie_neighbors.c.movie_id == bindparam("row_id")) & \
+                     (movie_neighbors.c.neighbor_id == bindparam("pair_id"))
+    if updated:
+        connection.execute(update(movie_neighbors).where(pair_condition).values(score=bindparam("score")), updated)
+    if removed:
+        connection.execute(delete(movie_neighbors).where(pair_condition), removed)
+    if added:
+        connection.execute(insert(movie_neighbors), [
+            {"movie_id": pair["row_id"], "neighbor_id": pair["pair_id"], "score": pair["score"]} for pair in added])
+    refresh_neighbors(connection, refreshed, k)
+
+
+def refresh_neighbors(connection, movie_ids, k=DEFAULT_NEIGHBORS):
+    """
+    Count the neighbours of movie_ids again, after the favorites of whole users or movies were deleted at once
+    :param connection: sqlalchemy connection in the transaction of the change
+    :param movie_ids: ids of the movies whose rows are replaced, e.g. the favorites of the deleted users
+    :param k: INTEGER number of neighbours kept per movie
+    """
+    movie_ids = sorted(set(movie_ids))
+    if not movie_ids:
+        return
+    other = user_favorites.alias("other")
+    for start in range(0, len(movie_ids), REFRESH_CHUNK_SIZE):
+        chunk = movie_ids[start:start + REFRESH_CHUNK_SIZE]
+        scores = defaultdict(dict)
+        for row in connection.execute(
+                select(user_favorites.c.movie_id, other.c.movie_id.label("neighbor_id"), func.count().label("score"))
+                .join(other, and_(other.c.user_id == user_favorites.c.user_id,
+                                  other.c.movie_id != user_favorites.c.movie_id))
+                .where(user_favorites.c.movie_id.in_(chunk))
+                .group_by(user_favorites.c.movie_id, other.c.movie_id)):
+            scores[row.movie_id][row.neighbor_id] = row.score
+        connection.execute(delete(movie_neighbors).where(movie_neighbors.c.movie_id.in_(chunk)))
+        rows = [{"movie_id": movie_id, "neighbor_id": neighbor_id, "score": score}
+                for movie_id in chunk
+                for neighbor_id, score in sorted(scores[movie_id].items(), key=_by_score)[:k]]
+        if rows:
+            connection.execute(insert(movie_neighbors), rows)
+
+
+def user_recommendations(connection, user_id, limit=10):
+    """
+    :param connection: sqlalchemy connection
+    :param user_id: INTEGER
+    :param limit: INTEGER maximum number of recommended movies
+    :return: list of Movie records the neighbours of the user's favorites, by decreasing total score,
+    the user's own favorites excluded
+    """
+    favorites = select(user_favorites.c.movie_id).where(user_favorites.c.user_id == user_id)
+    score = func.sum(movie_neighbors.c.score)
+    query = select(movies.c.id, movies.c.name, movies.c.year, movies.c.rating, movies.c.director) \
+        .join(movie_neighbors, movie_neighbors.c.neighbor_id == movies.c.id) \
+        .where(movie_neighbors.c.movie_id.in_(favorites), movie_neighbors.c.neighbor_id.not_in(favorites)) \
+        .group_by(movies.c.id, movies.c.name, movies.c.year, movies.c.rating, movies.c.director) \
+        .order_by(score.desc(), movies.c.id).limit(limit)
+    return [movie_from_row(row) for row in connection.execute(query)]
+
+
+def get_version(connection):
+    """
+    :return: tuple (version, changed_at) of the recommendations, None when unknown
+    """
+    row = connection.execute(select(data_versions.c.version, data_versions.c.changed_at)
+                             .where(data_versions.c.scope == "recommendations")).fetchone()
+    return (row.version, row.changed_at) if row is not None else None
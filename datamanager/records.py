@@ -0,0 +1,45 @@
+from typing import NamedTuple, Optional
+
+
+class Movie(NamedTuple):
+    """
+    A movie as returned by the read methods of the data managers.
+    The fields are in the order of the export columns, the year is an int and the rating a float,
+    either is None while the movie details are pending.
+    """
+    id: int
+    name: str
+    year: Optional[int]
+    rating: Optional[float]
+    director: Optional[str]
+
+
+def parse_year(value):
+    # OMDB and spreadsheets give years like "1997", "2010–2013" or "N/A"
+    try:
+        return int(str(value).strip()[:4])
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rating(value):
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if 0 <= rating <= 10 else None
+
+
+def movie_from_row(row):
+    """
+    :param row: database row with the id, name, year, rating and director columns
+    :return: a Movie
+    """
+    # sqlite gives a DECIMAL back as an int or a float depending on the stored value
+    # and older rows may hold the year or the rating as text
+    year, rating = row.year, row.rating
+    if type(year) is not int:
+        year = parse_year(year)
+    if type(rating) is not float:
+        rating = parse_rating(rating)
+    return Movie(row.id, row.name, year, rating, row.director)
@@ -0,0 +1,55 @@
+import itertools
+import threading
+import time
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine of a read: the read replicas in turn, or the primary for a while after a write
+    so that a client reads its own writes despite the replication lag.
+    The stickiness is tracked per thread, pin_primary carries it over from one request to the next.
+    """
+
+    def __init__(self, primary_engine, replica_engines=(), sticky_seconds=2.0):
+        """
+        :param primary_engine: sqlalchemy engine receiving the writes
+        :param replica_engines: sqlalchemy engines of the read replicas, reads go to the primary without any
+        :param sticky_seconds: seconds the reads of a thread stay on the primary after it wrote
+        """
+        self.primary = primary_engine
+        self.replicas = list(replica_engines)
+        self._sticky_seconds = sticky_seconds
+        self._next_replica = itertools.cycle(self.replicas) if self.replicas else None
+        self._local = threading.local()
+
+    def read_engine(self):
+        """
+        :return: the engine the next read of the current thread goes to
+        """
+        if self._next_replica is None or time.time() < getattr(self._local, "primary_until", 0):
+            return self.primary
+        return next(self._next_replica)
+
+    def mark_write(self):
+        """
+        Send the reads of the current thread to the primary for the next sticky_seconds
+        """
+        if self.replicas:
+            self._local.primary_until = time.time() + self._sticky_seconds
+
+    def pin_primary(self, until):
+        """
+        Replace the stickiness of the current thread, e.g. by the one of the client of a new request
+        :param until: epoch timestamp until which the reads go to the primary, 0 for none
+        """
+        self._local.primary_until = until
+
+    def primary_until(self):
+        """
+        :return: epoch timestamp until which the reads of the current thread go to the primary
+        """
+        return getattr(self._local, "primary_until", 0)
+
+    def dispose(self):
+        for engine in self.replicas:
+            engine.dispose()
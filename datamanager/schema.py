@@ -0,0 +1,369 @@
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# count of the favorites of existing users and movies into the empty stats tables of datamanager.stats
+STATS_COUNTS = [
+    """
+    INSERT INTO movie_stats (movie_id, favorites)
+    SELECT movie_id, COUNT(*) FROM user_favorites
+    WHERE movie_id IN (SELECT id FROM movies) AND user_id IN (SELECT id FROM users) GROUP BY movie_id
+    """,
+    """
+    INSERT INTO user_stats (user_id, favorites)
+    SELECT user_id, COUNT(*) FROM user_favorites
+    WHERE movie_id IN (SELECT id FROM movies) AND user_id IN (SELECT id FROM users) GROUP BY user_id
+    """,
+    """
+    INSERT INTO favorites_histogram (kind, bucket, favorites)
+    SELECT 'rating', CAST(movies.rating AS INTEGER), COUNT(*)
+    FROM user_favorites JOIN movies ON movies.id = user_favorites.movie_id
+    WHERE movies.rating IS NOT NULL AND user_favorites.user_id IN (SELECT id FROM users) GROUP BY CAST(movies.rating AS INTEGER)
+    """,
+    """
+    INSERT INTO favorites_histogram (kind, bucket, favorites)
+    SELECT 'decade', CAST(movies.year AS INTEGER) / 10 * 10, COUNT(*)
+    FROM user_favorites JOIN movies ON movies.id = user_favorites.movie_id
+    WHERE movies.year IS NOT NULL AND user_favorites.user_id IN (SELECT id FROM users) GROUP BY CAST(movies.year AS INTEGER) / 10 * 10
+    """,
+]
+
+# Every migration is a (version, description, statements) tuple.
+# Migrations are applied in order and only once, the applied versions are recorded
+# in the table schema_migrations. Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    (1, "create users, movies and user_favorites tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(255) UNIQUE NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS movies(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(255) NOT NULL,
+            year INTEGER,
+            rating DECIMAL(3,1) CHECK (rating BETWEEN 0 AND 10),
+            director VARCHAR(255)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_favorites (
+            user_id INTEGER,
+            movie_id INTEGER,
+            PRIMARY KEY (user_id, movie_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (movie_id) REFERENCES movies(id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    (2, "unique (name, director) on movies and index user_favorites by movie", [
+        # older databases may hold the same (name, director) twice,
+        # merge the favorites into the lowest movie id and drop the duplicates
+        """
+        INSERT OR IGNORE INTO user_favorites (user_id, movie_id)
+        SELECT user_favorites.user_id,
+               (SELECT MIN(first.id) FROM movies AS first
+                WHERE first.name = movies.name AND first.director = movies.director)
+        FROM user_favorites JOIN movies ON movies.id = user_favorites.movie_id
+        """,
+        """
+        DELETE FROM user_favorites WHERE movie_id IN (
+            SELECT movies.id FROM movies JOIN movies AS first
+            ON first.name = movies.name AND first.director = movies.director AND first.id < movies.id
+        )
+        """,
+        """
+        DELETE FROM movies WHERE id IN (
+            SELECT movies.id FROM movies JOIN movies AS first
+            ON first.name = movies.name AND first.director = movies.director AND first.id < movies.id
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_movies_name_director ON movies (name, director)",
+        "CREATE INDEX IF NOT EXISTS ix_user_favorites_movie_id ON user_favorites (movie_id)",
+    ]),
+    (3, "full-text index of movie names and directors", [
+        # external content table: the index stores no copy of the movies, the triggers keep it in sync
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            name, director,
+            content='movies', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movies_fts_after_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, name, director) VALUES (new.id, new.name, new.director);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movies_fts_after_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, name, director) VALUES ('delete', old.id, old.name, old.director);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movies_fts_after_update AFTER UPDATE OF name, director ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, name, director) VALUES ('delete', old.id, old.name, old.director);
+            INSERT INTO movies_fts (rowid, name, director) VALUES (new.id, new.name, new.director);
+        END
+        """,
+        "INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')",
+    ]),
+    (4, "versions of the users table and of every user's favorites, for the http validators", [
+        # the triggers bump the versions in the transaction of every write, bulk imports included
+        "ALTER TABLE users ADD COLUMN favorites_version INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN favorites_changed_at INTEGER",
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope VARCHAR(64) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at INTEGER
+        )
+        """,
+        """
+        INSERT INTO data_versions (scope, version, changed_at) VALUES ('users', 0, CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (scope) DO NOTHING
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_version_after_insert AFTER INSERT ON users BEGIN
+            UPDATE data_versions SET version = version + 1, changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE scope = 'users';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_version_after_delete AFTER DELETE ON users BEGIN
+            UPDATE data_versions SET version = version + 1, changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE scope = 'users';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_version_after_update AFTER UPDATE OF name ON users BEGIN
+            UPDATE data_versions SET version = version + 1, changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE scope = 'users';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS favorites_version_after_insert AFTER INSERT ON user_favorites BEGIN
+            UPDATE users SET favorites_version = favorites_version + 1,
+                             favorites_changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE id = new.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS favorites_version_after_delete AFTER DELETE ON user_favorites BEGIN
+            UPDATE users SET favorites_version = favorites_version + 1,
+                             favorites_changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE id = old.user_id;
+        END
+        """,
+        # the favorite lists show the movie details, a changed or deleted movie changes the lists holding it
+        """
+        CREATE TRIGGER IF NOT EXISTS favorites_version_after_movie_update AFTER UPDATE ON movies BEGIN
+            UPDATE users SET favorites_version = favorites_version + 1,
+                             favorites_changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE id IN (SELECT user_id FROM user_favorites WHERE movie_id = new.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS favorites_version_after_movie_delete AFTER DELETE ON movies BEGIN
+            UPDATE users SET favorites_version = favorites_version + 1,
+                             favorites_changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE id IN (SELECT user_id FROM user_favorites WHERE movie_id = old.id);
+        END
+        """,
+    ]),
+    (5, "top neighbours of every movie for the recommendations", [
+        """
+        CREATE TABLE IF NOT EXISTS movie_neighbors (
+            movie_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            PRIMARY KEY (movie_id, neighbor_id)
+        )
+        """,
+        """
+        INSERT INTO data_versions (scope, version, changed_at)
+        VALUES ('recommendations', 0, CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (scope) DO NOTHING
+        """,
+        # first build with the default 20 neighbours, `flask build-recommendations` rebuilds it
+        """
+        INSERT OR IGNORE INTO movie_neighbors (movie_id, neighbor_id, score)
+        SELECT movie_id, neighbor_id, score FROM (
+            SELECT first.movie_id, other.movie_id AS neighbor_id, COUNT(*) AS score,
+                   ROW_NUMBER() OVER (PARTITION BY first.movie_id ORDER BY COUNT(*) DESC, other.movie_id) AS rank
+            FROM user_favorites AS first
+            JOIN user_favorites AS other ON other.user_id = first.user_id AND other.movie_id != first.movie_id
+            GROUP BY first.movie_id, other.movie_id
+        ) WHERE rank <= 20
+        """,
+    ]),
+    (6, "counters of favorites per movie, per user, per rating and per decade", [
+        # the triggers keep the counters in the transaction of every write, `flask rebuild-stats` recounts them
+        """
+        CREATE TABLE IF NOT EXISTS movie_stats (
+            movie_id INTEGER PRIMARY KEY,
+            favorites INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_movie_stats_favorites ON movie_stats (favorites DESC, movie_id)",
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            favorites INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_user_stats_favorites ON user_stats (favorites DESC, user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS favorites_histogram (
+            kind VARCHAR(16) NOT NULL,
+            bucket INTEGER NOT NULL,
+            favorites INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, bucket)
+        )
+        """,
+        *STATS_COUNTS,
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_after_favorite_insert AFTER INSERT ON user_favorites BEGIN
+            INSERT INTO movie_stats (movie_id, favorites) VALUES (new.movie_id, 1)
+            ON CONFLICT (movie_id) DO UPDATE SET favorites = favorites + 1;
+            INSERT INTO user_stats (user_id, favorites) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET favorites = favorites + 1;
+            INSERT INTO favorites_histogram (kind, bucket, favorites)
+            SELECT 'rating', CAST(rating AS INTEGER), 1 FROM movies WHERE id = new.movie_id AND rating IS NOT NULL
+            ON CONFLICT (kind, bucket) DO UPDATE SET favorites = favorites + 1;
+            INSERT INTO favorites_histogram (kind, bucket, favorites)
+            SELECT 'decade', CAST(year AS INTEGER) / 10 * 10, 1 FROM movies WHERE id = new.movie_id AND year IS NOT NULL
+            ON CONFLICT (kind, bucket) DO UPDATE SET favorites = favorites + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_after_favorite_delete AFTER DELETE ON user_favorites BEGIN
+            UPDATE movie_stats SET favorites = favorites - 1 WHERE movie_id = old.movie_id;
+            UPDATE user_stats SET favorites = favorites - 1 WHERE user_id = old.user_id;
+            UPDATE favorites_histogram SET favorites = favorites - 1
+            WHERE (kind = 'rating' AND bucket = (SELECT CAST(rating AS INTEGER) FROM movies WHERE id = old.movie_id))
+               OR (kind = 'decade' AND bucket = (SELECT CAST(year AS INTEGER) / 10 * 10 FROM movies WHERE id = old.movie_id));
+        END
+        """,
+        # a movie moving to another rating or decade takes its favorites along
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_after_movie_update AFTER UPDATE OF rating, year ON movies
+        WHEN EXISTS (SELECT 1 FROM movie_stats WHERE movie_id = new.id AND favorites > 0) BEGIN
+            UPDATE favorites_histogram SET favorites = favorites - (SELECT favorites FROM movie_stats WHERE movie_id = old.id)
+            WHERE (kind = 'rating' AND bucket = CAST(old.rating AS INTEGER))
+               OR (kind = 'decade' AND bucket = CAST(old.year AS INTEGER) / 10 * 10);
+            INSERT INTO favorites_histogram (kind, bucket, favorites)
+            SELECT 'rating', CAST(new.rating AS INTEGER), favorites FROM movie_stats
+            WHERE movie_id = new.id AND new.rating IS NOT NULL
+            ON CONFLICT (kind, bucket) DO UPDATE SET favorites = favorites + excluded.favorites;
+            INSERT INTO favorites_histogram (kind, bucket, favorites)
+            SELECT 'decade', CAST(new.year AS INTEGER) / 10 * 10, favorites FROM movie_stats
+            WHERE movie_id = new.id AND new.year IS NOT NULL
+            ON CONFLICT (kind, bucket) DO UPDATE SET favorites = favorites + excluded.favorites;
+        END
+        """,
+        # before the delete: the histograms still find the rating and year of the movie
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_before_movie_delete BEFORE DELETE ON movies BEGIN
+            UPDATE favorites_histogram
+            SET favorites = favorites - COALESCE((SELECT favorites FROM movie_stats WHERE movie_id = old.id), 0)
+            WHERE (kind = 'rating' AND bucket = CAST(old.rating AS INTEGER))
+               OR (kind = 'decade' AND bucket = CAST(old.year AS INTEGER) / 10 * 10);
+            DELETE FROM movie_stats WHERE movie_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_after_user_delete AFTER DELETE ON users BEGIN
+            DELETE FROM user_stats WHERE user_id = old.id;
+        END
+        """,
+    ]),
+    # the connections now enforce the foreign keys, the deletes made without them left favorites behind
+    (7, "delete the favorites and neighbours of deleted users and movies", [
+        """
+        DELETE FROM user_favorites
+        WHERE user_id NOT IN (SELECT id FROM users) OR movie_id NOT IN (SELECT id FROM movies)
+        """,
+        """
+        DELETE FROM movie_neighbors
+        WHERE movie_id NOT IN (SELECT id FROM movies) OR neighbor_id NOT IN (SELECT id FROM movies)
+        """,
+        # the triggers counted down favorites the stats never counted, count them again
+        "DELETE FROM movie_stats",
+        "DELETE FROM user_stats",
+        "DELETE FROM favorites_histogram",
+        *STATS_COUNTS,
+    ]),
+    # the index of migration 2 sees every NULL director as distinct, movies without a director were never deduplicated
+    (8, "unique (name, director) on movies with an unknown director counted as the empty one", [
+        """
+        INSERT OR IGNORE INTO user_favorites (user_id, movie_id)
+        SELECT user_favorites.user_id,
+               (SELECT MIN(first.id) FROM movies AS first
+                WHERE first.name = movies.name AND COALESCE(first.director, '') = COALESCE(movies.director, ''))
+        FROM user_favorites JOIN movies ON movies.id = user_favorites.movie_id
+        """,
+        """
+        DELETE FROM user_favorites WHERE movie_id IN (
+            SELECT movies.id FROM movies JOIN movies AS first
+            ON first.name = movies.name AND COALESCE(first.director, '') = COALESCE(movies.director, '')
+            AND first.id < movies.id
+        )
+        """,
+        """
+        DELETE FROM movies WHERE id IN (
+            SELECT movies.id FROM movies JOIN movies AS first
+            ON first.name = movies.name AND COALESCE(first.director, '') = COALESCE(movies.director, '')
+            AND first.id < movies.id
+        )
+        """,
+        """
+        DELETE FROM movie_neighbors
+        WHERE movie_id NOT IN (SELECT id FROM movies) OR neighbor_id NOT IN (SELECT id FROM movies)
+        """,
+        "DROP INDEX IF EXISTS ux_movies_name_director",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_movies_name_director ON movies (name, COALESCE(director, ''))",
+    ]),
+]
+
+
+def get_schema_version(connection):
+    """
+    :param connection: an open sqlalchemy connection
+    :return: INTEGER the highest applied migration version, 0 for an empty database
+    """
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    return connection.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def apply_migrations(engine):
+    """
+    Bring the database schema up to date, every pending migration runs in its own transaction
+    :param engine: sqlalchemy engine of the database
+    :return: INTEGER the schema version after the migrations
+    """
+    with engine.begin() as connection:
+        current_version = get_schema_version(connection)
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(
+                text("""INSERT INTO schema_migrations (version, description) VALUES (:version, :description)
+                        ON CONFLICT (version) DO NOTHING"""),
+                {"version": version, "description": description})
+        logger.info("Applied schema migration %s: %s", version, description)
+        current_version = version
+    return current_version
@@ -1,17 +1,141 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from datamanager import recommendations, stats
+from datamanager.engine_profile import create_sqlite_engine, get_engine_profile
 from datamanager.interface_data_mngt import DataManagerInterface
-from sqlalchemy import URL, create_engine, text
+from datamanager.replica_router import ReplicaRouter
+from datamanager.queries import (existing_movie, fetch_keyset_page, movie_params, orphan_movies, search_words,
+                                 unique_movies, user_movies_query)
+from datamanager.records import movie_from_row
+from datamanager.schema import apply_migrations
+from datamanager.tables import movie_neighbors, movies, user_favorites, users
+from sqlalchemy import URL, bindparam, delete, or_, select, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# ids per DELETE ... WHERE id IN (...) statement, below the limit of bound parameters of sqlite
+DELETE_CHUNK_SIZE = 500
 
 
 class SQLiteDataManager(DataManagerInterface):
-    def __init__(self, db_file_name):
+    def __init__(self, db_file_name, profile=None, replica_files=(), read_only_pool=False, sticky_seconds=2.0,
+                 recommendation_neighbors=recommendations.DEFAULT_NEIGHBORS):
+        """
+        :param db_file_name: path of the sqlite database file
+        :param profile: engine profile dict from datamanager.engine_profile.get_engine_profile,
+        defaults to the "wal" profile
+        :param replica_files: paths of read replicas of the database file (e.g. kept up to date by litestream),
+        opened read-only
+        :param read_only_pool: True adds a read-only pool of the database file itself to the read replicas,
+        the writer pool then only serves writes and the reads right after them
+        :param sticky_seconds: seconds the reads of a thread stay on the writer after it wrote
+        :param recommendation_neighbors: INTEGER neighbours kept per movie for the recommendations
+        """
+        self._recommendation_neighbors = recommendation_neighbors
         try:
             self._url_obj = URL.create(
                 drivername="sqlite",
                 database=db_file_name
             )
-            self._engine = create_engine(self._url_obj)
+            profile = profile or get_engine_profile()
+            self._engine = create_sqlite_engine(self._url_obj, profile)
+            apply_migrations(self._engine)
+            replica_files = ([db_file_name] if read_only_pool else []) + list(replica_files)
+            replica_engines = [create_sqlite_engine(self._read_only_url(file_name), self._read_only_profile(profile))
+                               for file_name in replica_files]
+            self._replica_router = ReplicaRouter(self._engine, replica_engines, sticky_seconds)
         except Exception as err:
-            print("Cannot initiate SQLiteDataManager" + str(err))
+            logger.error("Cannot initiate SQLiteDataManager: %s", err)
+        # connection of the unit of work of the current thread
+        self._local = threading.local()
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @property
+    def replica_router(self):
+        return self._replica_router
+
+    @staticmethod
+    def _read_only_url(file_name):
+        return URL.create(drivername="sqlite", database=f"file:{file_name}", query={"mode": "ro", "uri": "true"})
+
+    @staticmethod
+    def _read_only_profile(profile):
+        # a read-only connection can't switch the journal mode nor checkpoint the log
+        read_only_profile = dict(profile, pragmas=dict(profile["pragmas"]))
+        read_only_profile["pragmas"].pop("journal_mode", None)
+        read_only_profile["pragmas"].pop("wal_autocheckpoint", None)
+        return read_only_profile
+
+    @contextmanager
+    def unit_of_work(self, write=False):
+        """
+        Share one connection and one transaction between all the calls made on this data manager
+        in the with block by the current thread. The transaction commits when the block exits and
+        rolls back when it raises, a nested unit of work joins the outer one.
+        :param write: True begins the transaction IMMEDIATE, taking the write lock up front so that
+        a check-then-insert sequence can't be interleaved with another writer
+        :return: context manager yielding the shared connection
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+        with self._engine.connect() as connection:
+            if write:
+                connection.execution_options(sqlite_begin="IMMEDIATE")
+            with connection.begin():
+                self._local.connection = connection
+                try:
+                    yield connection
+                finally:
+                    self._local.connection = None
+
+    @contextmanager
+    def _connect(self):
+        # the connection of the current unit of work, a new pooled connection otherwise
+        # (of a read replica when there are some) whose reads skip the BEGIN/ROLLBACK round trips
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+        with self._replica_router.read_engine().connect() as connection:
+            connection.execution_options(sqlite_begin=None)
+            yield connection
+
+    @contextmanager
+    def _begin(self):
+        # a transaction committed on exit, inside a unit of work a savepoint instead:
+        # a failing write then rolls back alone and the unit of work can go on.
+        # The transaction begins IMMEDIATE: a DEFERRED one reading before it writes can't upgrade
+        # to the write lock while another writer holds it, it fails at once without waiting on busy_timeout
+        self._replica_router.mark_write()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            with connection.begin_nested():
+                yield connection
+            return
+        with self._engine.connect() as connection:
+            connection.execution_options(sqlite_begin="IMMEDIATE")
+            with connection.begin():
+                yield connection
+
+    def checkpoint(self, mode="PASSIVE"):
+        """
+        Copy the content of the write-ahead log back into the database file
+        :param mode: PASSIVE, FULL, RESTART or TRUNCATE (see sqlite's wal_checkpoint pragma)
+        :return: tuple (busy, log_frames, checkpointed_frames) as reported by sqlite
+        """
+        if mode.upper() not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"Invalid checkpoint mode {mode}")
+        with self._engine.connect() as connection:
+            return tuple(connection.execute(text(f"PRAGMA wal_checkpoint({mode.upper()})")).fetchone())
 
     def get_all_users(self):
         """
@@ -20,13 +144,39 @@ class SQLiteDataManager(DataManagerInterface):
         RETURN a LIST of all users in this format:
         [{"name":"John", "id":1}{...}]
         """
-        with self._engine.connect() as connection:
+        with self._connect() as connection:
             result = connection.execute(text("SELECT * FROM users"))
             users_list = []
             for row in result:
                 users_list.append({"name": row.name, "id": row.id})
             return users_list
 
+    def _fetch_keyset_page(self, query, key_column, after_id=None, before_id=None, page_size=50):
+        """
+        Run a keyset paginated query, see datamanager.queries.fetch_keyset_page
+        :param query: select statement without ORDER BY and LIMIT
+        :param key_column: indexed, unique column the pages are ordered by
+        :return: tuple (rows, next_cursor, prev_cursor), a cursor is None when there is no such page
+        """
+        with self._connect() as connection:
+            return fetch_keyset_page(connection, query, key_column, after_id, before_id, page_size)
+
+    def get_users_page(self, after_id=None, before_id=None, page_size=50):
+        """
+        get one page of users ordered by id from the table users of the sqlite database
+        :param after_id: INTEGER cursor, return the users following this user id
+        :param before_id: INTEGER cursor, return the users preceding this user id
+        :param page_size: INTEGER maximum number of users of the page
+        :return:
+        RETURN a tuple (users, next_cursor, prev_cursor) with users in this format:
+        [{"name":"John", "id":1}{...}]
+        and next_cursor/prev_cursor the after_id/before_id of the next/previous page or None
+        """
+        rows, next_cursor, prev_cursor = self._fetch_keyset_page(
+            select(users.c.id, users.c.name), users.c.id, after_id, before_id, page_size)
+        users_list = [{"name": row.name, "id": row.id} for row in rows]
+        return users_list, next_cursor, prev_cursor
+
     def get_user_by_id(self, user_id):
         """
         get the name of a user by user_id from the table users of the sqlite database
@@ -35,103 +185,122 @@ class SQLiteDataManager(DataManagerInterface):
         RETURN empty string "" if fail
         """
         try:
-            with self._engine.connect() as connection:
+            with self._connect() as connection:
                 params = {"user_id": user_id}
                 result = connection.execute(text("SELECT users.name FROM users WHERE users.id = :user_id"), params)
                 return {"name": [row.name for row in result][0], "id": user_id}
         except Exception as err:
-            print("Can not find user:" + str(err))
+            logger.warning("Can not find user %s: %s", user_id, err)
             return ""
 
     def get_movie_by_id(self, movie_id):
         """
-        Check if a
-        movie
-        already
-        exists in the
-        database
+        get a movie by movie_id from the table movies of the sqlite database
         :param movie_id: INTEGER
-        :return
-        movie: {
-               < movie_name>:{
-                            < year_key >: < year_value >,
-                            < rating_key >: < rating_value >,
-                            < director_key >: < director_value >,
-                            }
-                }
-        """
-        query_get_movie_info = text("SELECT * FROM movies WHERE movies.id = :movie_id")
+        :return: the Movie if found, None otherwise
+        """
+        query_get_movie_info = text("SELECT id, name, year, rating, director FROM movies WHERE movies.id = :movie_id")
         try:
-            with self._engine.connect() as connection:
-                params = {"movie_id": movie_id}
-                result = connection.execute(query_get_movie_info, params)
-                movie_dict = {}
-                for row in result:
-                    movie_dict[row.name] = {"year":row.year, "rating":row.rating, "director":row.director, "id":row.id}
-                return movie_dict
+            with self._connect() as connection:
+                row = connection.execute(query_get_movie_info, {"movie_id": movie_id}).fetchone()
         except Exception as err:
-            print("Can not find movie:" + str(err))
-            return ""
+            logger.warning("Can not find movie %s: %s", movie_id, err)
+            return None
+        return movie_from_row(row) if row is not None else None
 
     def get_user_movies(self, user_id):
         """
-        get the movies the user of user_id has chosen
+        get the movies the user of user_id has chosen, ordered by movie id
         :param user_id: INTEGER
-        :return:
-        + A dict of all movies from user_id with the following format:
-        Example:
-            {
-            "Titanic":{"year":1995,
-                    "rating":9.0,
-                    "director":"James Cameron"},
-            "Transformers":{"year":2010,
-                    "rating":8.0,
-                    "director":"Michale Bay"}
-        }
-        + empty dict {} if fail or no match
+        :return: LIST of Movie, empty if fail or no match
         """
-        query_get_movies_from_user_id = text(
-            """SELECT movies.name, movies.year, movies.rating, movies.director, movies.id FROM user_favorites JOIN movies ON movies.id = user_favorites.movie_id WHERE user_favorites.user_id = :user_id;""")
         if isinstance(user_id, int):
-            params = {"user_id": user_id}
-            with self._engine.connect() as connection:
-                # The result will be a list of all movie_ids of the given user_id
-                result = connection.execute(query_get_movies_from_user_id, params)
-                movies_dict = dict()
-                for row in result:
-                    movies_dict[row.name] = {"year": row.year, "rating": row.rating,
-                                             "director": f"{row.director}", "id": row.id}
-                return movies_dict
+            with self._connect() as connection:
+                result = connection.execute(user_movies_query(user_id).order_by(user_favorites.c.movie_id))
+                return [movie_from_row(row) for row in result]
         else:
-            print("invalid user_id!")
-            return {}
+            logger.warning("invalid user_id %r", user_id)
+            return []
+
+    def get_user_movies_page(self, user_id, after_id=None, before_id=None, page_size=50):
+        """
+        get one page of the movies the user of user_id has chosen, ordered by movie id
+        :param user_id: INTEGER
+        :param after_id: INTEGER cursor, return the movies following this movie id
+        :param before_id: INTEGER cursor, return the movies preceding this movie id
+        :param page_size: INTEGER maximum number of movies of the page
+        :return:
+        RETURN a tuple (movies, next_cursor, prev_cursor) with movies a LIST of Movie
+        and next_cursor/prev_cursor the after_id/before_id of the next/previous page or None
+        """
+        # the (user_id, movie_id) primary key of user_favorites serves both the filter and the order
+        rows, next_cursor, prev_cursor = self._fetch_keyset_page(
+            user_movies_query(user_id), user_favorites.c.movie_id, after_id, before_id, page_size)
+        return [movie_from_row(row) for row in rows], next_cursor, prev_cursor
 
     def get_all_movies(self):
         """
         get all movies from table movies of the sqlite database
-        :return: return a DICT of movies with the following structure
-        as example:
-        {
-            "Titanic":{"year":1995,
-                    "rating":9.0,
-                    "director":"James Cameron",
-                    "id": 2
-                    },
-
-            "Transformers":{"year":2010,
-                    "rating":8.0,
-                    "director":"Michale Bay",
-                    "id": 3
-                    }
-        }
+        :return: LIST of Movie ordered by id
         """
-        with self._engine.connect() as connection:
-            result = connection.execute(text("SELECT * FROM movies"))
-            movies_dict = dict()
+        with self._connect() as connection:
+            result = connection.execute(text("SELECT id, name, year, rating, director FROM movies ORDER BY id"))
+            return [movie_from_row(row) for row in result]
+
+    def _stream_rows(self, query, batch_size):
+        # streams are consumed after the call returns, possibly after the unit of work ended,
+        # so they always read on their own connection.
+        # yield_per streams the rows in batches from a server side cursor instead of fetching them all
+        with self._replica_router.read_engine().connect() as connection:
+            result = connection.execution_options(yield_per=batch_size).execute(query)
             for row in result:
-                movies_dict[row.name] = {"year": f"{row.year}", "rating": f"{row.rating}",
-                                         "director": f"{row.director}", "id": f"{row.id}"}
-            return movies_dict
+                yield movie_from_row(row)
+
+    def stream_all_movies(self, batch_size=1000):
+        """
+        Stream every movie of the table movies ordered by id, without loading the table in memory
+        :param batch_size: INTEGER number of rows fetched from the database at a time
+        :return: generator of Movie
+        """
+        query_stream_movies = text("SELECT id, name, year, rating, director FROM movies ORDER BY id")
+        return self._stream_rows(query_stream_movies, batch_size)
+
+    def stream_user_movies(self, user_id, batch_size=1000):
+        """
+        Stream the favorite movies of the user of user_id ordered by movie id
+        :param user_id: INTEGER
+        :param batch_size: INTEGER number of rows fetched from the database at a time
+        :return: generator of Movie
+        """
+        return self._stream_rows(user_movies_query(user_id).order_by(user_favorites.c.movie_id), batch_size)
+
+    def search_movies(self, query, page=1, page_size=20):
+        """
+        Full-text search of movies by name and director, every word of the query matches as a prefix
+        e.g. "chris nol" finds the movies of Christopher Nolan
+        :param query: search string typed by the user
+        :param page: INTEGER number of the page, starting at 1
+        :param page_size: INTEGER maximum number of movies of the page
+        :return: tuple (movies, next_page) with movies a LIST of Movie, the best matching first,
+        and next_page the number of the next page or None
+        """
+        # quote every word so the user's input can't be read as fts5 query syntax
+        words = search_words(query)
+        if not words:
+            return [], None
+        match = " ".join(f'"{word}"*' for word in words)
+        query_search_movies = text("""
+            SELECT movies.id, movies.name, movies.year, movies.rating, movies.director
+            FROM movies_fts JOIN movies ON movies.id = movies_fts.rowid
+            WHERE movies_fts MATCH :match
+            ORDER BY movies_fts.rank LIMIT :limit OFFSET :offset
+        """)
+        page = max(page, 1)
+        params = {"match": match, "limit": page_size + 1, "offset": (page - 1) * page_size}
+        with self._connect() as connection:
+            rows = connection.execute(query_search_movies, params).fetchall()
+        movies_list = [movie_from_row(row) for row in rows[:page_size]]
+        return movies_list, page + 1 if len(rows) > page_size else None
 
     def is_movie_exist(self, movie):
         """
@@ -143,78 +312,119 @@ class SQLiteDataManager(DataManagerInterface):
                                 <director_key>:<director_value>,
                           }
                       }
-        :return:
-            True if yes and found_movie_info with the same format as mentioned in the param section for
-                    parameter "movie"
-            False if no
-            None if invalid use of the function (wrong argument or connection error)
+        :return: tuple (exists, conflicting_movie)
+            (True, None) if the movie exists with the same year and rating
+            (True, Movie) if a movie of the same name and director exists with another year or rating
+            (False, None) if no
+            (None, None) if invalid use of the function (wrong argument)
         """
-        query_check_movie_exist = text("""SELECT * FROM movies WHERE name = :name AND director = :director LIMIT 1""")
-        if isinstance(movie, dict) and movie:
-            try:
-                movie_title_key = list(movie.keys())[0]
-                params = {
-                    "name": movie_title_key,
-                    "rating": movie[movie_title_key]['rating'],
-                    "year": movie[movie_title_key]['year'],
-                    "director": movie[movie_title_key]['director']
-                }
-            except Exception as err:
-                print("Something went wrong when extracting movie info:" + str(err))
-                return None, {}
-            else:
-                # check if the combination of movie's name and director is already in the database
-                with self._engine.connect() as connection:
-                    search_result = connection.execute(query_check_movie_exist, params).fetchone()
-                    if search_result is not None:
-                        search_result = connection.execute(query_check_movie_exist, params)
-                        for row in search_result:
-                            found_movie_info = {
-                                row.name: {"year": row.year, "rating": row.rating, "director": row.director,
-                                           "id": row.id}}
-                        # if there is a match,
-                        # check if "year" and "rating" info of input movie
-                        # match the found_movie from database
-                        if found_movie_info[list(found_movie_info.keys())[0]]["year"] == params["year"] and \
-                                found_movie_info[list(found_movie_info.keys())[0]]["rating"] == params["rating"]:
-                            print("the movie exists in the database")
-                            return True, {}
-                        else:
-                            print(
-                                f"The Movie {params['name']} from director {params['director']} already exists the database!")
-                            print(
-                                "However there are some conflicting information between the input movie and the matched movie in the database")
-                            return True, found_movie_info
-                    else:
-                        return False, {}
-        else:
-            print("""input should be a dict with the following format: Example: {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay"}}
-                        """)
-            return None, {}
+        if not isinstance(movie, dict) or not movie:
+            logger.warning("""input should be a dict with the following format: Example: {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay"}}""")
+            return None, None
+        try:
+            params = movie_params(movie)
+        except Exception as err:
+            logger.warning("Something went wrong when extracting movie info: %s", err)
+            return None, None
+        # check if the combination of movie's name and director is already in the database
+        with self._connect() as connection:
+            exists, found_movie = existing_movie(connection, params)
+        if not exists:
+            return False, None
+        if found_movie is None:
+            logger.debug("the movie exists in the database")
+            return True, None
+        logger.info("The movie %s from director %s already exists in the database "
+                    "with conflicting year or rating", params['name'], params['director'])
+        return True, found_movie
+
+    def get_users_version(self):
+        """
+        The version of the users table, the triggers of the schema bump it on every write of a user
+        :return: tuple (version, changed_at) with changed_at an epoch timestamp in seconds
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                text("SELECT version, changed_at FROM data_versions WHERE scope = 'users'")).fetchone()
+        return (row.version, row.changed_at) if row is not None else (0, None)
+
+    def get_user_favorites_version(self, user_id):
+        """
+        The version of the favorite list of a user, the triggers of the schema bump it on every write
+        of the list or of one of its movies
+        :param user_id: INTEGER
+        :return: tuple (version, changed_at), None if the user doesn't exist
+        """
+        query_get_favorites_version = text(
+            "SELECT favorites_version, favorites_changed_at FROM users WHERE id = :user_id")
+        with self._connect() as connection:
+            row = connection.execute(query_get_favorites_version, {"user_id": user_id}).fetchone()
+        return (row.favorites_version, row.favorites_changed_at) if row is not None else None
+
+    def get_user_recommendations(self, user_id, limit=10):
+        """
+        "Users who liked this also liked": the neighbours of the user's favorites, see datamanager.recommendations
+        :param user_id: INTEGER
+        :param limit: INTEGER maximum number of recommended movies
+        :return: list of Movie records, best recommendation first
+        """
+        with self._connect() as connection:
+            return recommendations.user_recommendations(connection, int(user_id), limit)
+
+    def get_recommendations_version(self):
+        """
+        :return: tuple (version, changed_at) of the recommendations, bumped by every full rebuild of the neighbours
+        """
+        with self._connect() as connection:
+            return recommendations.get_version(connection) or (0, None)
+
+    def get_stats(self, limit=10):
+        """
+        Leaderboards and histograms of the favorites, read from the counters kept by the triggers of the schema
+        :param limit: INTEGER length of the leaderboards
+        :return: dict, see datamanager.stats.get_stats
+        """
+        with self._connect() as connection:
+            return stats.get_stats(connection, limit)
+
+    def rebuild_stats(self):
+        """
+        Recount all the counters of the favorites, in one transaction
+        :return: dict with the number of movies, users and histogram buckets counted
+        """
+        with self._begin() as connection:
+            return stats.rebuild_stats(connection)
+
+    def rebuild_recommendations(self):
+        """
+        Count the neighbours of every movie again over all the favorites, in one transaction
+        :return: INTEGER number of stored (movie, neighbour) pairs
+        """
+        with self._begin() as connection:
+            return recommendations.rebuild_neighbors(connection, self._recommendation_neighbors)
 
     def add_user(self, user):
         """
         :param user: a string of user name
         :return:
         False when add operation fails
-        True when add operation succeeds
+        the INTEGER id of the new user when add operation succeeds
         """
         # SQL Check if the user is already in the sqlite database
         # Since the user's name in the table users is set to UNIQUE in SQL
         # Only add the new username if the name hasn't been taken yet
         try:
-            query = text("INSERT INTO users (name) VALUES (:user)")
+            query = text("INSERT INTO users (name) VALUES (:user) RETURNING id")
             params = {"user": user}
             # add user to the database using parameterised query
-            with self._engine.connect() as connection:
-                connection.execute(query, params)
-                connection.commit()
+            with self._begin() as connection:
+                user_id = connection.execute(query, params).scalar()
         except Exception as err:
-            print("Can not add user into database:" + str(err))
+            logger.warning("Can not add user into database: %s", err)
             return False
         else:
-            print("User added successfully")
-            return True
+            logger.info("User added successfully", extra={"user_name": user})
+            return user_id
 
     def add_movie(self, movie):
         """
@@ -224,36 +434,26 @@ class SQLiteDataManager(DataManagerInterface):
         False when the add operation fails
         True when the add operation succeeds
         """
+        # the UNIQUE (name, director) index turns a duplicate insert into a no-op
         query_add_movie = text(
-            """INSERT INTO movies (name, year, rating, director) VALUES(:name, :year, :rating, :director)""")
-        query_check_movie_exist = text("""SELECT * FROM movies WHERE name = :name AND director = :director LIMIT 1""")
+            """INSERT INTO movies (name, year, rating, director) VALUES(:name, :year, :rating, :director)
+               ON CONFLICT (name, COALESCE(director, '')) DO NOTHING""")
         if isinstance(movie, dict) and movie:
             try:
-                movie_title_key = list(movie.keys())[0]
-                params = {
-                    "name": movie_title_key,
-                    "year": movie[movie_title_key]['year'],
-                    "rating": movie[movie_title_key]['rating'],
-                    "director": movie[movie_title_key]['director']
-                }
+                params = movie_params(movie)
             except Exception as err:
-                print("Something went wrong when extracting movie info:" + str(err))
+                logger.warning("Something went wrong when extracting movie info: %s", err)
                 return False
             else:
-                # check if the movie is already in the database
-                with self._engine.connect() as connection:
-                    search_result = connection.execute(query_check_movie_exist, params).fetchone()
-                    if search_result is not None:
-                        print("Movie is already in the database!")
+                with self._begin() as connection:
+                    result = connection.execute(query_add_movie, params)
+                    if result.rowcount == 0:
+                        logger.info("Movie is already in the database", extra={"movie_name": params["name"]})
                         return False
-                    else:
-                        connection.execute(query_add_movie, params)
-                        connection.commit()
-                        print("Movie added successfully!")
-                        return True
+                    logger.info("Movie added successfully", extra={"movie_name": params["name"]})
+                    return True
         else:
-            print("""input should be a dict with the following format: Example: {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay"}}
-            """)
+            logger.warning("""input should be a dict with the following format: Example: {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay"}}""")
             return False
 
     def add_movie_to_user_favorite(self, user_id: int, movie_id: int):
@@ -264,47 +464,85 @@ class SQLiteDataManager(DataManagerInterface):
             TRUE when operation success
             FALSE when operation fails
         """
-        query_check_user_id = text("SELECT * FROM users WHERE users.id = :user_id LIMIT 1;")
-        query_check_movie_id = text("SELECT * FROM movies WHERE movies.id = :movie_id LIMIT 1;")
-        query_check_userid_movieid_pair = text("SELECT * FROM user_favorites WHERE user_id = :user_id AND movie_id = :movie_id")
-        query_add_user_favorite = text("INSERT INTO user_favorites (user_id, movie_id) VALUES (:user_id, :movie_id);")
+        query_check_user_id = text("SELECT 1 FROM users WHERE users.id = :user_id LIMIT 1;")
+        query_check_movie_id = text("SELECT 1 FROM movies WHERE movies.id = :movie_id LIMIT 1;")
+        # the (user_id, movie_id) primary key turns an already existing pair into a no-op
+        query_add_user_favorite = text("""INSERT INTO user_favorites (user_id, movie_id) VALUES (:user_id, :movie_id)
+                                          ON CONFLICT (user_id, movie_id) DO NOTHING;""")
         params = {
             "user_id": user_id,
             "movie_id": movie_id,
         }
-        # check if user_id and movie_id exists
         try:
-            with self._engine.connect() as connection:
+            with self._begin() as connection:
+                # check if user_id and movie_id exists
                 user_result = connection.execute(query_check_user_id, params).scalar()
                 movie_result = connection.execute(query_check_movie_id, params).scalar()
-                print("user_result: ", user_result)
-                print("movie_result: ", movie_result)
+                if not user_result or not movie_result:
+                    logger.warning("User_id or movie_id or both don't exist! Can't add them to the user favorite list",
+                                   extra=params)
+                    return False
+                result = connection.execute(query_add_user_favorite, params)
+                if result.rowcount:
+                    recommendations.update_neighbors(connection, params["user_id"], params["movie_id"],
+                                                     self._recommendation_neighbors)
         except Exception as err:
-            print("Something is wrong when connection with database: " + str(err))
+            logger.error("Something is wrong when adding user and movie to database: %s", err)
+            return False
         else:
-            # user_result and movie_result not empty (meaning user and movie found)
-            # add them to the user_favorites table
-            if user_result and movie_result:
-                try:
-                    with self._engine.connect() as connection:
-                        #check if user_id and movie_id pair exists in user_favorites table
-                        user_movie_pair_result = connection.execute(query_check_userid_movieid_pair, params).scalar()
-                        #if the pair doesn't exist, add the input user_id and movie_id pair to the user_favorites table
-                        if not user_movie_pair_result:
-                            connection.execute(query_add_user_favorite, params)
-                            connection.commit()
-                        else:
-                            print("the user_id and movie_id pair already exists in user_favorites database")
-                            return False
-                except Exception as err:
-                    print("Something is wrong when adding user and movie to database: " + str(err))
-                    return False
-                else:
-                    print("User and movie added successfully to the user_favorites database")
-                    return True
-            else:
-                print("User_id or movie_id or both don't exist! Can't add them to the user favorite list")
+            if result.rowcount == 0:
+                logger.info("the user_id and movie_id pair already exists in user_favorites database", extra=params)
                 return False
+            logger.info("User and movie added successfully to the user_favorites database", extra=params)
+            return True
+
+    def add_movie_and_link_to_user(self, user_id, movie):
+        """
+        Add a movie to the database (or resolve the already existing movie with the same name and director)
+        and add it to the favorite list of the user, all in one transaction
+        :param user_id: INTEGER
+        :param movie: should be a dict with a following structure as an example:
+        {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay"}}
+        :return:
+        the INTEGER movie_id of the added or resolved movie when the operation succeeds
+        None when the operation fails
+        """
+        query_check_user_id = text("SELECT id FROM users WHERE users.id = :user_id LIMIT 1")
+        query_check_movie_exist = text("""SELECT id FROM movies
+                                          WHERE name = :name AND COALESCE(director, '') = COALESCE(:director, '')
+                                          LIMIT 1""")
+        query_add_movie = text(
+            """INSERT INTO movies (name, year, rating, director) VALUES(:name, :year, :rating, :director)
+               ON CONFLICT (name, COALESCE(director, '')) DO NOTHING RETURNING id""")
+        query_add_user_favorite = text("""INSERT INTO user_favorites (user_id, movie_id) VALUES (:user_id, :movie_id)
+                                          ON CONFLICT (user_id, movie_id) DO NOTHING""")
+        if not isinstance(movie, dict) or not movie:
+            logger.warning("""input should be a dict with the following format: Example: {"movie_name":{"year":1994, "rating":9.8, "director":"Michael Bay"}}""")
+            return None
+        try:
+            params = dict(movie_params(movie), user_id=int(user_id))
+        except Exception as err:
+            logger.warning("Something went wrong when extracting movie info: %s", err)
+            return None
+
+        try:
+            with self._begin() as connection:
+                if connection.execute(query_check_user_id, params).scalar() is None:
+                    logger.warning("The user doesn't exist in the database", extra={"user_id": params["user_id"]})
+                    return None
+                # RETURNING gives no row when the movie already exists, resolve its id then
+                movie_id = connection.execute(query_add_movie, params).scalar()
+                if movie_id is None:
+                    movie_id = connection.execute(query_check_movie_exist, params).scalar()
+                params["movie_id"] = movie_id
+                if connection.execute(query_add_user_favorite, params).rowcount:
+                    recommendations.update_neighbors(connection, params["user_id"], movie_id,
+                                                     self._recommendation_neighbors)
+        except Exception as err:
+            logger.error("Something is wrong when adding movie to user's favorites: %s", err)
+            return None
+        else:
+            return movie_id
 
     def update_movie(self, movie):
         """
@@ -327,84 +565,154 @@ class SQLiteDataManager(DataManagerInterface):
                WHERE movies.id = :movie_id
             """
         )
-        query_check_movie_id = text(
-            """SELECT movies.id FROM movies WHERE movies.name = :name AND movies.director = :director LIMIT 1"""
-        )
 
         if not isinstance(movie, dict) or not movie:
-            print(
+            logger.warning(
                 "Invalid input format. Expected: {'movie_name': {'year': 1994, 'rating': 9.8, 'director': 'Michael Bay', 'id': 2}}")
             return False
 
         try:
-            movie_title_key = list(movie.keys())[0]
-            params = {
-                "name": movie_title_key,
-                "year": movie[movie_title_key]['year'],
-                "rating": movie[movie_title_key]['rating'],
-                "director": movie[movie_title_key]['director'],
-                "movie_id": int(movie[movie_title_key]['id'])
-            }
+            params = movie_params(movie, with_id=True)
+            params["movie_id"] = params.pop("id")
         except Exception as err:
-            print("Error extracting movie info:", err)
+            logger.warning("Error extracting movie info: %s", err)
             return False
 
-        with self._engine.connect() as connection:
+        with self._begin() as connection:
             try:
-                search_result = connection.execute(query_check_movie_id, params).fetchone()
-                search_movie_id = int(search_result[0]) if search_result else None
-
-                if search_movie_id is None:
-                    print("The movie does not exist in the database. Proceeding with update.")
-                    connection.execute(query_update_movie, params)
-                    connection.commit()
-                    return True
-                elif search_movie_id != params['movie_id']:
-                    print(f"Duplicate movie name and director found. Update not allowed. search_movie_id: {search_movie_id}, movie_id: {type(params['movie_id'])}")
-                    return False
-                else:
-                    connection.execute(query_update_movie, params)
-                    connection.commit()
-                    return True
+                result = connection.execute(query_update_movie, params)
+            except IntegrityError as err:
+                # the UNIQUE (name, director) index rejects renaming a movie into another existing one
+                logger.info("Duplicate movie name and director found. Update not allowed. movie_id: %s", params['movie_id'])
+                return False
             except Exception as e:
-                print("Database update error:", e)
+                logger.error("Database update error: %s", e)
                 return False  # Explicitly return False on failure
+            if result.rowcount == 0:
+                logger.info("The movie does not exist in the database", extra={"movie_id": params["movie_id"]})
+                return False
+            return True
+
+    def add_users_bulk(self, user_names):
+        """
+        Add many users in one transaction, names that are already taken are skipped
+        :param user_names: list of user name strings
+        :return: INTEGER number of added users
+        """
+        query_add_users = text("INSERT INTO users (name) VALUES (:name) ON CONFLICT (name) DO NOTHING")
+        params = [{"name": name} for name in dict.fromkeys(user_names)]
+        if not params:
+            return 0
+        with self._begin() as connection:
+            return connection.execute(query_add_users, params).rowcount
+
+    def add_movies_bulk(self, movies):
+        """
+        Add many movies in one transaction, movies with an already existing (name, director) are skipped
+        :param movies: list of dicts with the following format:
+        [{"name":"Titanic", "year":1997, "rating":7.9, "director":"James Cameron"}, {...}]
+        :return: INTEGER number of added movies
+        """
+        query_add_movies = text("""INSERT INTO movies (name, year, rating, director)
+                                   VALUES (:name, :year, :rating, :director)
+                                   ON CONFLICT (name, COALESCE(director, '')) DO NOTHING""")
+        # deduplicate the batch itself on (name, director), the first occurrence wins
+        params = unique_movies(movies)
+        if not params:
+            return 0
+        with self._begin() as connection:
+            return connection.execute(query_add_movies, params).rowcount
+
+    def add_favorites_bulk(self, favorites):
+        """
+        Add many movies to user's favorite lists in one transaction,
+        users and movies are resolved to their ids in bulk by user name and movie (name, director)
+        :param favorites: list of dicts with the following format:
+        [{"user":"John", "name":"Titanic", "director":"James Cameron"}, {...}]
+        :return: tuple (added, unresolved), the number of added favorites and
+        the number of favorites whose user or movie doesn't exist
+        """
+        query_stage_favorites = text("""INSERT INTO import_favorites (user_name, movie_name, director)
+                                        VALUES (:user, :name, :director)""")
+        # WHERE true keeps sqlite from parsing ON CONFLICT as part of the join
+        query_add_favorites = text("""
+            INSERT INTO user_favorites (user_id, movie_id)
+            SELECT DISTINCT users.id, movies.id FROM import_favorites
+            JOIN users ON users.name = import_favorites.user_name
+            JOIN movies ON movies.name = import_favorites.movie_name
+                        AND COALESCE(movies.director, '') = COALESCE(import_favorites.director, '')
+            WHERE true
+            ON CONFLICT (user_id, movie_id) DO NOTHING
+        """)
+        query_count_resolved = text("""
+            SELECT COUNT(*) FROM import_favorites
+            JOIN users ON users.name = import_favorites.user_name
+            JOIN movies ON movies.name = import_favorites.movie_name
+                        AND COALESCE(movies.director, '') = COALESCE(import_favorites.director, '')
+        """)
+        if not favorites:
+            return 0, 0
+        with self._begin() as connection:
+            connection.execute(text("""CREATE TEMP TABLE IF NOT EXISTS import_favorites (
+                                           user_name VARCHAR(255), movie_name VARCHAR(255), director VARCHAR(255))"""))
+            connection.execute(text("DELETE FROM import_favorites"))
+            connection.execute(query_stage_favorites, favorites)
+            resolved = connection.execute(query_count_resolved).scalar()
+            added = connection.execute(query_add_favorites).rowcount
+            connection.execute(text("DELETE FROM import_favorites"))
+        return added, len(favorites) - resolved
 
     def delete_user(self, user_id):
         """
-        Delete an user from database by user_id
+        Delete an user from database by user_id, the user's favorites go with it
         :param user_id: INTEGER
         :return:
             True if delete operation succeeds
             False if delte operation fails
         """
-        query_delete_user = text("""
-            DELETE FROM users WHERE users.id = :user_id
-        """)
-        query_search_user = text("""
-            SELECT name FROM users WHERE users.id = :user_id LIMIT 1
-        """)
         if isinstance(user_id, int):
             params = {"user_id": user_id}
-            with self._engine.connect() as connection:
-                search_result = connection.execute(query_search_user, params).fetchone()
-                if search_result is not None:
-                    # with self._engine.connect() as connection:
-                    connection.execute(query_delete_user, params)
-                    connection.commit()
-                    print("The user was deleted from the database")
-                    return True
-                else:
-                    print("The user doesn't exist in the database")
-                    return False
+            if self.delete_users([user_id]):
+                logger.info("The user was deleted from the database", extra=params)
+                return True
+            else:
+                logger.info("The user doesn't exist in the database", extra=params)
+                return False
+
+    def delete_users(self, user_ids):
+        """
+        Delete many users in one transaction, DELETE_CHUNK_SIZE ids per statement.
+        Their favorites go with them (ON DELETE CASCADE), the triggers count them down in the stats
+        and the neighbours of their favorite movies are counted again
+        :param user_ids: list of INTEGER
+        :return: INTEGER number of deleted users
+        """
+        query_favorite_movies = text("""
+            SELECT DISTINCT movie_id FROM user_favorites WHERE user_id IN :user_ids
+        """).bindparams(bindparam("user_ids", expanding=True))
+        query_delete_users = text("""
+            DELETE FROM users WHERE id IN :user_ids
+        """).bindparams(bindparam("user_ids", expanding=True))
+        user_ids = sorted({int(user_id) for user_id in user_ids})
+        deleted = 0
+        if not user_ids:
+            return deleted
+        with self._begin() as connection:
+            movie_ids = set()
+            for start in range(0, len(user_ids), DELETE_CHUNK_SIZE):
+                params = {"user_ids": user_ids[start:start + DELETE_CHUNK_SIZE]}
+                movie_ids.update(connection.execute(query_favorite_movies, params).scalars())
+                deleted += connection.execute(query_delete_users, params).rowcount
+            recommendations.refresh_neighbors(connection, movie_ids, self._recommendation_neighbors)
+        return deleted
 
     def delete_user_favorite_movie(self, user_id, movie_id):
         """
                 Delete a movie from an user's favorite list from table user_favorites
                 :param user_id: INTEGER, movie_id: INTEGER
                 :return:
-                    True if delete operation succeeds
-                    False if delte operation fails
+                    True if the movie was removed from the user's favorites
+                    False if it was not one of them or the delete operation fails
                 """
         query_delete_user = text("""
                     DELETE FROM user_favorites WHERE user_id = :user_id AND movie_id = :movie_id
@@ -415,47 +723,110 @@ class SQLiteDataManager(DataManagerInterface):
                 "movie_id": movie_id
             }
             try:
-                with self._engine.connect() as connection:
-                    connection.execute(query_delete_user, params)
-                    connection.commit()
+                with self._begin() as connection:
+                    deleted = connection.execute(query_delete_user, params).rowcount
+                    if deleted:
+                        recommendations.update_neighbors(connection, user_id, movie_id,
+                                                         self._recommendation_neighbors)
             except Exception as err:
-                print("Can not delete users from database:" + str(err))
+                logger.error("Can not delete the movie from the user's favorites: %s", err)
                 return False
             else:
-                print("The user was deleted from the database")
+                if not deleted:
+                    logger.info("The movie is not in the user's favorites", extra=params)
+                    return False
+                logger.info("The movie was removed from the user's favorites", extra=params)
                 return True
 
     def delete_movie(self, movie_id):
         """
-        Delete a movie from database by movie_id
+        Delete a movie from database by movie_id, it is removed from every favorite list holding it
         :param movie_id: INTEGER
         :return:
             True if delete operation succeeds
             False if delte operation fails
         """
-        query_delete_movie = text("""
-            DELETE FROM movies WHERE movies.id = :movie_id
-        """)
-        query_search_movie = text("""
-            SELECT name FROM movies WHERE movies.id = :movie_id LIMIT 1
-        """)
         if isinstance(movie_id, int):
             params = {"movie_id": movie_id}
-            with self._engine.connect() as connection:
-                search_result = connection.execute(query_search_movie, params).fetchone()
-                if search_result is not None:
-                    # with self._engine.connect() as connection:
-                    connection.execute(query_delete_movie, params)
-                    connection.commit()
-                    print("The movie was deleted from the database")
-                    return True
-                else:
-                    print("The movie doesn't exist in the database")
-                    return False
+            if self.delete_movies([movie_id]):
+                logger.info("The movie was deleted from the database", extra=params)
+                return True
+            else:
+                logger.info("The movie doesn't exist in the database", extra=params)
+                return False
 
-"""
-data_manager_obj = SQLiteDataManager('movie_sql_db.sqlite')
-data_manager_obj.get_user_movies(2)
+    def delete_movies(self, movie_ids):
+        """
+        Delete many movies in one transaction, DELETE_CHUNK_SIZE ids per statement.
+        They are removed from every favorite list (ON DELETE CASCADE) and from the neighbours of the other movies,
+        the rows of the movies that had them as neighbours are counted again
+        :param movie_ids: list of INTEGER
+        :return: INTEGER number of deleted movies
+        """
+        query_neighbor_of = text("""
+            SELECT DISTINCT movie_id FROM movie_neighbors WHERE neighbor_id IN :movie_ids
+        """).bindparams(bindparam("movie_ids", expanding=True))
+        query_delete_movies = text("""
+            DELETE FROM movies WHERE id IN :movie_ids
+        """).bindparams(bindparam("movie_ids", expanding=True))
+        query_delete_neighbors = text("""
+            DELETE FROM movie_neighbors WHERE movie_id IN :movie_ids OR neighbor_id IN :movie_ids
+        """).bindparams(bindparam("movie_ids", expanding=True))
+        movie_ids = sorted({int(movie_id) for movie_id in movie_ids})
+        deleted = 0
+        if not movie_ids:
+            return deleted
+        with self._begin() as connection:
+            refreshed = set()
+            for start in range(0, len(movie_ids), DELETE_CHUNK_SIZE):
+                params = {"movie_ids": movie_ids[start:start + DELETE_CHUNK_SIZE]}
+                refreshed.update(connection.execute(query_neighbor_of, params).scalars())
+                deleted += connection.execute(query_delete_movies, params).rowcount
+                connection.execute(query_delete_neighbors, params)
+            recommendations.refresh_neighbors(connection, refreshed.difference(movie_ids),
+                                              self._recommendation_neighbors)
+        return deleted
+
+    def delete_orphan_movie(self, movie_id):
+        """
+        Delete a movie only when it is in no user's favorites
+        :param movie_id: INTEGER
+        :return: True if the movie was deleted, False if it is missing or a favorite holds it
+        """
+        movie_id = int(movie_id)
+        with self._begin() as connection:
+            # checked by the delete itself, the triggers remove its stats
+            if not connection.execute(delete(movies).where(movies.c.id == movie_id, orphan_movies())).rowcount:
+                return False
+            connection.execute(delete(movie_neighbors).where(
+                or_(movie_neighbors.c.movie_id == movie_id, movie_neighbors.c.neighbor_id == movie_id)))
+        return True
 
-"""
+    def delete_orphan_movies(self, batch_size=500, pause=0.0):
+        """
+        Delete the movies that are in no user's favorites, batch_size movies per transaction:
+        the other writers wait for one short batch at most. Call it outside of a unit of work
+        :param batch_size: INTEGER movies deleted per transaction
+        :param pause: seconds slept between two batches, leaves the database to the other writers
+        :return: INTEGER number of deleted movies
+        """
+        deleted, after_id = 0, 0
+        while True:
+            # the write lock is taken before the lookup, no favorite can be added to an orphan in between
+            with self.unit_of_work(write=True):
+                movie_ids, batch_deleted = self._delete_orphan_movies_batch(after_id, batch_size)
+            deleted += batch_deleted
+            if len(movie_ids) < batch_size:
+                break
+            after_id = movie_ids[-1]
+            time.sleep(pause)
+        logger.info("Deleted the movies in no user's favorites", extra={"deleted": deleted})
+        return deleted
 
+    def _delete_orphan_movies_batch(self, after_id, batch_size):
+        # one batch of delete_orphan_movies: the orphans after after_id and how many of them were deleted
+        query_orphans = select(movies.c.id).where(movies.c.id > after_id, orphan_movies()) \
+            .order_by(movies.c.id).limit(batch_size)
+        with self._connect() as connection:
+            movie_ids = connection.execute(query_orphans).scalars().all()
+        return movie_ids, self.delete_movies(movie_ids)
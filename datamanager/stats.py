@@ -0,0 +1,86 @@
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, select
+
+from datamanager.records import movie_from_row, parse_rating, parse_year
+from datamanager.tables import favorites_histogram, movie_stats, movies, user_favorites, user_stats, users
+
+# Counters of the favorites: per movie, per user and per rating and decade of the movies.
+# They are kept up to date in the transaction of every favorite added or removed (by the triggers
+# of the sqlite schema, by SQLDataManager otherwise), so the leaderboards read K rows of an index
+# instead of counting user_favorites. rebuild_stats recounts them from scratch.
+
+HISTOGRAM_KINDS = ("rating", "decade")
+INSERT_CHUNK_SIZE = 5000
+
+
+def histogram_buckets(rating, year):
+    """
+    :return: list of the (kind, bucket) of favorites_histogram a movie counts in,
+    the integer part of its rating and its decade, the unknown ones are left out
+    """
+    rating, year = parse_rating(rating), parse_year(year)
+    buckets = []
+    if rating is not None:
+        buckets.append(("rating", int(rating)))
+    if year is not None:
+        buckets.append(("decade", year // 10 * 10))
+    return buckets
+
+
+def get_stats(connection, limit=10):
+    """
+    :param connection: sqlalchemy connection
+    :param limit: INTEGER length of the leaderboards
+    :return: dict with
+    "top_movies": list of {"movie": Movie, "favorites": count}, most favorited first
+    "top_users": list of {"id", "name", "favorites"}, users with the most favorites first
+    "rating" and "decade": lists of {"bucket", "favorites"} by increasing bucket
+    """
+    top_movies = connection.execute(
+        select(movies.c.id, movies.c.name, movies.c.year, movies.c.rating, movies.c.director, movie_stats.c.favorites)
+        .join(movie_stats, movie_stats.c.movie_id == movies.c.id).where(movie_stats.c.favorites > 0)
+        .order_by(movie_stats.c.favorites.desc(), movie_stats.c.movie_id).limit(limit))
+    top_users = connection.execute(
+        select(users.c.id, users.c.name, user_stats.c.favorites)
+        .join(user_stats, user_stats.c.user_id == users.c.id).where(user_stats.c.favorites > 0)
+        .order_by(user_stats.c.favorites.desc(), user_stats.c.user_id).limit(limit))
+    stats = {
+        "top_movies": [{"movie": movie_from_row(row), "favorites": row.favorites} for row in top_movies],
+        "top_users": [{"id": row.id, "name": row.name, "favorites": row.favorites} for row in top_users],
+    }
+    for kind in HISTOGRAM_KINDS:
+        stats[kind] = [{"bucket": row.bucket, "favorites": row.favorites} for row in connection.execute(
+            select(favorites_histogram.c.bucket, favorites_histogram.c.favorites)
+            .where(favorites_histogram.c.kind == kind, favorites_histogram.c.favorites > 0)
+            .order_by(favorites_histogram.c.bucket))]
+    return stats
+
+
+def rebuild_stats(connection):
+    """
+    Replace all the counters by a count of the favorites
+    :param connection: sqlalchemy connection in a transaction
+    :return: dict with the number of movies, users and histogram buckets counted
+    """
+    # favorites left behind by a deleted user or movie aren't counted
+    live = (user_favorites.c.movie_id.in_(select(movies.c.id)), user_favorites.c.user_id.in_(select(users.c.id)))
+    movie_counts = dict(connection.execute(
+        select(user_favorites.c.movie_id, func.count()).where(*live).group_by(user_favorites.c.movie_id)).all())
+    user_counts = dict(connection.execute(
+        select(user_favorites.c.user_id, func.count()).where(*live).group_by(user_favorites.c.user_id)).all())
+    histogram = Counter()
+    for row in connection.execute(select(movies.c.id, movies.c.rating, movies.c.year)
+                                  .where(movies.c.id.in_(movie_counts))):
+        for bucket in histogram_buckets(row.rating, row.year):
+            histogram[bucket] += movie_counts[row.id]
+
+    for table, rows in (
+            (movie_stats, [{"movie_id": key, "favorites": count} for key, count in movie_counts.items()]),
+            (user_stats, [{"user_id": key, "favorites": count} for key, count in user_counts.items()]),
+            (favorites_histogram, [{"kind": kind, "bucket": bucket, "favorites": count}
+                                   for (kind, bucket), count in histogram.items()])):
+        connection.execute(delete(table))
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            connection.execute(insert(table), rows[start:start + INSERT_CHUNK_SIZE])
+    return {"movies": len(movie_counts), "users": len(user_counts), "buckets": len(histogram)}
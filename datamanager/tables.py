@@ -0,0 +1,88 @@
+from sqlalchemy import (CheckConstraint, Column, ForeignKey, Index, Integer, MetaData, Numeric,
+                        PrimaryKeyConstraint, String, Table, func, literal_column)
+
+# Dialect independent description of the schema, used by the SQLDataManager of server databases.
+# It mirrors the sqlite migrations of datamanager.schema, keep both in sync.
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String(255), unique=True, nullable=False),
+    Column("favorites_version", Integer, nullable=False, server_default="0"),
+    Column("favorites_changed_at", Integer),
+)
+
+movies = Table(
+    "movies", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String(255), nullable=False),
+    Column("year", Integer),
+    Column("rating", Numeric(3, 1, asdecimal=False)),
+    Column("director", String(255)),
+    CheckConstraint("rating BETWEEN 0 AND 10", name="ck_movies_rating"),
+)
+# a movie is unique by name and director, an unknown director counts as the empty one:
+# a unique index sees every NULL as a distinct value
+movie_director_key = func.coalesce(movies.c.director, literal_column("''"))
+Index("ux_movies_name_director", movies.c.name, movie_director_key, unique=True)
+
+user_favorites = Table(
+    "user_favorites", metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("movie_id", Integer, ForeignKey("movies.id", ondelete="CASCADE"), nullable=False),
+    PrimaryKeyConstraint("user_id", "movie_id"),
+    Index("ix_user_favorites_movie_id", "movie_id"),
+)
+
+
+# versions of whole tables, e.g. the "users" scope
+data_versions = Table(
+    "data_versions", metadata,
+    Column("scope", String(64), primary_key=True),
+    Column("version", Integer, nullable=False, server_default="0"),
+    Column("changed_at", Integer),
+)
+
+
+# "users who liked this also liked": the top neighbours of every movie by number of users having both as favorites
+movie_neighbors = Table(
+    "movie_neighbors", metadata,
+    Column("movie_id", Integer, nullable=False),
+    Column("neighbor_id", Integer, nullable=False),
+    Column("score", Integer, nullable=False),
+    PrimaryKeyConstraint("movie_id", "neighbor_id"),
+)
+
+
+# counters maintained with every favorite added or removed, see datamanager.stats
+movie_stats = Table(
+    "movie_stats", metadata,
+    Column("movie_id", Integer, primary_key=True, autoincrement=False),
+    Column("favorites", Integer, nullable=False, server_default="0"),
+)
+Index("ix_movie_stats_favorites", movie_stats.c.favorites.desc(), movie_stats.c.movie_id)
+
+user_stats = Table(
+    "user_stats", metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("favorites", Integer, nullable=False, server_default="0"),
+)
+Index("ix_user_stats_favorites", user_stats.c.favorites.desc(), user_stats.c.user_id)
+
+# favorites per rating (the integer part) and per decade of the movie
+favorites_histogram = Table(
+    "favorites_histogram", metadata,
+    Column("kind", String(16), nullable=False),
+    Column("bucket", Integer, nullable=False),
+    Column("favorites", Integer, nullable=False, server_default="0"),
+    PrimaryKeyConstraint("kind", "bucket"),
+)
+
+
+def create_tables(engine):
+    """
+    Create the missing tables and indexes, existing ones are left untouched
+    :param engine: sqlalchemy engine of the database
+    """
+    metadata.create_all(engine, checkfirst=True)
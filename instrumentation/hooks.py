@@ -0,0 +1,59 @@
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from instrumentation.metrics import (DB_QUERIES_PER_REQUEST, DB_QUERY_DURATION, DB_TIME_PER_REQUEST,
+                                     HTTP_REQUEST_DURATION)
+
+
+def instrument_engine(engine):
+    """
+    Time every query run through a sqlalchemy engine,
+    queries run while serving a request are also counted for that request
+    :param engine: sqlalchemy engine
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        words = statement.split(None, 1)
+        DB_QUERY_DURATION.observe(elapsed, statement=words[0].upper() if words else "")
+        if has_request_context() and "db_queries" in g:
+            g.db_queries += 1
+            g.db_time += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # a failed query never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started_at"):
+            connection.info["query_started_at"].pop()
+
+
+def init_app(app):
+    """
+    Time every request of a flask app per endpoint, with the number and duration of its database queries
+    :param app: flask app
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    @app.after_request
+    def observe_request(response):
+        if "request_started_at" not in g:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - g.request_started_at, endpoint=endpoint,
+                                      method=request.method, status=str(response.status_code))
+        DB_QUERIES_PER_REQUEST.observe(g.db_queries, endpoint=endpoint)
+        DB_TIME_PER_REQUEST.observe(g.db_time, endpoint=endpoint)
+        return response
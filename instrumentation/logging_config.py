@@ -0,0 +1,45 @@
+import json
+import logging
+
+# attributes every LogRecord has, anything else was passed through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format log records as one json object per line, the extra={...} fields of a record are included
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level="INFO", log_format="text"):
+    """
+    Configure the root logger of the app
+    :param level: DEBUG, INFO, WARNING, ERROR or OFF to switch logging off
+    :param log_format: "text" for human readable lines or "json" for structured lines
+    """
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    if level.upper() == "OFF":
+        root_logger.addHandler(logging.NullHandler())
+        root_logger.setLevel(logging.CRITICAL + 1)
+        return
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root_logger.addHandler(handler)
+    root_logger.setLevel(level.upper())
@@ -0,0 +1,168 @@
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing counter, one value per combination of label values
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """
+        Replace the value by a total counted elsewhere, e.g. the hits of a cache copied by a collector
+        """
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, set() replaces the value of a combination of label values
+    """
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, with their sum and count
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(upper_bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {state[-1]}"
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text exposition format.
+    Collectors are callables run at every render, they refresh metrics whose value lives elsewhere.
+    REGISTRY holds the metrics of the process, an app keeps the metrics of its own components in a registry of its own.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """
+        :return: all metrics as a string in the Prometheus text exposition format (version 0.0.4)
+        """
+        for collector in list(self._collectors):
+            collector()
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "moviweb_http_request_duration_seconds", "Duration of HTTP requests per endpoint",
+    ("endpoint", "method", "status"))
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "moviweb_db_query_duration_seconds", "Duration of database queries per statement type", ("statement",))
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "moviweb_db_queries_per_request", "Number of database queries run by one HTTP request", ("endpoint",),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34))
+DB_TIME_PER_REQUEST = REGISTRY.histogram(
+    "moviweb_db_time_per_request_seconds", "Time spent in database queries by one HTTP request", ("endpoint",))
+OMDB_REQUEST_DURATION = REGISTRY.histogram(
+    "moviweb_omdb_request_duration_seconds", "Duration of requests to the OMDB api", ("outcome",))
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import httpx
+
+from instrumentation.metrics import OMDB_REQUEST_DURATION
+from omdb.client import OMDB_BASE_URL
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class AsyncOMDBClient:
+    """
+    Asyncio HTTP client of the OMDB api, the counterpart of OMDBClient for the async serving mode.
+    It keeps a pooled keep-alive httpx.AsyncClient with retries and backoff,
+    answers from an optional OMDBCache first and coalesces concurrent lookups of the same title
+    into a single upstream request.
+    """
+
+    def __init__(self, api_key, cache=None, base_url=OMDB_BASE_URL, timeout=2.5,
+                 pool_size=10, max_retries=2, backoff_factor=0.3):
+        """
+        :param api_key: OMDB api key
+        :param cache: optional OMDBCache consulted before and filled after each request
+        :param base_url: url of the OMDB api
+        :param timeout: timeout in seconds of one request
+        :param pool_size: INTEGER maximum number of connections to OMDB
+        :param max_retries: INTEGER retries of a failed connection or a 429/5xx answer
+        :param backoff_factor: backoff factor in seconds between retries
+        """
+        self._api_key = api_key
+        self._cache = cache
+        self._base_url = base_url
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._client = httpx.AsyncClient(
+            timeout=timeout, limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        # lookups being sent, by normalized title. One event loop runs them all, no lock is needed
+        self._in_flight = {}
+
+    async def get_movie_by_title(self, title):
+        """
+        Fetch the details of a movie from OMDB by its title
+        :param title: movie title as typed by the user
+        :return: the OMDB json response as a dict,
+        it has a "Director" key if the movie was found
+        RAISE httpx.HTTPError or ValueError when OMDB can not be reached or answers garbage
+        """
+        # the cache answers from memory, or from a local sqlite table, without waiting on the network.
+        # OMDBCache is synchronous: it runs in a thread so its sqlite reads don't block the event loop
+        if self._cache is not None:
+            response_json = await asyncio.to_thread(self._cache.get, title)
+            if response_json is not None:
+                return response_json
+
+        key = " ".join(title.lower().split())
+        lookup = self._in_flight.get(key)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._fetch(title))
+            self._in_flight[key] = lookup
+            lookup.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # a cancelled request doesn't cancel the lookup the other requests wait for
+        return await asyncio.shield(lookup)
+
+    async def _fetch(self, title):
+        response_json = await self._request(title)
+        if self._cache is not None:
+            await asyncio.to_thread(self._cache.set, title, response_json)
+        return response_json
+
+    async def _request(self, title):
+        params = {"apikey": self._api_key, "t": title}
+        started_at = time.perf_counter()
+        outcome = "error"
+        try:
+            for attempt in range(self._max_retries + 1):
+                try:
+                    response = await self._client.get(self._base_url, params=params)
+                    if response.status_code not in RETRY_STATUSES or attempt == self._max_retries:
+                        break
+                except httpx.TransportError:
+                    if attempt == self._max_retries:
+                        raise
+                await asyncio.sleep(self._backoff_factor * 2 ** attempt)
+            response_json = response.json()
+            outcome = "found" if "Director" in response_json else "not_found"
+            return response_json
+        finally:
+            OMDB_REQUEST_DURATION.observe(time.perf_counter() - started_at, outcome=outcome)
+
+    async def close(self):
+        await self._client.aclose()
@@ -0,0 +1,112 @@
+import json
+import logging
+import time
+
+from sqlalchemy import URL, create_engine, text
+
+from utils.lru_ttl_cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 60 * 60
+
+
+class OMDBCache:
+    """
+    Cache of OMDB title lookups.
+    Results are kept in an in-process LRU cache and in the table omdb_cache
+    of a sqlite database, so they survive a restart of the app.
+    "Movie not found" answers are cached as well but with a shorter time-to-live.
+    """
+
+    def __init__(self, db_file_name, max_size=1024, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        """
+        :param db_file_name: path of the sqlite database holding the persistent cache table
+        :param max_size: INTEGER maximum number of lookups kept in memory
+        :param ttl: time-to-live in seconds of a found movie
+        :param negative_ttl: time-to-live in seconds of a "Movie not found" answer
+        """
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._memory = LRUTTLCache(max_size=max_size)
+        self._engine = create_engine(URL.create(drivername="sqlite", database=db_file_name))
+        with self._engine.connect() as connection:
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS omdb_cache (
+                    title VARCHAR(255) PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """))
+            connection.commit()
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @staticmethod
+    def _key(title):
+        return " ".join(title.lower().split())
+
+    def get(self, title):
+        """
+        :param title: movie title as typed by the user
+        :return:
+        the cached OMDB json response (dict) if found and not expired
+        None otherwise
+        """
+        key = self._key(title)
+        response_json = self._memory.get(key)
+        if response_json is not None:
+            return response_json
+        query_get_response = text("SELECT response, expires_at FROM omdb_cache WHERE title = :title")
+        with self._engine.connect() as connection:
+            row = connection.execute(query_get_response, {"title": key}).fetchone()
+        if row is None:
+            return None
+        remaining_ttl = row.expires_at - time.time()
+        if remaining_ttl <= 0:
+            return None
+        response_json = json.loads(row.response)
+        self._memory.set(key, response_json, ttl=remaining_ttl)
+        return response_json
+
+    def set(self, title, response_json):
+        """
+        Store an OMDB json response, "Movie not found" answers get the negative time-to-live
+        :param title: movie title as typed by the user
+        :param response_json: dict returned by OMDB
+        """
+        # OMDB answers with a "Director" key only when the title was found,
+        # other errors (invalid api key, request limit reached, ...) are not cached
+        if "Director" in response_json:
+            ttl = self._ttl
+        elif response_json.get("Error") == "Movie not found!":
+            ttl = self._negative_ttl
+        else:
+            return
+        key = self._key(title)
+        self._memory.set(key, response_json, ttl=ttl)
+        query_set_response = text("""
+            INSERT INTO omdb_cache (title, response, expires_at) VALUES (:title, :response, :expires_at)
+            ON CONFLICT (title) DO UPDATE SET response = excluded.response, expires_at = excluded.expires_at
+        """)
+        params = {"title": key, "response": json.dumps(response_json), "expires_at": time.time() + ttl}
+        try:
+            with self._engine.connect() as connection:
+                connection.execute(query_set_response, params)
+                connection.commit()
+        except Exception as err:
+            # the in-memory entry is still usable, the persistent copy is best effort
+            logger.warning("Can not persist OMDB cache entry: %s", err)
+
+    def purge_expired(self):
+        """
+        Delete the expired entries from the persistent cache table
+        :return: INTEGER number of deleted entries
+        """
+        with self._engine.connect() as connection:
+            result = connection.execute(text("DELETE FROM omdb_cache WHERE expires_at <= :now"), {"now": time.time()})
+            connection.commit()
+            return result.rowcount
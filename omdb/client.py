@@ -0,0 +1,109 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation.metrics import OMDB_REQUEST_DURATION
+
+OMDB_BASE_URL = "https://www.omdbapi.com/"
+
+
+class _InFlightLookup:
+    """
+    A lookup of one title that is currently being sent to OMDB,
+    other threads asking for the same title wait for its result instead of sending their own request
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response_json = None
+        self.error = None
+
+
+class OMDBClient:
+    """
+    HTTP client of the OMDB api.
+    It keeps a pooled keep-alive requests.Session with retries and backoff,
+    answers from an optional OMDBCache first and coalesces concurrent lookups of the same title
+    into a single upstream request.
+    """
+
+    def __init__(self, api_key, cache=None, base_url=OMDB_BASE_URL, timeout=2.5,
+                 pool_size=10, max_retries=2, backoff_factor=0.3):
+        """
+        :param api_key: OMDB api key
+        :param cache: optional OMDBCache consulted before and filled after each request
+        :param base_url: url of the OMDB api
+        :param timeout: timeout in seconds of one request
+        :param pool_size: INTEGER maximum number of kept-alive connections to OMDB
+        :param max_retries: INTEGER retries of a failed connection or a 429/5xx answer
+        :param backoff_factor: backoff factor in seconds between retries
+        """
+        self._api_key = api_key
+        self._cache = cache
+        self._base_url = base_url
+        self._timeout = timeout
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def get_movie_by_title(self, title):
+        """
+        Fetch the details of a movie from OMDB by its title
+        :param title: movie title as typed by the user
+        :return: the OMDB json response as a dict,
+        it has a "Director" key if the movie was found
+        RAISE requests.RequestException or ValueError when OMDB can not be reached or answers garbage
+        """
+        if self._cache is not None:
+            response_json = self._cache.get(title)
+            if response_json is not None:
+                return response_json
+
+        key = " ".join(title.lower().split())
+        with self._in_flight_lock:
+            lookup = self._in_flight.get(key)
+            is_leader = lookup is None
+            if is_leader:
+                lookup = _InFlightLookup()
+                self._in_flight[key] = lookup
+
+        if not is_leader:
+            lookup.done.wait()
+            if lookup.error is not None:
+                raise lookup.error
+            return lookup.response_json
+
+        try:
+            lookup.response_json = self._request(title)
+            if self._cache is not None:
+                self._cache.set(title, lookup.response_json)
+            return lookup.response_json
+        except Exception as err:
+            lookup.error = err
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+            lookup.done.set()
+
+    def _request(self, title):
+        params = {"apikey": self._api_key, "t": title}
+        started_at = time.perf_counter()
+        outcome = "error"
+        try:
+            response_json = self._session.get(self._base_url, params=params, timeout=self._timeout).json()
+            outcome = "found" if "Director" in response_json else "not_found"
+            return response_json
+        finally:
+            OMDB_REQUEST_DURATION.observe(time.perf_counter() - started_at, outcome=outcome)
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,197 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from datamanager.records import parse_rating, parse_year
+
+logger = logging.getLogger(__name__)
+
+# job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+NOT_FOUND = "not_found"
+FAILED = "failed"
+
+
+class EnrichmentWorker:
+    """
+    Background pool of threads filling in the details of movies that were accepted with pending metadata.
+    Each job fetches the year, rating and director of a title from OMDB (with retries)
+    and updates the movie through the data manager. A job that ends NOT_FOUND or FAILED
+    removes the pending movie from the user's favorites again.
+    The queue of jobs is bounded and the number of concurrent OMDB lookups is limited by the pool size.
+    """
+
+    def __init__(self, omdb_client, data_manager, max_workers=4, max_queue_size=100,
+                 max_retries=3, retry_delay=1.0, max_finished_jobs=1000):
+        """
+        :param omdb_client: an omdb.client.OMDBClient
+        :param data_manager: the DataManagerInterface holding the pending movies
+        :param max_workers: INTEGER number of worker threads, i.e. concurrent OMDB lookups
+        :param max_queue_size: INTEGER maximum number of waiting jobs
+        :param max_retries: INTEGER retries of a job whose OMDB lookup raised
+        :param retry_delay: delay in seconds before the first retry, doubled at every retry
+        :param max_finished_jobs: INTEGER number of finished jobs kept for inspection
+        """
+        self._omdb_client = omdb_client
+        self._data_manager = data_manager
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._max_finished_jobs = max_finished_jobs
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._threads = []
+        self._counters = {QUEUED: 0, RUNNING: 0, DONE: 0, NOT_FOUND: 0, FAILED: 0}
+
+    def _start(self):
+        # the threads are started on the first job so importing the app doesn't spawn them
+        with self._jobs_lock:
+            if self._threads:
+                return
+            for number in range(self._max_workers):
+                thread = threading.Thread(target=self._run, name=f"omdb-enrichment-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def is_full(self):
+        return self._queue.full()
+
+    def submit(self, user_id, movie_id, movie_name):
+        """
+        Queue the enrichment of a pending movie
+        :param user_id: INTEGER user who added the movie to their favorites
+        :param movie_id: INTEGER id of the pending movie
+        :param movie_name: title to look up in OMDB
+        :return: the job id string, None when the queue is full
+        """
+        self._start()
+        job = {"id": uuid.uuid4().hex, "user_id": int(user_id), "movie_id": movie_id, "movie_name": movie_name,
+               "state": QUEUED, "attempts": 0, "error": None, "submitted_at": time.time(), "finished_at": None}
+        with self._jobs_lock:
+            self._jobs[job["id"]] = job
+            self._counters[QUEUED] += 1
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                del self._jobs[job["id"]]
+                self._counters[QUEUED] -= 1
+            return None
+        return job["id"]
+
+    def get_job(self, job_id):
+        """
+        :return: a copy of the job dict, None for an unknown job id
+        """
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def status(self):
+        """
+        :return: dict describing the worker: pool and queue sizes, number of jobs per state
+        and the most recent jobs
+        """
+        with self._jobs_lock:
+            recent_jobs = [dict(job) for job in list(self._jobs.values())[-20:]]
+            counters = dict(self._counters)
+        return {
+            "workers": self._max_workers,
+            "alive_workers": sum(thread.is_alive() for thread in self._threads),
+            "queue_size": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize,
+            "jobs": counters,
+            "recent_jobs": recent_jobs,
+        }
+
+    def _set_state(self, job, state, error=None):
+        with self._jobs_lock:
+            self._counters[job["state"]] -= 1
+            self._counters[state] += 1
+            job["state"] = state
+            job["error"] = error
+            if state in (DONE, NOT_FOUND, FAILED):
+                job["finished_at"] = time.time()
+                # forget the oldest finished jobs
+                while len(self._jobs) > self._max_finished_jobs:
+                    oldest_id, oldest_job = next(iter(self._jobs.items()))
+                    if oldest_job["state"] in (QUEUED, RUNNING):
+                        break
+                    del self._jobs[oldest_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._set_state(job, RUNNING)
+                state, error = self._enrich(job)
+            except Exception as err:
+                state, error = FAILED, str(err)
+            try:
+                # a movie without details would stay pending in the favorites forever
+                if state in (NOT_FOUND, FAILED):
+                    self.drop_pending_movie(job["user_id"], job["movie_id"])
+            except Exception as err:
+                logger.error("Can not remove the pending movie %s: %s", job["movie_id"], err)
+            finally:
+                self._set_state(job, state, error)
+                self._queue.task_done()
+
+    def _fetch(self, job):
+        delay = self._retry_delay
+        while True:
+            job["attempts"] += 1
+            try:
+                return self._omdb_client.get_movie_by_title(job["movie_name"])
+            except Exception:
+                if job["attempts"] > self._max_retries:
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    def drop_pending_movie(self, user_id, movie_id):
+        """
+        Remove a pending movie from the favorites of a user, and from the catalog while its details are still pending
+        and no other user holds it in their favorites: its job may have filled the details meanwhile
+        :param user_id: INTEGER user who added the movie to their favorites
+        :param movie_id: INTEGER id of the pending movie
+        """
+        with self._data_manager.unit_of_work(write=True):
+            self._data_manager.delete_user_favorite_movie(int(user_id), movie_id)
+            movie = self._data_manager.get_movie_by_id(movie_id)
+            if movie is not None and movie.year is None and movie.rating is None and movie.director is None:
+                self._data_manager.delete_orphan_movie(movie_id)
+
+    def _enrich(self, job):
+        """
+        :return: tuple (state, error) of the finished job
+        """
+        try:
+            response_json = self._fetch(job)
+        except Exception as err:
+            return FAILED, "Something went wrong when trying to connect to omdb database: " + str(err)
+        if "Director" not in response_json:
+            return NOT_FOUND, "Movie not found in OMDB database"
+        movie_details = {
+            "year": parse_year(response_json.get("Year")),
+            "rating": parse_rating(response_json.get("imdbRating")),
+            "director": response_json["Director"].lower(),
+        }
+        movie = {job["movie_name"]: dict(movie_details, id=job["movie_id"])}
+        with self._data_manager.unit_of_work(write=True):
+            if self._data_manager.update_movie(movie):
+                return DONE, None
+            # the same (name, director) already exists: favor the existing movie and drop the pending one
+            existing_movie_id = self._data_manager.add_movie_and_link_to_user(
+                job["user_id"], {job["movie_name"]: movie_details})
+            if existing_movie_id is None:
+                return FAILED, "Can not update the pending movie"
+            self.drop_pending_movie(job["user_id"], job["movie_id"])
+        job["movie_id"] = existing_movie_id
+        return DONE, None
@@ -0,0 +1,82 @@
+import pytest
+
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_add_user_returns_its_id(client):
+    response = client.post("/api/v1/users", json={"name": " Alice "})
+    assert response.status_code == 201
+    assert response.get_json() == {"id": response.get_json()["id"], "name": "Alice"}
+    assert client.get(f"/api/v1/users/{response.get_json()['id']}").get_json()["name"] == "Alice"
+    assert client.post("/api/v1/users", json={"name": "Alice"}).status_code == 409
+
+
+def test_delete_favorites_returns_the_removed_ids_only(client):
+    user_id = client.post("/api/v1/users", json={"name": "Alice"}).get_json()["id"]
+    added = client.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [
+        {"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"},
+        {"name": "Ronin", "year": 1998, "rating": 7.2, "director": "john frankenheimer"}]}).get_json()["added"]
+
+    response = client.delete(f"/api/v1/users/{user_id}/favorites", json={"movie_ids": [added[0], added[0], 999]})
+    assert response.get_json() == {"deleted": [added[0]], "skipped": [added[0], 999]}
+    assert [movie["id"] for movie in client.get(f"/api/v1/users/{user_id}/favorites").get_json()["movies"]] == \
+        added[1:]
+
+
+@pytest.mark.parametrize("movie", [
+    {"year": 1995}, {"name": ""}, {"name": "Heat", "year": "abc"}, {"name": "Heat", "rating": 11},
+    {"name": "Heat", "director": ["michael mann"]},
+])
+def test_add_favorites_rejects_invalid_movies(client, movie):
+    user_id = client.post("/api/v1/users", json={"name": "Alice"}).get_json()["id"]
+    response = client.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [{"name": "Ronin"}, movie]})
+    assert response.status_code == 400
+    assert client.get(f"/api/v1/users/{user_id}/favorites").get_json()["movies"] == []
+    assert client.get("/api/v1/movies").get_json()["movies"] == []
+
+
+@pytest.mark.parametrize("body", [
+    {"year": "abc"}, {"year": 1995.5}, {"year": True}, {"year": 1200}, {"year": 12000},
+    {"rating": "high"}, {"rating": -1}, {"rating": 10.5}, {"rating": False},
+    {"name": ""}, {"name": "  "}, {"name": None}, {"name": 3}, {"director": 3}, {"director": ["a"]},
+])
+def test_update_movie_rejects_invalid_fields(client, body):
+    user_id = client.post("/api/v1/users", json={"name": "Alice"}).get_json()["id"]
+    movie_id = client.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [
+        {"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"}]}).get_json()["added"][0]
+
+    response = client.patch(f"/api/v1/movies/{movie_id}", json=body)
+    assert response.status_code == 400
+    assert response.get_json()["status"] == 400
+    assert client.get(f"/api/v1/movies/{movie_id}").get_json() == {
+        "id": movie_id, "name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"}
+
+
+def test_update_movie(client):
+    user_id = client.post("/api/v1/users", json={"name": "Alice"}).get_json()["id"]
+    movie_id = client.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [
+        {"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"}]}).get_json()["added"][0]
+
+    response = client.patch(f"/api/v1/movies/{movie_id}", json={"name": " Heat ", "rating": 8, "director": None})
+    assert response.status_code == 200
+    assert response.get_json() == {"id": movie_id, "name": "Heat", "year": 1995, "rating": 8.0, "director": None}
+    assert client.patch("/api/v1/movies/999", json={"year": 2000}).status_code == 404
+
+
+def test_update_movie_keeps_the_changes_of_another_worker(app, client):
+    user_id = client.post("/api/v1/users", json={"name": "Alice"}).get_json()["id"]
+    movie_id = client.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [
+        {"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"}]}).get_json()["added"][0]
+    assert client.get(f"/api/v1/movies/{movie_id}").get_json()["rating"] == 8.3
+
+    # the movie is in the data cache of the app when another worker changes its rating
+    other_worker = SQLiteDataManager(app.config["SQLITE_DATABASE"])
+    other_worker.update_movie({"Heat": {"year": 1995, "rating": 9.0, "director": "michael mann", "id": movie_id}})
+    other_worker.engine.dispose()
+    assert client.patch(f"/api/v1/movies/{movie_id}", json={"year": 1996}).get_json() == {
+        "id": movie_id, "name": "Heat", "year": 1996, "rating": 9.0, "director": "michael mann"}
@@ -0,0 +1,62 @@
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def two_apps(tmp_path):
+    # two apps of one process on the same database, each with its own data cache and fragment cache
+    config = {"SQLITE_DATABASE": str(tmp_path / "movies.sqlite"), "LOG_LEVEL": "OFF", "DATA_CACHE_TTL": 60,
+              "OMDB_API_KEY": "test", "OMDB_BASE_URL": "http://127.0.0.1:9/"}
+    apps = create_app(config), create_app(config)
+    try:
+        yield apps
+    finally:
+        for app in apps:
+            app.extensions["moviweb"].close()
+
+
+def test_the_apps_are_isolated(two_apps):
+    first, second = two_apps
+    assert first.extensions["moviweb"] is not second.extensions["moviweb"]
+    assert first.extensions["moviweb_metrics"] is not second.extensions["moviweb_metrics"]
+    assert first.extensions["moviweb"].fragment_cache is not second.extensions["moviweb"].fragment_cache
+    # the requests of an app build its components and count in its metrics only
+    first.test_client().get("/users/1")
+    assert first.extensions["moviweb"].is_built("data_manager")
+    assert not second.extensions["moviweb"].is_built("data_manager")
+    assert 'moviweb_data_cache_misses_total{cache="users"} 1' in first.extensions["moviweb_metrics"].render()
+    assert 'cache="users"' not in second.extensions["moviweb_metrics"].render()
+
+
+def test_the_apps_are_coherent(two_apps):
+    first, second = (app.test_client() for app in two_apps)
+    user_id = first.post("/api/v1/users", json={"name": "Alice"}).get_json()["id"]
+    first.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [
+        {"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"}]})
+
+    # both apps cache the page and the list
+    page = second.get(f"/users/{user_id}")
+    assert b"Heat" in page.data
+    assert second.get(f"/api/v1/users/{user_id}/favorites").get_json()["movies"][0]["name"] == "Heat"
+    assert first.get(f"/users/{user_id}").headers["ETag"] == page.headers["ETag"]
+
+    # written through the first app, read through the second
+    movie_id = first.post(f"/api/v1/users/{user_id}/favorites", json={"movies": [
+        {"name": "Ronin", "year": 1998, "rating": 7.2, "director": "john frankenheimer"}]}).get_json()["added"][0]
+    changed = second.get(f"/users/{user_id}", headers={"If-None-Match": page.headers["ETag"]})
+    assert changed.status_code == 200 and b"Ronin" in changed.data
+    assert changed.headers["ETag"] != page.headers["ETag"]
+    assert [movie["name"] for movie in second.get(f"/api/v1/users/{user_id}/favorites").get_json()["movies"]] == \
+        ["Heat", "Ronin"]
+
+    first.patch(f"/api/v1/movies/{movie_id}", json={"year": 1999})
+    assert b"Year: 1999" in second.get(f"/users/{user_id}").data
+    assert second.get(f"/api/v1/users/{user_id}/favorites").get_json()["movies"][1]["year"] == 1999
+
+    users_page = second.get("/users")
+    assert b"Alice" in users_page.data
+    first.post("/api/v1/users", json={"name": "Bob"})
+    changed = second.get("/users", headers={"If-None-Match": users_page.headers["ETag"]})
+    assert changed.status_code == 200 and b"Bob" in changed.data
+    assert [user["name"] for user in second.get("/api/v1/users").get_json()["users"]] == ["Alice", "Bob"]
@@ -0,0 +1,69 @@
+import asyncio
+import importlib
+import sys
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("asgiref")
+pytest.importorskip("aiosqlite")
+httpx = pytest.importorskip("httpx")
+
+
+@pytest.fixture
+def asgi(tmp_path, monkeypatch):
+    """
+    The asgi module, whose apps are made on import from the environment, on an empty sqlite file without OMDB
+    """
+    monkeypatch.setenv("SQLITE_DATABASE", str(tmp_path / "movies.sqlite"))
+    monkeypatch.setenv("LOG_LEVEL", "OFF")
+    monkeypatch.setenv("OMDB_API_KEY", "test")
+    monkeypatch.setenv("OMDB_BASE_URL", "http://127.0.0.1:9/")
+    sys.modules.pop("asgi", None)
+    module = importlib.import_module("asgi")
+    try:
+        yield module
+    finally:
+        module.services.close()
+        sys.modules.pop("asgi", None)
+
+
+def serve(asgi, requests):
+    # the startup and shutdown of the async app wrap the requests, sent through the ASGI application
+    async def scenario():
+        await asgi.start()
+        try:
+            transport = httpx.ASGITransport(app=asgi.application)
+            async with httpx.AsyncClient(transport=transport, base_url="http://moviweb") as client:
+                return await requests(client)
+        finally:
+            await asgi.stop()
+    return asyncio.run(scenario())
+
+
+def test_the_user_page(asgi):
+    async def requests(client):
+        user_id = await asgi.data_manager.add_user("Alice")
+        await asgi.data_manager.add_movie_and_link_to_user(
+            user_id, {"Heat": {"year": 1995, "rating": 8.3, "director": "michael mann"}})
+        page = await client.get(f"/users/{user_id}")
+        assert page.status_code == 200 and "Heat" in page.text
+        not_modified = await client.get(f"/users/{user_id}", headers={"If-None-Match": page.headers["ETag"]})
+        assert not_modified.status_code == 304
+
+    serve(asgi, requests)
+
+
+def test_add_movie(asgi):
+    # the OMDB answer comes from the cache, no request leaves the test
+    asgi.services.omdb_cache.set("Heat", {"Title": "Heat", "Year": "1995", "imdbRating": "8.3",
+                                          "Director": "Michael Mann"})
+
+    async def requests(client):
+        user_id = await asgi.data_manager.add_user("Alice")
+        response = await client.post(f"/users/{user_id}/add_movie", data={"movie_name": "Heat"})
+        assert response.status_code == 302 and response.headers["Location"].endswith(f"/users/{user_id}")
+        movies = await asgi.data_manager.get_user_movies(user_id)
+        assert [movie[1:] for movie in movies] == [("Heat", 1995, 8.3, "michael mann")]
+
+    serve(asgi, requests)
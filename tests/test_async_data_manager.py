@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+import test_data_manager_contract as contract
+from datamanager.async_data_manager import AsyncDataManager
+
+# the DataManagerInterface contract of test_data_manager_contract.py, run on AsyncDataManager over sqlite+aiosqlite.
+# The stream_* exports stay on the sync data managers, test_search_and_streams doesn't apply
+CONTRACT = [contract.test_users_and_their_version, contract.test_keyset_pages,
+            contract.test_movies_are_unique_on_name_and_director, contract.test_favorites_and_their_versions,
+            contract.test_update_movie, contract.test_bulk_writes, contract.test_deletes_cascade_to_the_favorites,
+            contract.test_delete_orphan_movie, contract.test_stats_stay_equal_to_a_rebuild,
+            contract.test_only_a_full_build_bumps_the_recommendations_version]
+
+
+class BlockingDataManager:
+    """
+    Runs every coroutine method of an AsyncDataManager to its end on an event loop of its own,
+    so that the contract tests call it like a sync data manager
+    """
+
+    def __init__(self, data_manager):
+        self._data_manager = data_manager
+        self._loop = asyncio.new_event_loop()
+
+    def __getattr__(self, name):
+        method = getattr(self._data_manager, name)
+
+        def call(*args, **kwargs):
+            return self._loop.run_until_complete(method(*args, **kwargs))
+        return call
+
+    def close(self):
+        self._loop.run_until_complete(self._data_manager.dispose())
+        self._loop.close()
+
+
+@pytest.fixture
+def async_data_manager(tmp_path, recommendation_neighbors):
+    data_manager = BlockingDataManager(AsyncDataManager(f"sqlite+aiosqlite:///{tmp_path / 'movies.sqlite'}",
+                                                        recommendation_neighbors=recommendation_neighbors))
+    data_manager.create_schema()
+    try:
+        yield data_manager
+    finally:
+        data_manager.close()
+
+
+@pytest.mark.parametrize("contract_test", CONTRACT, ids=lambda contract_test: contract_test.__name__)
+def test_contract(async_data_manager, contract_test):
+    contract_test(async_data_manager)
+
+
+@pytest.mark.parametrize("recommendation_neighbors", [2])
+def test_recommendations_stay_equal_to_a_rebuild(async_data_manager):
+    contract.test_recommendations_stay_equal_to_a_rebuild(async_data_manager, seed=61)
+
+
+def test_a_unit_of_work_rolls_back_as_a_whole(tmp_path):
+    async def scenario():
+        data_manager = AsyncDataManager(f"sqlite+aiosqlite:///{tmp_path / 'movies.sqlite'}")
+        await data_manager.create_schema()
+        try:
+            with pytest.raises(RuntimeError):
+                async with data_manager.unit_of_work(write=True):
+                    await data_manager.add_user("Alice")
+                    raise RuntimeError("rolled back")
+            assert await data_manager.get_all_users() == []
+        finally:
+            await data_manager.dispose()
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from omdb.async_client import AsyncOMDBClient
+from omdb.cache import OMDBCache
+
+HEAT = {"Title": "Heat", "Year": "1995", "imdbRating": "8.3", "Director": "Michael Mann"}
+
+
+@pytest.fixture
+def omdb_cache(tmp_path):
+    cache = OMDBCache(str(tmp_path / "omdb.sqlite"))
+    try:
+        yield cache
+    finally:
+        cache.engine.dispose()
+
+
+def lookups(omdb_cache, *titles):
+    # OMDB is unreachable, a title is answered by the cache or raises
+    async def scenario():
+        client = AsyncOMDBClient("test", cache=omdb_cache, base_url="http://127.0.0.1:9/", max_retries=0)
+        try:
+            return await asyncio.gather(*(client.get_movie_by_title(title) for title in titles),
+                                        return_exceptions=True)
+        finally:
+            await client.close()
+    return asyncio.run(scenario())
+
+
+def test_the_cache_answers_first(tmp_path, omdb_cache):
+    omdb_cache.set("Heat", HEAT)
+    # a new cache on the same file has an empty memory, it reads the sqlite table
+    persisted = OMDBCache(str(tmp_path / "omdb.sqlite"))
+    assert lookups(persisted, "heat", " HEAT ") == [HEAT, HEAT]
+    persisted.engine.dispose()
+
+
+def test_a_failed_lookup_is_not_cached(omdb_cache):
+    first, second = lookups(omdb_cache, "Ronin", "ronin")
+    assert isinstance(first, httpx.TransportError) and isinstance(second, httpx.TransportError)
+    assert omdb_cache.get("Ronin") is None
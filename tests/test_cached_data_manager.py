@@ -0,0 +1,68 @@
+import pytest
+
+from datamanager.cached_data_manager import CachedDataManager
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+
+def movie(name):
+    return {name: {"year": 2000, "rating": 7.5, "director": "someone"}}
+
+
+def test_a_favorite_list_is_not_served_past_a_write_of_another_process(tmp_path):
+    # two workers, each with its own cache in front of the same database file
+    db_file = str(tmp_path / "movies.sqlite")
+    worker, other_worker = (CachedDataManager(SQLiteDataManager(db_file), ttl=60),
+                            CachedDataManager(SQLiteDataManager(db_file), ttl=60))
+    worker.add_user("Alice")
+    user_id = worker.get_all_users()[0]["id"]
+    heat = worker.add_movie_and_link_to_user(user_id, movie("Heat"))
+    assert [record.id for record in worker.get_user_movies(user_id)] == [heat]
+    assert [record.id for record in worker.get_user_movies_page(user_id)[0]] == [heat]
+
+    ronin = other_worker.add_movie_and_link_to_user(user_id, movie("Ronin"))
+    assert [record.id for record in worker.get_user_movies(user_id)] == [heat, ronin]
+    assert [record.id for record in worker.get_user_movies_page(user_id)[0]] == [heat, ronin]
+
+    other_worker.update_movie({"Ronin": {"year": 1998, "rating": 7.2, "director": "someone", "id": ronin}})
+    assert worker.get_user_movies(user_id)[1].year == 1998
+
+
+def test_a_list_read_before_a_write_is_not_kept_after_its_invalidation(tmp_path):
+    data_manager = SQLiteDataManager(str(tmp_path / "movies.sqlite"))
+    cached = CachedDataManager(data_manager, ttl=60)
+    data_manager.add_user("Alice")
+    user_id = data_manager.get_all_users()[0]["id"]
+    heat = data_manager.add_movie_and_link_to_user(user_id, movie("Heat"))
+
+    # a reader loads the list, a writer commits and invalidates, then the reader stores what it loaded
+    def load_then_write():
+        movies = data_manager.get_user_movies(user_id)
+        cached.add_movie_and_link_to_user(user_id, movie("Ronin"))
+        return movies
+
+    assert [record.id for record in cached._cached_user_movies(user_id, "all", load_then_write)] == [heat]
+    assert len(cached.get_user_movies(user_id)) == 2
+
+    # kept until the next write
+    loads = []
+    assert len(cached._cached_user_movies(user_id, "all", lambda: loads.append(1))) == 2
+    assert loads == []
+
+
+def test_a_rolled_back_unit_of_work_leaves_nothing_in_the_cache(tmp_path):
+    cached = CachedDataManager(SQLiteDataManager(str(tmp_path / "movies.sqlite")), ttl=60)
+    cached.add_user("Alice")
+    user_id = cached.get_all_users()[0]["id"]
+    heat = cached.add_movie_and_link_to_user(user_id, movie("Heat"))
+
+    with pytest.raises(RuntimeError):
+        with cached.unit_of_work(write=True):
+            cached.update_movie({"Heat": {"year": 1995, "rating": 8.3, "director": "someone", "id": heat}})
+            cached.add_movie_and_link_to_user(user_id, movie("Ronin"))
+            # the transaction reads its uncommitted changes
+            assert cached.get_movie_by_id(heat).year == 1995
+            assert len(cached.get_user_movies(user_id)) == 2
+            raise RuntimeError("rolled back")
+    assert cached.get_movie_by_id(heat).year == 2000
+    assert [record.id for record in cached.get_user_movies(user_id)] == [heat]
+    cached.engine.dispose()
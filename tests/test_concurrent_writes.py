@@ -0,0 +1,53 @@
+import threading
+
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+WRITERS = 8
+WRITES_PER_WRITER = 50
+
+
+def run_writers(write):
+    # every writer thread calls write(writer, index) and collects the calls that failed
+    failures = []
+
+    def writer(number):
+        for index in range(WRITES_PER_WRITER):
+            if not write(number, index):
+                failures.append((number, index))
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failures
+
+
+def test_concurrent_writers_wait_for_the_write_lock(tmp_path):
+    # a write transaction reading before it writes must wait on busy_timeout for the other writers,
+    # a DEFERRED one fails at once with "database is locked" when it upgrades to a write
+    data_manager = SQLiteDataManager(str(tmp_path / "movies.sqlite"))
+    data_manager.add_users_bulk([f"user {number}" for number in range(WRITERS)])
+    user_ids = [user["id"] for user in data_manager.get_all_users()]
+
+    failures = run_writers(lambda number, index: data_manager.add_movie_and_link_to_user(
+        user_ids[number], {f"movie {number}-{index}": {"year": 2000, "rating": 7.5, "director": "someone"}})
+        is not None)
+
+    assert failures == []
+    assert sum(len(data_manager.get_user_movies(user_id)) for user_id in user_ids) == WRITERS * WRITES_PER_WRITER
+
+
+def test_concurrent_favorites_wait_for_the_write_lock(tmp_path):
+    data_manager = SQLiteDataManager(str(tmp_path / "movies.sqlite"))
+    data_manager.add_users_bulk([f"user {number}" for number in range(WRITERS)])
+    data_manager.add_movies_bulk([{"name": f"movie {index}", "year": 2000, "rating": 7.5, "director": "someone"}
+                                  for index in range(WRITES_PER_WRITER)])
+    user_ids = [user["id"] for user in data_manager.get_all_users()]
+    movie_ids = [movie.id for movie in data_manager.get_all_movies()]
+
+    failures = run_writers(lambda number, index: data_manager.add_movie_to_user_favorite(
+        user_ids[number], movie_ids[index]))
+
+    assert failures == []
+    assert data_manager.get_stats(limit=1)["top_users"][0]["favorites"] == WRITES_PER_WRITER
@@ -0,0 +1,249 @@
+import random
+
+import pytest
+
+from datamanager import recommendations
+
+# the DataManagerInterface contract, run on every data manager of the data_manager fixture of conftest.py
+
+
+def movie(name, year=2000, rating=7.5, director="someone", movie_id=None):
+    details = {"year": year, "rating": rating, "director": director}
+    if movie_id is not None:
+        details["id"] = movie_id
+    return {name: details}
+
+
+def user_ids_of(data_manager):
+    return [user["id"] for user in data_manager.get_all_users()]
+
+
+def test_users_and_their_version(data_manager):
+    before = data_manager.get_users_version()
+    alice = data_manager.add_user("Alice")
+    assert data_manager.get_user_by_id(alice) == {"name": "Alice", "id": alice}
+    assert not data_manager.add_user("Alice")
+    assert data_manager.add_users_bulk(["Bob", "Alice", "Carol", "Bob"]) == 2
+    assert data_manager.get_users_version()[0] > before[0]
+
+    users = data_manager.get_all_users()
+    assert [user["name"] for user in users] == ["Alice", "Bob", "Carol"]
+    assert data_manager.get_user_by_id(users[1]["id"]) == users[1]
+    assert data_manager.get_user_by_id(users[-1]["id"] + 1) == ""
+
+
+def test_keyset_pages(data_manager):
+    data_manager.add_users_bulk([f"user {number}" for number in range(7)])
+    user_ids = user_ids_of(data_manager)
+
+    page, next_cursor, prev_cursor = data_manager.get_users_page(page_size=3)
+    assert [user["id"] for user in page] == user_ids[:3] and prev_cursor is None
+    page, next_cursor, prev_cursor = data_manager.get_users_page(after_id=next_cursor, page_size=3)
+    assert [user["id"] for user in page] == user_ids[3:6]
+    page, next_cursor, _ = data_manager.get_users_page(after_id=next_cursor, page_size=3)
+    assert [user["id"] for user in page] == user_ids[6:] and next_cursor is None
+    page, _, prev_cursor = data_manager.get_users_page(before_id=user_ids[3], page_size=2)
+    assert [user["id"] for user in page] == user_ids[1:3] and prev_cursor == user_ids[1]
+
+    movie_ids = [data_manager.add_movie_and_link_to_user(user_ids[0], movie(f"movie {index}")) for index in range(5)]
+    page, next_cursor, _ = data_manager.get_user_movies_page(user_ids[0], page_size=2)
+    assert [movie_record.id for movie_record in page] == movie_ids[:2]
+    page, _, prev_cursor = data_manager.get_user_movies_page(user_ids[0], after_id=next_cursor, page_size=2)
+    assert [movie_record.id for movie_record in page] == movie_ids[2:4] and prev_cursor == movie_ids[2]
+    assert data_manager.get_user_movies_page(user_ids[1]) == ([], None, None)
+
+
+def test_movies_are_unique_on_name_and_director(data_manager):
+    assert data_manager.add_movie(movie("Heat", 1995, 8.3, "michael mann"))
+    assert not data_manager.add_movie(movie("Heat", 1995, 8.3, "michael mann"))
+    assert data_manager.add_movie(movie("Heat", 1986, 6.0, "dick richards"))
+    assert data_manager.add_movie(movie("Unknown", None, None, None))
+    assert not data_manager.add_movie(movie("Unknown", None, None, None))
+    assert not data_manager.add_movie(movie("Unknown", 2001, None, ""))
+    assert len(data_manager.get_all_movies()) == 3
+
+    assert data_manager.is_movie_exist(movie("Heat", 1995, 8.3, "michael mann")) == (True, None)
+    exists, conflicting = data_manager.is_movie_exist(movie("Heat", 1995, 9.0, "michael mann"))
+    assert exists and conflicting.rating == 8.3
+    assert data_manager.is_movie_exist(movie("Unknown", None, None, "")) == (True, None)
+    assert data_manager.is_movie_exist(movie("Ronin", 1998, 7.2, "john frankenheimer")) == (False, None)
+    assert data_manager.is_movie_exist("Heat") == (None, None)
+
+
+def test_favorites_and_their_versions(data_manager):
+    data_manager.add_users_bulk(["Alice", "Bob"])
+    alice, bob = user_ids_of(data_manager)
+    alice_version, bob_version = (data_manager.get_user_favorites_version(alice),
+                                  data_manager.get_user_favorites_version(bob))
+
+    movie_id = data_manager.add_movie_and_link_to_user(alice, movie("Heat", 1995, 8.3, "michael mann"))
+    assert data_manager.add_movie_and_link_to_user(alice, movie("Heat", 1995, 8.3, "michael mann")) == movie_id
+    assert data_manager.add_movie_and_link_to_user(alice + bob, movie("Ronin")) is None
+    assert [movie_record.id for movie_record in data_manager.get_user_movies(alice)] == [movie_id]
+    assert data_manager.get_user_favorites_version(alice)[0] > alice_version[0]
+    assert data_manager.get_user_favorites_version(bob) == bob_version
+
+    assert data_manager.add_movie_to_user_favorite(bob, movie_id)
+    assert not data_manager.add_movie_to_user_favorite(bob, movie_id)
+    assert not data_manager.add_movie_to_user_favorite(bob, movie_id + 1)
+    alice_version, bob_version = (data_manager.get_user_favorites_version(alice),
+                                  data_manager.get_user_favorites_version(bob))
+
+    # a movie is shown in the list of every user holding it
+    assert data_manager.update_movie(movie("Heat", 1995, 8.4, "michael mann", movie_id))
+    assert data_manager.get_user_favorites_version(alice)[0] > alice_version[0]
+    assert data_manager.get_user_favorites_version(bob)[0] > bob_version[0]
+    assert data_manager.get_movie_by_id(movie_id).rating == 8.4
+
+    bob_version = data_manager.get_user_favorites_version(bob)
+    assert data_manager.delete_user_favorite_movie(bob, movie_id)
+    assert not data_manager.delete_user_favorite_movie(bob, movie_id)
+    assert data_manager.get_user_movies(bob) == []
+    assert data_manager.get_user_favorites_version(bob)[0] > bob_version[0]
+    assert data_manager.get_user_favorites_version(alice + bob) is None
+
+
+def test_update_movie(data_manager):
+    data_manager.add_movies_bulk([{"name": "Heat", "year": 1995, "rating": 8.3, "director": "michael mann"},
+                                  {"name": "Ronin", "year": 1998, "rating": 7.2, "director": "john frankenheimer"}])
+    heat, ronin = data_manager.get_all_movies()
+
+    assert data_manager.update_movie(movie("Heat", 1995, 8.0, None, heat.id))
+    assert data_manager.get_movie_by_id(heat.id)[1:] == ("Heat", 1995, 8.0, None)
+    # renamed into another existing movie
+    assert not data_manager.update_movie(movie("Ronin", 1998, 7.2, "john frankenheimer", heat.id))
+    assert not data_manager.update_movie(movie("Collateral", 2004, 7.5, "michael mann", ronin.id + heat.id))
+    assert not data_manager.update_movie(movie("Collateral"))
+    assert data_manager.get_movie_by_id(ronin.id) == ronin
+
+
+def test_bulk_writes(data_manager):
+    assert data_manager.add_users_bulk(["Alice", "Bob"]) == 2
+    assert data_manager.add_movies_bulk([{"name": "Heat", "year": 1995, "rating": 8.3, "director": None},
+                                         {"name": "Heat", "year": 1996, "rating": 8.0, "director": ""},
+                                         {"name": "Ronin", "year": 1998, "rating": 7.2, "director": "frankenheimer"}]) == 2
+    assert data_manager.add_movies_bulk([{"name": "Heat", "year": 1995, "rating": 8.3, "director": None}]) == 0
+    assert [movie_record.year for movie_record in data_manager.get_all_movies()] == [1995, 1998]
+
+    added, unresolved = data_manager.add_favorites_bulk([
+        {"user": "Alice", "name": "Heat", "director": ""},
+        {"user": "Alice", "name": "Heat", "director": None},
+        {"user": "Bob", "name": "Ronin", "director": "frankenheimer"},
+        {"user": "Carol", "name": "Ronin", "director": "frankenheimer"},
+        {"user": "Bob", "name": "Collateral", "director": None},
+    ])
+    assert (added, unresolved) == (2, 2)
+    assert data_manager.add_favorites_bulk([{"user": "Bob", "name": "Ronin", "director": "frankenheimer"}]) == (0, 0)
+    assert data_manager.get_stats()["top_users"] == [
+        {"id": user["id"], "name": user["name"], "favorites": 1} for user in data_manager.get_all_users()]
+
+
+def test_deletes_cascade_to_the_favorites(data_manager):
+    data_manager.add_users_bulk(["Alice", "Bob", "Carol"])
+    alice, bob, carol = user_ids_of(data_manager)
+    heat = data_manager.add_movie_and_link_to_user(alice, movie("Heat"))
+    ronin = data_manager.add_movie_and_link_to_user(bob, movie("Ronin"))
+    data_manager.add_movie_to_user_favorite(bob, heat)
+    data_manager.add_movie_to_user_favorite(carol, ronin)
+    data_manager.add_movie(movie("Collateral"))
+
+    assert data_manager.delete_user(alice)
+    assert not data_manager.delete_user(alice)
+    assert data_manager.delete_movie(heat)
+    assert not data_manager.delete_movie(heat)
+    assert [movie_record.id for movie_record in data_manager.get_user_movies(bob)] == [ronin]
+    assert [movie_record.name for movie_record in data_manager.get_all_movies()] == ["Ronin", "Collateral"]
+
+    assert data_manager.delete_users([bob, carol, alice]) == 2
+    assert data_manager.get_all_users() == []
+    assert data_manager.get_stats()["top_movies"] == []
+    assert data_manager.delete_orphan_movies(batch_size=1) == 2
+    assert data_manager.get_all_movies() == []
+    assert data_manager.delete_movies([ronin]) == 0
+
+
+def test_delete_orphan_movie(data_manager):
+    alice = data_manager.add_user("Alice")
+    heat = data_manager.add_movie_and_link_to_user(alice, movie("Heat", 1995, 8.3, "michael mann"))
+    assert not data_manager.delete_orphan_movie(heat)
+    assert data_manager.delete_user_favorite_movie(alice, heat)
+    assert data_manager.delete_orphan_movie(heat)
+    assert data_manager.get_movie_by_id(heat) is None
+    assert not data_manager.delete_orphan_movie(heat)
+
+
+def test_search_and_streams(data_manager):
+    data_manager.add_user("Alice")
+    alice = user_ids_of(data_manager)[0]
+    heat = data_manager.add_movie_and_link_to_user(alice, movie("Heat", 1995, 8.3, "michael mann"))
+    data_manager.add_movie(movie("Collateral", 2004, 7.5, "michael mann"))
+    data_manager.add_movie(movie("Ronin", 1998, 7.2, "john frankenheimer"))
+
+    found, next_page = data_manager.search_movies("michael mann")
+    assert {movie_record.name for movie_record in found} == {"Heat", "Collateral"} and next_page is None
+    found, next_page = data_manager.search_movies("michael", page_size=1)
+    assert len(found) == 1 and next_page == 2
+    assert data_manager.search_movies("heat mann")[0] == [data_manager.get_movie_by_id(heat)]
+    assert data_manager.search_movies("\"*) OR") == ([], None)
+    assert data_manager.search_movies("") == ([], None)
+
+    assert list(data_manager.stream_all_movies(batch_size=2)) == data_manager.get_all_movies()
+    assert list(data_manager.stream_user_movies(alice)) == data_manager.get_user_movies(alice)
+
+
+def random_writes(data_manager, seed, writes=200):
+    # favorites added and removed, movies updated and deleted, users deleted, in a random order
+    generator = random.Random(seed)
+    data_manager.add_users_bulk([f"user {number}" for number in range(8)])
+    data_manager.add_movies_bulk([{"name": f"movie {index}", "year": 1950 + 5 * index, "rating": index % 10 + 0.5,
+                                   "director": generator.choice(["someone", None])} for index in range(12)])
+    for _ in range(writes):
+        user_ids, movie_ids = user_ids_of(data_manager), [movie_record.id
+                                                          for movie_record in data_manager.get_all_movies()]
+        user_id, movie_id = generator.choice(user_ids), generator.choice(movie_ids)
+        operation = generator.random()
+        if operation < 0.5:
+            data_manager.add_movie_to_user_favorite(user_id, movie_id)
+        elif operation < 0.75:
+            data_manager.delete_user_favorite_movie(user_id, movie_id)
+        elif operation < 0.9:
+            movie_record = data_manager.get_movie_by_id(movie_id)
+            data_manager.update_movie(movie(movie_record.name, generator.choice([None, 1960, 1999]),
+                                            generator.choice([None, 2.5, 9.0]), movie_record.director, movie_id))
+        elif operation < 0.95:
+            data_manager.add_movie_and_link_to_user(user_id, movie(f"movie {generator.randrange(20)}"))
+        elif operation < 0.98 and len(movie_ids) > 4:
+            data_manager.delete_movie(movie_id)
+        elif len(user_ids) > 3:
+            data_manager.delete_user(user_id)
+
+
+def test_stats_stay_equal_to_a_rebuild(data_manager):
+    random_writes(data_manager, seed=16)
+    incremental = data_manager.get_stats(limit=100)
+    assert incremental["top_users"]
+
+    data_manager.rebuild_stats()
+    assert data_manager.get_stats(limit=100) == incremental
+
+
+# with 2 neighbours the rows are full long before the 12 movies of random_writes are all paired
+@pytest.mark.parametrize("recommendation_neighbors", [2, recommendations.DEFAULT_NEIGHBORS])
+@pytest.mark.parametrize("seed", [61, 5, 8, 14, 27])
+def test_recommendations_stay_equal_to_a_rebuild(data_manager, seed):
+    random_writes(data_manager, seed=seed)
+    user_ids = user_ids_of(data_manager)
+    incremental = {user_id: data_manager.get_user_recommendations(user_id, limit=100) for user_id in user_ids}
+    assert any(incremental.values())
+
+    data_manager.rebuild_recommendations()
+    assert {user_id: data_manager.get_user_recommendations(user_id, limit=100) for user_id in user_ids} == incremental
+
+
+def test_only_a_full_build_bumps_the_recommendations_version(data_manager):
+    before = data_manager.get_recommendations_version()
+    random_writes(data_manager, seed=22, writes=50)
+    assert data_manager.get_recommendations_version()[0] == before[0]
+
+    data_manager.rebuild_recommendations()
+    assert data_manager.get_recommendations_version()[0] > before[0]
@@ -0,0 +1,17 @@
+from omdb.enrichment_worker import EnrichmentWorker
+
+
+def test_a_dropped_pending_movie_stays_in_the_favorites_of_the_others(data_manager):
+    worker = EnrichmentWorker(omdb_client=None, data_manager=data_manager)
+    alice, bob = data_manager.add_user("Alice"), data_manager.add_user("Bob")
+    pending = data_manager.add_movie_and_link_to_user(alice, {"Heat": {"year": None, "rating": None, "director": None}})
+    data_manager.add_movie_to_user_favorite(bob, pending)
+
+    worker.drop_pending_movie(alice, pending)
+    assert data_manager.get_user_movies(alice) == []
+    assert [movie.id for movie in data_manager.get_user_movies(bob)] == [pending]
+
+    # the last user holding it takes it out of the catalog
+    worker.drop_pending_movie(bob, pending)
+    assert data_manager.get_user_movies(bob) == []
+    assert data_manager.get_movie_by_id(pending) is None
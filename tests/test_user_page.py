@@ -0,0 +1,51 @@
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+
+def test_the_page_follows_the_writes_of_another_process(app):
+    # another worker writing to the same database file
+    other_worker = SQLiteDataManager(app.config["SQLITE_DATABASE"])
+    user_id = other_worker.add_user("Alice")
+    other_worker.add_movie_and_link_to_user(user_id, {"Heat": {"year": 1995, "rating": 8.3, "director": "mann"}})
+    client = app.test_client()
+
+    first = client.get(f"/users/{user_id}")
+    assert first.status_code == 200 and b"Heat" in first.data
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    other_worker.add_movie_and_link_to_user(user_id, {"Ronin": {"year": 1998, "rating": 7.2, "director": "mann"}})
+    second = client.get(f"/users/{user_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200 and b"Heat" in second.data and b"Ronin" in second.data
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": second.headers["ETag"]}).status_code == 304
+    other_worker.engine.dispose()
+
+
+def test_the_favorite_list_is_rendered_from_the_database(app):
+    other_worker = SQLiteDataManager(app.config["SQLITE_DATABASE"])
+    user_id = other_worker.add_user("Alice")
+    other_worker.engine.dispose()
+    client = app.test_client()
+    client.get(f"/users/{user_id}")
+    client.get(f"/users/{user_id}?per_page=5")
+
+    # the rendered fragments are the cache of the list, it is not kept twice
+    user_movies = app.extensions["moviweb"].data_manager.cache_stats()["user_movies"]
+    assert user_movies["hits"] + user_movies["misses"] == 0
+
+
+def test_the_favorites_of_a_user_leave_the_pages_of_the_others_current(app):
+    other_worker = SQLiteDataManager(app.config["SQLITE_DATABASE"])
+    alice, bob = other_worker.add_user("Alice"), other_worker.add_user("Bob")
+    heat = other_worker.add_movie_and_link_to_user(alice, {"Heat": {"year": 1995, "rating": 8.3, "director": "mann"}})
+    client = app.test_client()
+    alice_page = client.get(f"/users/{alice}")
+
+    other_worker.add_movie_to_user_favorite(bob, heat)
+    other_worker.add_movie_and_link_to_user(bob, {"Ronin": {"year": 1998, "rating": 7.2, "director": "mann"}})
+    assert client.get(f"/users/{alice}", headers={"If-None-Match": alice_page.headers["ETag"]}).status_code == 304
+
+    # a full build changes every page
+    other_worker.rebuild_recommendations()
+    rebuilt = client.get(f"/users/{alice}", headers={"If-None-Match": alice_page.headers["ETag"]})
+    assert rebuilt.status_code == 200 and b"Ronin" in rebuilt.data
+    other_worker.engine.dispose()
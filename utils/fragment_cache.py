@@ -0,0 +1,83 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """
+    A thread safe in-process cache of rendered html fragments with least-recently-used eviction.
+    Its memory is capped: the oldest used fragments are evicted until the cached text fits in max_bytes.
+    Entries never expire, the key must carry the version of the data a fragment was rendered from.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        """
+        :param max_bytes: INTEGER maximum size in bytes of the cached fragments, 0 turns the cache off
+        """
+        self._max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: the cached fragment, None if not found
+        """
+        with self._lock:
+            fragment = self._data.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, key, fragment):
+        """
+        :param key: cache key
+        :param fragment: STRING rendered fragment, it isn't cached when larger than the whole cache
+        """
+        size = sys.getsizeof(fragment)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= sys.getsizeof(previous)
+            self._data[key] = fragment
+            self.bytes += size
+            while self.bytes > self._max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= sys.getsizeof(evicted)
+                self.evictions += 1
+
+    def get_or_render(self, key, render):
+        """
+        :param key: cache key
+        :param render: function without arguments returning the fragment, called on a miss only
+        :return: the cached or freshly rendered fragment
+        """
+        fragment = self.get(key)
+        if fragment is None:
+            fragment = render()
+            self.set(key, fragment)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        :return: dict with the number of hits, misses, evictions, entries and bytes of the cache
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._data), "bytes": self.bytes}
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """
+    A small thread safe in-process cache with least-recently-used eviction
+    and a per entry time-to-live.
+    The cache holds at most max_size entries, the oldest used entry is evicted first.
+    hits and misses count the lookups answered and not answered by the cache.
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        :param max_size: INTEGER maximum number of entries kept in memory
+        :param ttl: default time-to-live in seconds, None means entries never expire
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        :param key: cache key
+        :return:
+        the cached value if found and not expired
+        default otherwise
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param key: cache key
+        :param value: value to store
+        :param ttl: time-to-live in seconds for this entry, falls back to the cache default
+        """
+        ttl = self._ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        :return: dict with the number of hits, misses and entries of the cache
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+    def __len__(self):
+        return len(self._data)
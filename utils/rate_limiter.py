@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket limiting how many calls per second may start.
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: allowed calls per second
+        :param burst: maximum number of calls allowed at once, defaults to rate
+        """
+        self._rate = float(rate)
+        self._capacity = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)